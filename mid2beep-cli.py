@@ -3,32 +3,221 @@ import pyperclip
 import sys
 import argparse
 import os
+import re
+import struct
+import mmap
+import heapq
+import itertools
+import time
+import math
+import bisect
+import select
+import threading
+import concurrent.futures
+import queue
+import io
+import zipfile
+import tarfile
+import posixpath
+import hashlib
+import json
+import socket
+from contextlib import contextmanager
+from mido.midifiles.meta import build_meta_message
+from mido.messages.specs import SPEC_BY_STATUS
 
 
 def note_to_freq(note: int) -> float:
     return 440.0 * 2 ** ((note - 69) / 12)
 
 
-def extract_monophonic_notes(midi_path: str, target_channel: int = 0, merge: int = 0, reverse: int = 0):
-    mid = mido.MidiFile(midi_path)
-    ticks_per_beat = mid.ticks_per_beat
-    default_tempo = 500_000  # µs per beat = 120 BPM
+def open_midi(midi_path):
+    # Accept an already parsed file, so one parse can feed several extractions
+    if isinstance(midi_path, mido.MidiFile):
+        return midi_path
+    if isinstance(midi_path, bytes):
+        # A member read from an archive
+        return mido.MidiFile(file=io.BytesIO(midi_path))
+    return mido.MidiFile(midi_path)
 
-    # Merge all events from all tracks into one timeline
-    events = []
-    for track in mid.tracks:
-        abs_tick = 0
-        for msg in track:
-            abs_tick += msg.time
-            events.append((abs_tick, msg))
 
-    # Sort by absolute time first, then by channel priority
-    if reverse:
-        # Higher channels get priority (processed last, so they override)
-        events.sort(key=lambda x: (x[0], getattr(x[1], 'channel', -1)))
+def parse_position(text):
+    # "12.5" or "12.5s" -> seconds, "16b" -> beats, "4bar" -> bars (all counted from the start of the song)
+    match = re.fullmatch(r"\s*(\d+(?:\.\d*)?|\.\d+)\s*(s|b|bar|bars)?\s*", text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid position '{text}' (use e.g. 12.5, 12.5s, 16b or 4bar)")
+    unit = {None: "s", "s": "s", "b": "b", "bar": "bar", "bars": "bar"}[match.group(2)]
+    return float(match.group(1)), unit
+
+
+def position_to_tick(position, events, ticks_per_beat, tempo_map):
+    value, unit = position
+    if unit == "b":
+        return value * ticks_per_beat
+
+    if unit == "bar":
+        # Walk the time signature changes, 4/4 until the first one
+        signatures = [(0, 4, 4)] + [(t, m.numerator, m.denominator) for t, m in events if m.type == "time_signature"]
+        tick = 0
+        remaining = value
+        for i, (tick, numerator, denominator) in enumerate(signatures):
+            bar_ticks = ticks_per_beat * 4 * numerator / denominator
+            next_tick = signatures[i + 1][0] if i + 1 < len(signatures) else None
+            if next_tick is None or remaining * bar_ticks <= next_tick - tick:
+                return tick + remaining * bar_ticks
+            remaining -= (next_tick - tick) / bar_ticks
+
+    # Seconds: find the tempo in effect at that time
+    i = bisect.bisect_right([seconds for _, seconds, _ in tempo_map], value) - 1
+    tick, seconds, tempo = tempo_map[i]
+    return tick + (value - seconds) * 1e6 / tempo * ticks_per_beat
+
+
+def sort_same_tick(events, key, reverse_ties=False):
+    # A track is already in tick order, only events on the same tick need sorting
+    group = []
+    for event in events:
+        if group and event[0] != group[0][0]:
+            yield from sorted(group[::-1] if reverse_ties else group, key=key)
+            group = []
+        group.append(event)
+    yield from sorted(group[::-1] if reverse_ties else group, key=key)
+
+
+def merge_track_events(tracks, reverse=0, old_logic=False):
+    """Merge lazily decoded tracks into one stream, ordered exactly like the
+    sort in extract_monophonic_notes (or extract_monophonic_notes_old).
+
+    heapq.merge breaks ties by input order, which is what the stable sort
+    over the concatenated tracks does too.
+    """
+    if old_logic:
+        # reverse() then a stable sort on the tick: same-tick events come out back to front
+        key = lambda x: x[0]
+        sources = [sort_same_tick(track, key, True) if reverse else track for track in tracks]
+        if reverse:
+            sources.reverse()
     else:
-        # Lower channels get priority (processed last, so they override)
-        events.sort(key=lambda x: (x[0], -getattr(x[1], 'channel', 999)))
+        if reverse:
+            key = lambda x: (x[0], getattr(x[1], 'channel', -1))
+        else:
+            key = lambda x: (x[0], -getattr(x[1], 'channel', 999))
+        sources = [sort_same_tick(track, key) for track in tracks]
+    return heapq.merge(*sources, key=key)
+
+
+def track_ticks(track):
+    # (abs_tick, msg) of one mido track, lazily
+    abs_tick = 0
+    for msg in track:
+        abs_tick += msg.time
+        yield abs_tick, msg
+
+
+class EventSlice:
+    """The events between two positions (from parse_position), merged lazily
+    from the tracks: merging stops once the end is passed, so the cost of a
+    slice grows with where it ends, not with the length of the song.
+
+    seek() reads up to the start and returns (start_tick, start_time, tempo,
+    active_note), the state the extract loop would have reached there.
+    Iterating then yields the events up to the end. end_time is the end in
+    seconds (None without an end), known once the iteration is done.
+    """
+
+    def __init__(self, mid, start=None, end=None, target_channel=0, merge=0, reverse=0, old_logic=False, default_tempo=500_000):
+        self.events = merge_track_events([track_ticks(track) for track in mid.tracks], reverse, old_logic)
+        self.ticks_per_beat = mid.ticks_per_beat
+        self.start = start
+        self.end = end
+        self.target_channel = target_channel
+        self.merge = merge
+        self.tempo_map = [(0, 0.0, default_tempo)]  # (tick, seconds at that tick, tempo from that tick on)
+        self.signatures = []                         # time_signature events so far, for bar positions
+        self.start_tick = None if start else 0
+        self.end_tick = None
+        self.end_time = None
+        self.candidates = None  # positions with the tempo map so far, None after it changed
+        self.pending = None     # first event of the slice, read by seek()
+
+    def seconds_at(self, tick):
+        t, seconds, tempo = self.tempo_map[bisect.bisect_right([t for t, _, _ in self.tempo_map], tick) - 1]
+        return seconds + mido.tick2second(tick - t, self.ticks_per_beat, tempo)
+
+    def observe(self, abs_tick, msg):
+        if msg.type == "set_tempo":
+            tick, seconds, tempo = self.tempo_map[-1]
+            seconds += mido.tick2second(abs_tick - tick, self.ticks_per_beat, tempo)
+            self.tempo_map.append((abs_tick, seconds, msg.tempo))
+            self.candidates = None
+        elif msg.type == "time_signature":
+            self.signatures.append((abs_tick, msg))
+            self.candidates = None
+
+    def resolve(self, tick):
+        # A position is final once it is at or before the next event's tick: nothing
+        # after it can move it any more (tick None: the song is over)
+        if self.candidates is None:
+            start = math.ceil(position_to_tick(self.start, self.signatures, self.ticks_per_beat, self.tempo_map)) if self.start else 0
+            end = math.floor(position_to_tick(self.end, self.signatures, self.ticks_per_beat, self.tempo_map)) if self.end else None
+            self.candidates = start, end
+        start, end = self.candidates
+        if self.start_tick is None and (tick is None or start <= tick):
+            self.start_tick = start
+        if self.end and self.end_tick is None and (tick is None or end <= tick):
+            if self.start_tick is None or end < self.start_tick:
+                raise ValueError("-end is before -start")
+            self.end_tick = end
+            self.end_time = self.seconds_at(end)
+
+    def seek(self):
+        # The note still playing at the start is the last note_on before it, unless it was released
+        active_note = None
+        for abs_tick, msg in self.events:
+            self.resolve(abs_tick)
+            if self.start_tick is not None and abs_tick >= self.start_tick:
+                self.pending = (abs_tick, msg)
+                break
+            self.observe(abs_tick, msg)
+            if not self.merge and hasattr(msg, "channel") and self.target_channel is not None and msg.channel != self.target_channel:
+                continue
+            if msg.type == "note_on" and msg.velocity > 0:
+                active_note = msg.note
+            elif msg.type in ("note_off", "note_on") and msg.note == active_note:
+                active_note = None
+        else:
+            self.resolve(None)
+
+        ticks = [tick for tick, _, _ in self.tempo_map]
+        tempo = self.tempo_map[bisect.bisect_right(ticks, self.start_tick - 1) - 1][2] if self.start_tick else self.tempo_map[0][2]
+        return self.start_tick, self.seconds_at(self.start_tick), tempo, active_note
+
+    def __iter__(self):
+        if self.pending is None:
+            return  # seek() already read the whole song
+        for abs_tick, msg in itertools.chain([self.pending], self.events):
+            if self.end and self.end_tick is None:
+                self.resolve(abs_tick)
+                self.observe(abs_tick, msg)
+            if self.end_tick is not None and abs_tick > self.end_tick:
+                return
+            yield abs_tick, msg
+        if self.end and self.end_tick is None:
+            self.resolve(None)
+
+
+def sliced_events(mid, start, end, target_channel=0, merge=0, reverse=0, old_logic=False):
+    # What an extract loop needs for a slice: (events, tick, seconds, tempo, active_note)
+    # at the start. The events are an EventSlice, its end_time clips the song once
+    # they are consumed.
+    window = EventSlice(mid, start, end, target_channel, merge, reverse, old_logic)
+    return (window, *window.seek())
+
+
+def extract_monophonic_notes(midi_path: str, target_channel: int = 0, merge: int = 0, reverse: int = 0, stats: dict = None, start=None, end=None):
+    mid = open_midi(midi_path)
+    ticks_per_beat = mid.ticks_per_beat
+    default_tempo = 500_000  # µs per beat = 120 BPM
 
     current_tick = 0
     current_time = 0.0
@@ -40,6 +229,29 @@ def extract_monophonic_notes(midi_path: str, target_channel: int = 0, merge: int
     active_note = None
     active_note_start_time = 0.0
 
+    # Only convert part of the song if asked to, the tracks are merged lazily up to its end
+    window = None
+    if start is not None or end is not None:
+        window, current_tick, current_time, current_tempo, active_note = sliced_events(mid, start, end, target_channel, merge, reverse)
+        last_event_time = active_note_start_time = current_time
+        events = window
+    else:
+        # Merge all events from all tracks into one timeline
+        events = []
+        for track in mid.tracks:
+            abs_tick = 0
+            for msg in track:
+                abs_tick += msg.time
+                events.append((abs_tick, msg))
+
+        # Sort by absolute time first, then by channel priority
+        if reverse:
+            # Higher channels get priority (processed last, so they override)
+            events.sort(key=lambda x: (x[0], getattr(x[1], 'channel', -1)))
+        else:
+            # Lower channels get priority (processed last, so they override)
+            events.sort(key=lambda x: (x[0], -getattr(x[1], 'channel', 999)))
+
     for abs_tick, msg in events:
         delta_ticks = abs_tick - current_tick
         delta_time = mido.tick2second(delta_ticks, ticks_per_beat, current_tempo)
@@ -60,6 +272,8 @@ def extract_monophonic_notes(midi_path: str, target_channel: int = 0, merge: int
 
             # First, stop the currently active note if one is playing
             if active_note is not None:
+                if stats is not None:
+                    stats["cut_notes"] = stats.get("cut_notes", 0) + 1
                 duration = current_time - active_note_start_time
                 if active_note_start_time > last_event_time:
                     delay = active_note_start_time - last_event_time
@@ -82,6 +296,10 @@ def extract_monophonic_notes(midi_path: str, target_channel: int = 0, merge: int
                 last_event_time = current_time
                 active_note = None
 
+    # A sliced song ends at the end position, not at its last event
+    if window is not None and window.end_time is not None:
+        current_time = max(current_time, window.end_time)
+
     # If any note was left hanging, close it at end of track
     if active_note is not None:
         duration = current_time - active_note_start_time
@@ -92,24 +310,11 @@ def extract_monophonic_notes(midi_path: str, target_channel: int = 0, merge: int
 
     return timeline
 
-def extract_monophonic_notes_old(midi_path: str, target_channel: int = 0, merge: int = 0, reverse: int = 0):
-    mid = mido.MidiFile(midi_path)
+def extract_monophonic_notes_old(midi_path: str, target_channel: int = 0, merge: int = 0, reverse: int = 0, stats: dict = None, start=None, end=None):
+    mid = open_midi(midi_path)
     ticks_per_beat = mid.ticks_per_beat
     default_tempo = 500_000  # µs per beat = 120 BPM
 
-    # Merge all events from all tracks into one timeline
-    events = []
-    for track in mid.tracks:
-        abs_tick = 0
-        for msg in track:
-            abs_tick += msg.time
-            events.append((abs_tick, msg))
-
-    # Sort all by absolute time (tick)
-    if reverse:
-        events.reverse()
-    events.sort(key=lambda x: x[0])
-
     current_tick = 0
     current_time = 0.0
     current_tempo = default_tempo
@@ -120,6 +325,26 @@ def extract_monophonic_notes_old(midi_path: str, target_channel: int = 0, merge:
     active_note = None
     active_note_start_time = 0.0
 
+    # Only convert part of the song if asked to, the tracks are merged lazily up to its end
+    window = None
+    if start is not None or end is not None:
+        window, current_tick, current_time, current_tempo, active_note = sliced_events(mid, start, end, target_channel, merge, reverse, old_logic=True)
+        last_event_time = active_note_start_time = current_time
+        events = window
+    else:
+        # Merge all events from all tracks into one timeline
+        events = []
+        for track in mid.tracks:
+            abs_tick = 0
+            for msg in track:
+                abs_tick += msg.time
+                events.append((abs_tick, msg))
+
+        # Sort all by absolute time (tick)
+        if reverse:
+            events.reverse()
+        events.sort(key=lambda x: x[0])
+
     for abs_tick, msg in events:
         delta_ticks = abs_tick - current_tick
         delta_time = mido.tick2second(delta_ticks, ticks_per_beat, current_tempo)
@@ -140,6 +365,8 @@ def extract_monophonic_notes_old(midi_path: str, target_channel: int = 0, merge:
 
             # First, stop the currently active note if one is playing
             if active_note is not None:
+                if stats is not None:
+                    stats["cut_notes"] = stats.get("cut_notes", 0) + 1
                 duration = current_time - active_note_start_time
                 if active_note_start_time > last_event_time:
                     delay = active_note_start_time - last_event_time
@@ -162,6 +389,10 @@ def extract_monophonic_notes_old(midi_path: str, target_channel: int = 0, merge:
                 last_event_time = current_time
                 active_note = None
 
+    # A sliced song ends at the end position, not at its last event
+    if window is not None and window.end_time is not None:
+        current_time = max(current_time, window.end_time)
+
     # If any note was left hanging, close it at end of track
     if active_note is not None:
         duration = current_time - active_note_start_time
@@ -173,6 +404,255 @@ def extract_monophonic_notes_old(midi_path: str, target_channel: int = 0, merge:
     return timeline
 
 
+def extract_polyphonic_notes(midi_path: str, voices: int = 2, target_channel: int = 0, merge: int = 0, reverse: int = 0, prefer: str = "high", stats: dict = None):
+    mid = open_midi(midi_path)
+    ticks_per_beat = mid.ticks_per_beat
+    default_tempo = 500_000  # µs per beat = 120 BPM
+
+    # Merge all events from all tracks into one timeline
+    events = []
+    for track in mid.tracks:
+        abs_tick = 0
+        for msg in track:
+            abs_tick += msg.time
+            events.append((abs_tick, msg))
+
+    # Same ordering as extract_monophonic_notes
+    if reverse:
+        events.sort(key=lambda x: (x[0], getattr(x[1], 'channel', -1)))
+    else:
+        events.sort(key=lambda x: (x[0], -getattr(x[1], 'channel', 999)))
+
+    # Notes with a higher rank keep their voice when there are more notes than voices
+    sign = 1 if prefer == "high" else -1
+
+    current_tick = 0
+    current_time = 0.0
+    current_tempo = default_tempo
+
+    timelines = [[] for _ in range(voices)]
+    last_event_time = [0.0] * voices
+    voice_note = [None] * voices  # (key, note, start_time, seq) playing on each voice
+
+    free_voices = list(range(voices))  # heap, lowest voice number is used first
+    playing = []  # heap of (rank, seq, voice), lowest ranked playing note is stolen first
+    waiting = []  # heap of (-rank, seq, key, note), best sounding note without a voice
+    sounding = {}  # (channel, note) -> seq of its latest note_on
+    voice_of = {}  # seq -> voice, only for notes that currently have one
+    seq = 0
+
+    def close_voice(voice):
+        key, note, start, note_seq = voice_note[voice]
+        del voice_of[note_seq]
+        duration = current_time - start
+        if start > last_event_time[voice]:
+            delay = start - last_event_time[voice]
+            timelines[voice].append((0, 1, round(delay, 6)))
+        timelines[voice].append((note, round(note_to_freq(note), 2), round(duration, 6)))
+        last_event_time[voice] = current_time
+        voice_note[voice] = None
+
+    def start_voice(voice, key, note, note_seq):
+        voice_note[voice] = (key, note, current_time, note_seq)
+        voice_of[note_seq] = voice
+        heapq.heappush(playing, (sign * note, note_seq, voice))
+
+    def lowest_playing():
+        # Drop heap entries for notes that have since stopped or moved
+        while playing:
+            rank, note_seq, voice = playing[0]
+            if voice_note[voice] is not None and voice_note[voice][3] == note_seq:
+                return playing[0]
+            heapq.heappop(playing)
+        return None
+
+    def best_waiting():
+        while waiting:
+            neg_rank, note_seq, key, note = waiting[0]
+            if sounding.get(key) == note_seq:
+                return waiting[0]
+            heapq.heappop(waiting)
+        return None
+
+    def release(voice):
+        close_voice(voice)
+        # Hand the voice to the best note that is still held but had no voice
+        entry = best_waiting()
+        if entry is not None:
+            heapq.heappop(waiting)
+            _, note_seq, key, note = entry
+            start_voice(voice, key, note, note_seq)
+        else:
+            heapq.heappush(free_voices, voice)
+
+    for abs_tick, msg in events:
+        delta_ticks = abs_tick - current_tick
+        delta_time = mido.tick2second(delta_ticks, ticks_per_beat, current_tempo)
+        current_time += delta_time
+        current_tick = abs_tick
+
+        # Skip if channel doesn't match (if filtering)
+        if not merge:
+            if hasattr(msg, "channel") and target_channel is not None:
+                if msg.channel != target_channel:
+                    continue
+
+        if msg.type == "set_tempo":
+            current_tempo = msg.tempo
+
+        elif msg.type in ("note_on", "note_off"):
+            key = (msg.channel, msg.note)
+
+            # Any note_on/note_off ends the note already held on this key
+            old_seq = sounding.pop(key, None)
+            if old_seq is not None:
+                voice = voice_of.get(old_seq)
+                if voice is not None:
+                    release(voice)
+
+            if msg.type == "note_on" and msg.velocity > 0:
+                seq += 1
+                sounding[key] = seq
+                rank = sign * msg.note
+
+                if free_voices:
+                    voice = heapq.heappop(free_voices)
+                else:
+                    # All voices busy, steal the weakest one if the new note outranks it
+                    voice = None
+                    entry = lowest_playing()
+                    if entry is not None and entry[0] < rank:
+                        heapq.heappop(playing)
+                        voice = entry[2]
+                        stolen_key, stolen_note, _, stolen_seq = voice_note[voice]
+                        close_voice(voice)
+                        if stats is not None:
+                            stats["cut_notes"] = stats.get("cut_notes", 0) + 1
+                        heapq.heappush(waiting, (-sign * stolen_note, stolen_seq, stolen_key, stolen_note))
+
+                if voice is None:
+                    heapq.heappush(waiting, (-rank, seq, key, msg.note))
+                else:
+                    start_voice(voice, key, msg.note, seq)
+
+    # Close anything left hanging at the end of the track
+    for voice in range(voices):
+        if voice_note[voice] is not None:
+            close_voice(voice)
+
+    return timelines
+
+
+# Binary timeline file (.m2bt): a header followed by fixed-width records, so a
+# converted song can be re-exported without parsing the MIDI again.
+#   header: magic, format version, record count
+#   record: MIDI note, rest flag, duration in seconds (float64)
+# Frequencies aren't stored, they are recomputed from the note on load.
+TIMELINE_MAGIC = b"M2BT"
+TIMELINE_VERSION = 1
+TIMELINE_HEADER = struct.Struct("<4sHI")
+TIMELINE_RECORD = struct.Struct("<BBd")
+
+
+def save_timeline(notes, path):
+    with open(path, "wb") as f:
+        f.write(TIMELINE_HEADER.pack(TIMELINE_MAGIC, TIMELINE_VERSION, len(notes)))
+        f.write(b"".join(TIMELINE_RECORD.pack(n, 1 if fr == 1 else 0, d) for n, fr, d in notes))
+
+
+def is_timeline_file(path):
+    with open(path, "rb") as f:
+        return f.read(len(TIMELINE_MAGIC)) == TIMELINE_MAGIC
+
+
+def load_timeline(path):
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if len(data) < TIMELINE_HEADER.size:
+            raise ValueError(f"'{path}' is too short to be a timeline file")
+        magic, version, count = TIMELINE_HEADER.unpack_from(data, 0)
+        if magic != TIMELINE_MAGIC:
+            raise ValueError(f"'{path}' is not a timeline file")
+        if version != TIMELINE_VERSION:
+            raise ValueError(f"Unsupported timeline version {version} (expected {TIMELINE_VERSION})")
+        end = TIMELINE_HEADER.size + count * TIMELINE_RECORD.size
+        if len(data) < end:
+            raise ValueError(f"'{path}' is truncated ({count} records expected)")
+
+        # Frequencies repeat a lot, so only compute each one once
+        freqs = {}
+        notes = []
+        with memoryview(data) as view:
+            for n, rest, d in TIMELINE_RECORD.iter_unpack(view[TIMELINE_HEADER.size:end]):
+                if rest:
+                    notes.append((n, 1, d))
+                else:
+                    f = freqs.get(n)
+                    if f is None:
+                        f = freqs[n] = round(note_to_freq(n), 2)
+                    notes.append((n, f, d))
+        return notes
+
+
+# Beep scripts back to timelines: the events of format_single_line and format_multi_line,
+# whatever the line continuations (\ or ^) and whitespace between them
+BEEP_TOKEN_RE = re.compile(rb"-n -f \S+ -l \S+|-D \S+")
+BEEP_NOTES = {round(note_to_freq(n), 2): n for n in range(128)}
+
+
+class BeepTokens(dict):
+    """Token -> timeline entry. Songs repeat the same few hundred notes, so each
+    distinct token is only parsed once, the rest are dict hits."""
+
+    def __init__(self, speed=1000):
+        super().__init__()
+        self.speed = speed
+
+    def __missing__(self, token):
+        parts = token.split()
+        # Extraction keeps 6 decimals, rounding to them gives back the exact timeline value
+        if parts[0] == b"-D":
+            entry = (0, 1, round(float(parts[1]) / self.speed, 6))
+        else:
+            freq = float(parts[2])
+            note = BEEP_NOTES.get(freq)
+            if note is None:
+                # Not a frequency this converter writes (an edited script), take the nearest note
+                note = min(max(round(69 + 12 * math.log2(freq / 440)), 0), 127) if freq > 0 else 0
+            entry = (note, freq, round(float(parts[4]) / self.speed, 6))
+        self[token] = entry
+        return entry
+
+
+def beep_tokens(data):
+    # The events of beep commands (str, bytes or an mmap) as byte strings, in order
+    if isinstance(data, str):
+        data = data.encode()
+    return BEEP_TOKEN_RE.findall(data)
+
+
+def parse_beep(data, speed=1000):
+    """Rebuild the timeline from beep commands (str, bytes or an mmap).
+
+    Formatting the result at the same speed gives the same beep command
+    again, so old outputs can be re-exported to other formats without the
+    MIDI file. Zero-length entries were never written, so they stay lost.
+    """
+    return list(map(BeepTokens(speed).__getitem__, beep_tokens(data)))
+
+
+def is_beep_file(path):
+    with open(path, "rb") as f:
+        return f.read(64).lstrip().startswith(b"beep")
+
+
+def load_beep(path, speed=1000):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return parse_beep(data, speed)
+
+
 def format_single_line(notes, speed):
     final = "beep "
     for n, f, d in notes:
@@ -238,7 +718,7 @@ def format_arduino_sequential(notes, speed):
     return "\n".join(code)
 
 
-def format_arduino_arrays(notes, speed):
+def arduino_note_arrays(notes, speed):
     frequencies = []
     durations = []
     
@@ -252,6 +732,23 @@ def format_arduino_arrays(notes, speed):
             frequencies.append(int(f))
         durations.append(duration_ms)
     
+    return frequencies, durations
+
+
+def format_int_array(code, name, values, ctype="int", progmem=False):
+    code.append(f"{ctype} {name}[]{' PROGMEM' if progmem else ''} = {{")
+    for i in range(0, len(values), 10):  # 10 per line
+        line = "  " + ", ".join(map(str, values[i:i+10]))
+        if i + 10 < len(values):
+            line += ","
+        code.append(line)
+    code.append("};")
+    code.append("")
+
+
+def format_arduino_arrays(notes, speed):
+    frequencies, durations = arduino_note_arrays(notes, speed)
+    
     code = []
     code.append("// Generated Arduino beep code with arrays")
     code.append("// Connect buzzer to pin 8 (or change BUZZER_PIN)")
@@ -259,25 +756,8 @@ def format_arduino_arrays(notes, speed):
     code.append("#define BUZZER_PIN 8")
     code.append("")
     
-    # Format frequencies array
-    code.append("int frequencies[] = {")
-    for i in range(0, len(frequencies), 10):  # 10 per line
-        line = "  " + ", ".join(map(str, frequencies[i:i+10]))
-        if i + 10 < len(frequencies):
-            line += ","
-        code.append(line)
-    code.append("};")
-    code.append("")
-    
-    # Format durations array
-    code.append("int durations[] = {")
-    for i in range(0, len(durations), 10):  # 10 per line
-        line = "  " + ", ".join(map(str, durations[i:i+10]))
-        if i + 10 < len(durations):
-            line += ","
-        code.append(line)
-    code.append("};")
-    code.append("")
+    format_int_array(code, "frequencies", frequencies)
+    format_int_array(code, "durations", durations)
     
     code.append(f"int noteCount = {len(frequencies)};")
     code.append("")
@@ -305,107 +785,3058 @@ def format_arduino_arrays(notes, speed):
     return "\n".join(code)
 
 
-def format_output(notes, speed, export_type):
-    if export_type == "single":
-        return format_single_line(notes, speed)
-    elif export_type == "linux":
-        return format_multi_line(notes, speed, "\\")
-    elif export_type == "windows":
-        return format_multi_line(notes, speed, "^")
-    elif export_type == "arduino":
-        return format_arduino_sequential(notes, speed)
-    elif export_type == "arduino-arrays":
-        return format_arduino_arrays(notes, speed)
-    else:
-        return format_single_line(notes, speed)
+def format_arduino_nonblocking(notes, speed):
+    frequencies, durations = arduino_note_arrays(notes, speed)
+    
+    code = []
+    code.append("// Generated Arduino beep code with a non-blocking player")
+    code.append("// Connect buzzer to pin 8 (or change BUZZER_PIN)")
+    code.append("// The melody is advanced by updateMelody() using millis(), so loop() is free for other work.")
+    code.append("// Uncomment USE_TIMER_INTERRUPT to drive it from a Timer1 interrupt instead (AVR boards only).")
+    code.append("")
+    code.append("#define BUZZER_PIN 8")
+    code.append("#define REPEAT_DELAY 2000 // Wait 2 seconds before repeating")
+    code.append("// #define USE_TIMER_INTERRUPT")
+    code.append("")
+    
+    format_int_array(code, "frequencies", frequencies)
+    format_int_array(code, "durations", durations)
+    
+    code.append(f"int noteCount = {len(frequencies)};")
+    code.append("")
+    code.append("int currentNote = -1;")
+    code.append("unsigned long noteStart = 0;")
+    code.append("unsigned long noteLength = 0;")
+    code.append("")
+    code.append("void updateMelody() {")
+    code.append("  if (millis() - noteStart < noteLength) {")
+    code.append("    return; // Current note (or rest) is still playing")
+    code.append("  }")
+    code.append("  noteStart += noteLength; // Step from the scheduled time so delays don't add up")
+    code.append("  currentNote++;")
+    code.append("  if (currentNote >= noteCount) {")
+    code.append("    noTone(BUZZER_PIN);")
+    code.append("    currentNote = -1;")
+    code.append("    noteLength = REPEAT_DELAY;")
+    code.append("    return;")
+    code.append("  }")
+    code.append("  if (frequencies[currentNote] == 0) {")
+    code.append("    noTone(BUZZER_PIN);")
+    code.append("  } else {")
+    code.append("    tone(BUZZER_PIN, frequencies[currentNote]);")
+    code.append("  }")
+    code.append("  noteLength = durations[currentNote];")
+    code.append("}")
+    code.append("")
+    code.append("#if defined(USE_TIMER_INTERRUPT) && defined(__AVR__)")
+    code.append("ISR(TIMER1_COMPA_vect) {")
+    code.append("  updateMelody();")
+    code.append("}")
+    code.append("#endif")
+    code.append("")
+    code.append("void setup() {")
+    code.append("  pinMode(BUZZER_PIN, OUTPUT);")
+    code.append("  noteStart = millis();")
+    code.append("#if defined(USE_TIMER_INTERRUPT) && defined(__AVR__)")
+    code.append("  // Fire TIMER1_COMPA once per millisecond (16 MHz / 64 / 250)")
+    code.append("  noInterrupts();")
+    code.append("  TCCR1A = 0;")
+    code.append("  TCCR1B = (1 << WGM12) | (1 << CS11) | (1 << CS10);")
+    code.append("  OCR1A = 249;")
+    code.append("  TIMSK1 |= (1 << OCIE1A);")
+    code.append("  interrupts();")
+    code.append("#endif")
+    code.append("}")
+    code.append("")
+    code.append("void loop() {")
+    code.append("#if !(defined(USE_TIMER_INTERRUPT) && defined(__AVR__))")
+    code.append("  updateMelody();")
+    code.append("#endif")
+    code.append("  // Do other work here, just avoid long blocking calls")
+    code.append("}")
+    
+    return "\n".join(code)
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Convert a MIDI file into various beep formats.",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-Export Types:
-  single         Single line beep command (default)
-  linux          Multi-line with Linux continuation (\\)
-  windows        Multi-line with Windows continuation (^)
-  arduino        Arduino sequential code
-  arduino-arrays Arduino code using arrays
+MIN_PHRASE_LENGTH = 4  # shorter repeats cost more in the play order table than they save
 
-Examples:
-  python midi2beep.py -file song.mid
-  python midi2beep.py -file song.mid -oldlogic
-  python midi2beep.py -file song.mid -speed 1.5 -merge -reverse
-  python midi2beep.py -file song.mid -export arduino -output song.ino
-  python midi2beep.py -file song.mid -export linux -channel 2 -nocopy
-        """
-    )
 
-    parser.add_argument("-file", required=True, help="Path to the input MIDI file")
-    parser.add_argument("-output", help="Output file (if not specified, copies to clipboard)")
-    parser.add_argument("-speed", type=float, default=1.0, help="Speed multiplier (default: 1.0)")
-    parser.add_argument("-channel", type=int, default=0, help="Target MIDI channel (default: 0)")
-    parser.add_argument("-merge", action="store_true", help="Merge all channels")
-    parser.add_argument("-reverse", action="store_true", help="Reverse channel priority (use with -merge)")
-    parser.add_argument("-export", choices=["single", "linux", "windows", "arduino", "arduino-arrays"], 
-                       default="single", help="Export format (default: single)")
-    parser.add_argument("-nocopy", action="store_true", help="Don't copy to clipboard")
-    parser.add_argument("-noprint", action="store_true", help="Don't print to stdout")
-    parser.add_argument("-oldlogic", action="store_true", help="Use old conversion logic")
-    parser.add_argument("-quiet", action="store_true", help="Suppress status messages")
+def suffix_array(seq):
+    # Prefix doubling, O(n log^2 n) with Python's sort
+    n = len(seq)
+    sa = list(range(n))
+    rank = list(seq)
+    k = 1
+    while n > 1:
+        key = [(rank[i], rank[i + k] if i + k < n else -1) for i in range(n)]
+        sa.sort(key=key.__getitem__)
+        new_rank = [0] * n
+        for j in range(1, n):
+            new_rank[sa[j]] = new_rank[sa[j - 1]] + (key[sa[j]] != key[sa[j - 1]])
+        rank = new_rank
+        if rank[sa[-1]] == n - 1:
+            break
+        k *= 2
+    return sa
 
-    args = parser.parse_args()
-    
-    # Validate file
-    if not os.path.isfile(args.file):
-        print(f"Error: File '{args.file}' not found or not readable.")
-        sys.exit(1)
-    
-    try:
-        # Process MIDI
-        if not args.quiet:
-            print(f"Processing MIDI file: {args.file}")
-        
-        target_channel = None if args.merge else args.channel
-        merge = 1 if args.merge else 0
-        reverse = 1 if args.reverse else 0
-        
-        extract_fn = extract_monophonic_notes_old if args.oldlogic else extract_monophonic_notes
-        notes = extract_fn(args.file, target_channel, merge, reverse)
-        
-        if not args.quiet:
-            print(f"Extracted {len(notes)} notes/events")
-        
-        # Format output
-        speed = 1000 * args.speed
-        final = format_output(notes, speed, args.export)
-        
-        # Output handling
-        if args.output:
-            # Write to file
-            with open(args.output, 'w') as f:
-                f.write(final)
-            if not args.quiet:
-                print(f"Output written to: {args.output}")
+
+def lcp_array(seq, sa):
+    # Kasai et al., lcp[i] is the common prefix length of suffixes sa[i - 1] and sa[i]
+    n = len(seq)
+    rank = [0] * n
+    for i, p in enumerate(sa):
+        rank[p] = i
+    lcp = [0] * n
+    h = 0
+    for p in range(n):
+        if rank[p] > 0:
+            q = sa[rank[p] - 1]
+            while p + h < n and q + h < n and seq[p + h] == seq[q + h]:
+                h += 1
+            lcp[rank[p]] = h
+            if h:
+                h -= 1
         else:
-            if not args.noprint:
-                # Print to stdout
-                print(final)
-        
-        # Clipboard handling
-        if not args.nocopy and not args.output:
-            try:
-                pyperclip.copy(final)
-                if not args.quiet:
-                    print("\n✓ Output copied to clipboard")
-            except Exception as e:
-                if not args.quiet:
-                    print(f"\n⚠ Warning: Could not copy to clipboard: {e}")
-        
-        if not args.quiet and args.export in ["arduino", "arduino-arrays"]:
-            print("\n✓ Arduino code generated successfully!")
-            print("  Remember to connect your buzzer to pin 8 or modify the code")
-    
-    except Exception as e:
-        print(f"Error: {e}")
-        sys.exit(1)
+            h = 0
+    return lcp
+
+
+def repeated_substrings(seq, min_length):
+    # Every LCP interval is a substring that repeats:
+    # (length, count, first, last, positions in sa[lb:rb]), first/last being its leftmost and rightmost start
+    sa = suffix_array(seq)
+    lcp = lcp_array(seq, sa)
+    n = len(seq)
+    stack = [[0, 0, n, -1]]  # length, lb, first, last
+    for i in range(1, n + 1):
+        l = lcp[i] if i < n else 0
+        lb = i - 1
+        first = last = sa[i - 1]
+        while True:
+            top = stack[-1]
+            top[2] = min(top[2], first)  # Children pass their start range up to the enclosing interval
+            top[3] = max(top[3], last)
+            if l >= top[0]:
+                break
+            length, lb, first, last = stack.pop()
+            if length >= min_length:
+                yield length, i - lb, first, last, sa, lb, i
+        if l > stack[-1][0]:
+            stack.append([l, lb, first, last])
+
+
+def claim_occurrences(positions, length, claimed):
+    # Left to right, the starts that overlap neither each other nor an earlier claim
+    taken = []
+    end = -1
+    for p in sorted(positions):
+        if p >= end and claimed.find(1, p, p + length) == -1:
+            taken.append(p)
+            end = p + length
+    return taken
+
+
+def find_phrases(seq, min_length=MIN_PHRASE_LENGTH):
+    """Split seq into phrases so repeated runs are stored once.
+
+    Returns (phrases, play_order): the list of distinct phrases (tuples of
+    symbols) and the phrase indices that rebuild seq when played in order.
+    """
+    n = len(seq)
+
+    # Greedily take the repeat that saves the most, (occurrences - 1) * length,
+    # counting only occurrences that overlap neither each other nor what is
+    # already taken. A repeat can only lose occurrences, so its last score is an
+    # upper bound: it is rescored when it comes out on top of the heap and only
+    # taken if it still beats the bound of the next one.
+    heap = []
+    for length, count, first, last, sa, lb, rb in repeated_substrings(seq, min_length):
+        # Non-overlapping occurrences have to fit between the first and last start
+        fits = min(count, (last - first) // length + 1)
+        if fits >= 2:
+            heap.append((-(fits - 1) * length, len(heap), length, sa, lb, rb))
+    heapq.heapify(heap)
+    claimed = bytearray(n)
+    unclaimed = n
+    starts = {}  # position -> phrase length
+    while heap and unclaimed >= 2 * min_length:  # otherwise nothing left could repeat
+        bound, order, length, sa, lb, rb = heapq.heappop(heap)
+        taken = claim_occurrences(sa[lb:rb], length, claimed)
+        if len(taken) < 2:
+            continue
+        score = -(len(taken) - 1) * length
+        if heap and score > heap[0][0]:
+            heapq.heappush(heap, (score, order, length, sa, lb, rb))
+            continue
+        for p in taken:
+            claimed[p:p + length] = b"\x01" * length
+            starts[p] = length
+        unclaimed -= len(taken) * length
+
+    # Everything not covered by a repeat becomes a one-off phrase
+    phrase_ids = {}
+    phrases = []
+    play_order = []
+
+    def add(phrase):
+        pid = phrase_ids.get(phrase)
+        if pid is None:
+            pid = phrase_ids[phrase] = len(phrases)
+            phrases.append(phrase)
+        play_order.append(pid)
+
+    i = 0
+    gap = 0
+    while i < n:
+        length = starts.get(i)
+        if length is None:
+            i += 1
+            continue
+        if gap < i:
+            add(tuple(seq[gap:i]))
+        add(tuple(seq[i:i + length]))
+        i += length
+        gap = i
+    if gap < n:
+        add(tuple(seq[gap:n]))
+
+    return phrases, play_order
+
+
+def phrase_tables(notes, speed):
+    """The tables of arduino-phrases: (seq, unique_notes, phrases, play_order,
+    phrase_notes, phrase_start, index_type), seq being the note ids in play order."""
+    frequencies, durations = arduino_note_arrays(notes, speed)
+
+    # Every distinct (frequency, duration) pair is stored once and referenced by index
+    note_ids = {}
+    seq = []
+    for pair in zip(frequencies, durations):
+        nid = note_ids.get(pair)
+        if nid is None:
+            nid = note_ids[pair] = len(note_ids)
+        seq.append(nid)
+    unique_notes = list(note_ids)
+
+    phrases, play_order = find_phrases(seq)
+    phrase_notes = [nid for phrase in phrases for nid in phrase]
+    phrase_start = [0]
+    for phrase in phrases:
+        phrase_start.append(phrase_start[-1] + len(phrase))
+    index_type = "uint8_t" if len(unique_notes) <= 256 else "uint16_t"
+    return seq, unique_notes, phrases, play_order, phrase_notes, phrase_start, index_type
+
+
+def format_arduino_phrases(notes, speed, tables=None):
+    # tables: phrase_tables(notes, speed) if the caller already has them
+    seq, unique_notes, phrases, play_order, phrase_notes, phrase_start, index_type = tables or phrase_tables(notes, speed)
+
+    # Data size on an AVR board (2 byte int), compared with the two int arrays of arduino-arrays
+    index_size = 1 if index_type == "uint8_t" else 2
+    original_bytes = len(seq) * 4
+    compressed_bytes = len(unique_notes) * 4 + len(phrase_notes) * index_size + len(phrase_start) * 2 + len(play_order) * 2
+    ratio = compressed_bytes / original_bytes if original_bytes else 1.0
+
+    code = []
+    code.append("// Generated Arduino beep code with repeated phrases")
+    code.append("// Connect buzzer to pin 8 (or change BUZZER_PIN)")
+    code.append(f"// Phrases: {len(seq)} notes stored as {len(phrase_notes)} in {len(phrases)} phrases, "
+                f"{compressed_bytes} of {original_bytes} bytes ({ratio:.1%} of arduino-arrays)")
+    code.append("")
+    code.append("#define BUZZER_PIN 8")
+    code.append("")
+
+    format_int_array(code, "noteFrequencies", [f for f, d in unique_notes], "const uint16_t", True)
+    format_int_array(code, "noteDurations", [d for f, d in unique_notes], "const uint16_t", True)
+    format_int_array(code, "phraseNotes", phrase_notes, f"const {index_type}", True)
+    format_int_array(code, "phraseStart", phrase_start, "const uint16_t", True)
+    format_int_array(code, "playOrder", play_order, "const uint16_t", True)
+
+    code.append(f"int playCount = {len(play_order)};")
+    code.append("")
+    code.append("void setup() {")
+    code.append("  pinMode(BUZZER_PIN, OUTPUT);")
+    code.append("}")
+    code.append("")
+    code.append("void loop() {")
+    code.append("  playMelody();")
+    code.append("  delay(2000); // Wait 2 seconds before repeating")
+    code.append("}")
+    code.append("")
+    code.append("void playPhrase(uint16_t phrase) {")
+    code.append("  uint16_t end = pgm_read_word(&phraseStart[phrase + 1]);")
+    code.append("  for (uint16_t i = pgm_read_word(&phraseStart[phrase]); i < end; i++) {")
+    read_index = "pgm_read_byte" if index_type == "uint8_t" else "pgm_read_word"
+    code.append(f"    uint16_t note = {read_index}(&phraseNotes[i]);")
+    code.append("    uint16_t frequency = pgm_read_word(&noteFrequencies[note]);")
+    code.append("    uint16_t duration = pgm_read_word(&noteDurations[note]);")
+    code.append("    if (frequency == 0) {")
+    code.append("      delay(duration);")
+    code.append("    } else {")
+    code.append("      tone(BUZZER_PIN, frequency, duration);")
+    code.append("      delay(duration);")
+    code.append("      noTone(BUZZER_PIN);")
+    code.append("    }")
+    code.append("  }")
+    code.append("}")
+    code.append("")
+    code.append("void playMelody() {")
+    code.append("  for (int i = 0; i < playCount; i++) {")
+    code.append("    playPhrase(pgm_read_word(&playOrder[i]));")
+    code.append("  }")
+    code.append("}")
+
+    return "\n".join(code)
+
+
+# Stream file for arduino-sd: header, then one 3 byte record per note or rest
+# (MIDI note or STREAM_REST, duration in ms), read from the SD card while playing
+STREAM_MAGIC = b"M2BS"
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct("<4sHI")
+STREAM_RECORD = struct.Struct("<BH")
+STREAM_REST = 0xFF
+STREAM_BLOCK_RECORDS = 32  # records per buffer in the sketch, two buffers are kept in RAM
+
+
+def encode_stream(notes, speed):
+    records = []
+    for n, f, d in notes:
+        if d == 0:
+            continue
+        note = STREAM_REST if f == 1 else n
+        duration_ms = int(d * speed)
+        if duration_ms == 0:
+            continue  # Shorter than a millisecond, the player couldn't sound it anyway
+        # Longer than a record can hold: the same note again continues it
+        while duration_ms > 0xFFFF:
+            records.append(STREAM_RECORD.pack(note, 0xFFFF))
+            duration_ms -= 0xFFFF
+        records.append(STREAM_RECORD.pack(note, duration_ms))
+    return STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, len(records)) + b"".join(records)
+
+
+def stream_path(path):
+    # song.ino -> song.bin
+    return os.path.splitext(path)[0] + ".bin"
+
+
+def write_stream(notes, speed, path):
+    with open(path, "wb") as f:
+        f.write(encode_stream(notes, speed))
+
+
+def format_arduino_sd(notes, speed):
+    # The notes themselves go into the stream file (encode_stream), the sketch only
+    # needs the note frequency table, so it is the same for every song
+    record_count = (len(encode_stream(notes, speed)) - STREAM_HEADER.size) // STREAM_RECORD.size
+
+    code = []
+    code.append("// Generated Arduino beep code streaming the melody from an SD card")
+    code.append("// Connect buzzer to pin 8 (or change BUZZER_PIN) and the SD card module's CS to pin 10 (SD_CS_PIN)")
+    code.append(f"// Copy the .bin file written next to this sketch to the card as SONG.BIN ({record_count} notes/rests)")
+    code.append("// Only two blocks of the song are in RAM at a time, so its length is limited by the card, not the flash.")
+    code.append("// Test the player on a PC: g++ -x c++ song.ino -o song-sim && ./song-sim song.bin")
+    code.append("")
+    code.append("#define BUZZER_PIN 8")
+    code.append("#define SD_CS_PIN 10")
+    code.append('#define SONG_FILE "SONG.BIN"')
+    code.append("#define REPEAT_DELAY 2000 // Wait 2 seconds before repeating")
+    code.append(f"#define BLOCK_RECORDS {STREAM_BLOCK_RECORDS} // Notes per buffer, {STREAM_RECORD.size} bytes each")
+    code.append(f"#define RECORD_SIZE {STREAM_RECORD.size}")
+    code.append(f"#define HEADER_SIZE {STREAM_HEADER.size}")
+    code.append(f"#define REST {STREAM_REST}")
+    code.append("")
+    code.append("#ifdef ARDUINO")
+    code.append("#include <SPI.h>")
+    code.append("#include <SD.h>")
+    code.append("#else")
+    code.append("// Host build: a simulated clock, tone() prints instead of playing and the song is read with stdio")
+    code.append("#include <cstdio>")
+    code.append("#include <cstdint>")
+    code.append("#include <cstring>")
+    code.append("#define PROGMEM")
+    code.append("#define pgm_read_word(addr) (*(addr))")
+    code.append("#define OUTPUT 1")
+    code.append("unsigned long hostMillis = 0;")
+    code.append("const char *hostPath = SONG_FILE;")
+    code.append("unsigned long millis() { return hostMillis; }")
+    code.append("void pinMode(int, int) {}")
+    code.append('void tone(int, unsigned int frequency) { printf("%lu tone %u\\n", hostMillis, frequency); }')
+    code.append('void noTone(int) { printf("%lu noTone\\n", hostMillis); }')
+    code.append("struct File {")
+    code.append("  FILE *f = nullptr;")
+    code.append("  operator bool() const { return f != nullptr; }")
+    code.append("  int read(uint8_t *buffer, int size) { return (int)fread(buffer, 1, size, f); }")
+    code.append("  bool seek(unsigned long position) { return fseek(f, position, SEEK_SET) == 0; }")
+    code.append("};")
+    code.append("struct {")
+    code.append("  bool begin(int) { return true; }")
+    code.append('  File open(const char *) { File file; file.f = fopen(hostPath, "rb"); return file; }')
+    code.append("} SD;")
+    code.append("#endif")
+    code.append("")
+    frequencies = [int(round(note_to_freq(n), 2)) for n in range(128)]
+    format_int_array(code, "noteFrequencies", frequencies, "const uint16_t", True)
+    code.append("File song;")
+    code.append("bool songReady = false;")
+    code.append("unsigned int timesPlayed = 0;")
+    code.append("")
+    code.append("// Double buffering: one block plays while loop() reads the next one into the other")
+    code.append("uint8_t buffers[2][BLOCK_RECORDS * RECORD_SIZE];")
+    code.append("uint8_t bufferRecords[2] = {0, 0}; // 0 = empty")
+    code.append("uint8_t playBuffer = 0;")
+    code.append("uint8_t playIndex = 0;")
+    code.append("bool endOfSong = false;")
+    code.append("")
+    code.append("unsigned long noteStart = 0;")
+    code.append("unsigned long noteLength = 0;")
+    code.append("")
+    code.append("void fillBuffer(uint8_t buffer) {")
+    code.append("  int size = song.read(buffers[buffer], BLOCK_RECORDS * RECORD_SIZE);")
+    code.append("  if (size < BLOCK_RECORDS * RECORD_SIZE) {")
+    code.append("    endOfSong = true;")
+    code.append("  }")
+    code.append("  bufferRecords[buffer] = size > 0 ? size / RECORD_SIZE : 0;")
+    code.append("}")
+    code.append("")
+    code.append("void restartSong() {")
+    code.append("  song.seek(HEADER_SIZE);")
+    code.append("  endOfSong = false;")
+    code.append("  playBuffer = 0;")
+    code.append("  playIndex = 0;")
+    code.append("  bufferRecords[1] = 0;")
+    code.append("  fillBuffer(0);")
+    code.append("}")
+    code.append("")
+    code.append("bool openSong() {")
+    code.append("  song = SD.open(SONG_FILE);")
+    code.append("  if (!song) {")
+    code.append("    return false;")
+    code.append("  }")
+    code.append("  uint8_t header[HEADER_SIZE];")
+    code.append(f'  if (song.read(header, HEADER_SIZE) != HEADER_SIZE || memcmp(header, "{STREAM_MAGIC.decode()}", 4) != 0) {{')
+    code.append("    return false;")
+    code.append("  }")
+    code.append("  restartSong();")
+    code.append("  return true;")
+    code.append("}")
+    code.append("")
+    code.append("void updateMelody() {")
+    code.append("  if (millis() - noteStart < noteLength) {")
+    code.append("    return; // Current note (or rest) is still playing")
+    code.append("  }")
+    code.append("  noteStart += noteLength; // Step from the scheduled time so delays don't add up")
+    code.append("  if (playIndex >= bufferRecords[playBuffer]) {")
+    code.append("    // Block used up, switch to the one loop() filled in the meantime")
+    code.append("    bufferRecords[playBuffer] = 0;")
+    code.append("    playBuffer ^= 1;")
+    code.append("    playIndex = 0;")
+    code.append("    if (bufferRecords[playBuffer] == 0 && !endOfSong) {")
+    code.append("      fillBuffer(playBuffer); // The card was too slow, read it now")
+    code.append("    }")
+    code.append("    if (bufferRecords[playBuffer] == 0) {")
+    code.append("      noTone(BUZZER_PIN);")
+    code.append("      timesPlayed++;")
+    code.append("      restartSong();")
+    code.append("      noteLength = REPEAT_DELAY;")
+    code.append("      return;")
+    code.append("    }")
+    code.append("  }")
+    code.append("  const uint8_t *record = &buffers[playBuffer][playIndex * RECORD_SIZE];")
+    code.append("  playIndex++;")
+    code.append("  if (record[0] == REST) {")
+    code.append("    noTone(BUZZER_PIN);")
+    code.append("  } else {")
+    code.append("    tone(BUZZER_PIN, pgm_read_word(&noteFrequencies[record[0]]));")
+    code.append("  }")
+    code.append("  noteLength = record[1] | ((unsigned long)record[2] << 8);")
+    code.append("}")
+    code.append("")
+    code.append("void setup() {")
+    code.append("  pinMode(BUZZER_PIN, OUTPUT);")
+    code.append("  songReady = SD.begin(SD_CS_PIN) && openSong();")
+    code.append("  noteStart = millis();")
+    code.append("}")
+    code.append("")
+    code.append("void loop() {")
+    code.append("  if (!songReady) {")
+    code.append("    return; // No card or no SONG.BIN on it")
+    code.append("  }")
+    code.append("  updateMelody();")
+    code.append("  // Read the next block while the current one plays")
+    code.append("  if (bufferRecords[playBuffer ^ 1] == 0 && !endOfSong) {")
+    code.append("    fillBuffer(playBuffer ^ 1);")
+    code.append("  }")
+    code.append("}")
+    code.append("")
+    code.append("#ifndef ARDUINO")
+    code.append("// Play the song once on the simulated clock, printing every tone change with its time in ms")
+    code.append("int main(int argc, char **argv) {")
+    code.append("  if (argc > 1) {")
+    code.append("    hostPath = argv[1];")
+    code.append("  }")
+    code.append("  setup();")
+    code.append("  if (!songReady) {")
+    code.append('    fprintf(stderr, "Can\'t read %s\\n", hostPath);')
+    code.append("    return 1;")
+    code.append("  }")
+    code.append("  while (timesPlayed == 0) {")
+    code.append("    loop();")
+    code.append("    hostMillis++;")
+    code.append("  }")
+    code.append("  return 0;")
+    code.append("}")
+    code.append("#endif")
+
+    return "\n".join(code)
+
+
+# Boards for the footprint estimate. flash and sram are what a sketch can use (the
+# bootloader is already taken off), core_* is an empty sketch that uses tone(), the
+# *_call sizes are one call with constant arguments, stack_reserve is SRAM left free
+# for the stack. AVR arrays can't be larger than 32767 bytes, and pgm_read_word only
+# reaches the first 64 KB of flash.
+# Sources: flash is upload.maximum_size from the boards.txt of the Arduino AVR core
+# (uno, nano with the old bootloader, mega) and of the ESP32 core (default partition
+# scheme), sram is the ATmega328P/ATmega2560 datasheet and maximum_data_size for the
+# ESP32. The core_*, *_call and sd_* sizes are rounded estimates, not measurements;
+# to refine them, compile an -export of a short song with arduino-cli and compare its
+# "Sketch uses ... bytes" report with -footprint.
+ARDUINO_BOARDS = {
+    "uno": {"name": "Arduino Uno", "flash": 32256, "sram": 2048, "int_size": 2, "core_flash": 1400, "core_sram": 20,
+            "tone_call": 18, "delay_call": 12, "notone_call": 6, "stack_reserve": 256,
+            "max_object": 32767, "progmem_limit": 65536, "sd_flash": 9000, "sd_sram": 750},
+    "nano": {"name": "Arduino Nano", "flash": 30720, "sram": 2048, "int_size": 2, "core_flash": 1400, "core_sram": 20,
+             "tone_call": 18, "delay_call": 12, "notone_call": 6, "stack_reserve": 256,
+             "max_object": 32767, "progmem_limit": 65536, "sd_flash": 9000, "sd_sram": 750},
+    "mega": {"name": "Arduino Mega 2560", "flash": 253952, "sram": 8192, "int_size": 2, "core_flash": 1500, "core_sram": 20,
+             "tone_call": 18, "delay_call": 12, "notone_call": 6, "stack_reserve": 512,
+             "max_object": 32767, "progmem_limit": 65536, "sd_flash": 9200, "sd_sram": 750},
+    "esp32": {"name": "ESP32", "flash": 1310720, "sram": 327680, "int_size": 4, "core_flash": 215000, "core_sram": 13000,
+              "tone_call": 12, "delay_call": 6, "notone_call": 6, "stack_reserve": 8192,
+              "max_object": None, "progmem_limit": None, "sd_flash": 60000, "sd_sram": 4000},
+}
+DEFAULT_BOARD = "uno"
+
+# Code of setup(), loop() and the player itself, on top of the board's core. Rounded
+# estimates like the *_call sizes above, check them the same way.
+ARDUINO_PLAYER_CODE = {"arduino": 40, "arduino-arrays": 150, "arduino-millis": 300, "arduino-phrases": 220, "arduino-sd": 700,
+                       "arduino-playlist": 1300}  # the phrase player plus Serial and the select button
+
+# arduino-auto picks from the sketches that hold the whole song (no SD card, same blocking player)
+AUTO_ENCODINGS = ["arduino", "arduino-arrays", "arduino-phrases"]
+
+
+def footprint_sizes(notes, speed):
+    # What the estimate needs from a timeline, the same for every board. The phrase
+    # search is by far the slowest part, so it runs once per timeline, not per board,
+    # and its tables are kept for format_arduino_phrases.
+    frequencies, durations = arduino_note_arrays(notes, speed)
+    tables = phrase_tables(notes, speed)
+    seq, unique_notes, phrases, play_order, phrase_notes, phrase_start, index_type = tables
+    return {
+        "tables": tables,
+        "count": len(frequencies),
+        "rests": frequencies.count(0),
+        "unique_notes": len(unique_notes),
+        "phrase_notes": len(phrase_notes),
+        "phrase_index_bytes": 1 if index_type == "uint8_t" else 2,
+        "phrase_starts": len(phrase_start),
+        "play_order": len(play_order),
+    }
+
+
+def arduino_footprints(notes, speed, board=DEFAULT_BOARD, sizes=None):
+    """Estimate the flash and SRAM every Arduino export needs on a board.
+
+    Returns {export_type: {"flash", "sram", "fits", "problem"}}. The numbers
+    come from what each encoding stores per note (calls, array entries,
+    phrase tables) on top of the board's core, without compiling anything.
+    They are close enough to choose between encodings, a compiler will
+    differ by some bytes. Pass sizes (footprint_sizes) to estimate several
+    boards from one analysis of the timeline.
+    """
+    b = ARDUINO_BOARDS[board]
+    sizes = sizes or footprint_sizes(notes, speed)
+    count = sizes["count"]
+    rests = sizes["rests"]
+    estimates = {}
+
+    def add(export_type, flash, sram, objects=(), progmem=0):
+        flash += b["core_flash"] + ARDUINO_PLAYER_CODE[export_type]
+        sram += b["core_sram"]
+        problem = None
+        if flash > b["flash"]:
+            problem = f"needs {flash} of {b['flash']} bytes flash"
+        elif sram + b["stack_reserve"] > b["sram"]:
+            problem = f"needs {sram} of {b['sram']} bytes SRAM, and {b['stack_reserve']} for the stack"
+        elif b["max_object"] and max(objects, default=0) > b["max_object"]:
+            problem = f"an array of {max(objects)} bytes is over the {b['max_object']} byte limit"
+        elif b["progmem_limit"] and progmem > b["progmem_limit"]:
+            problem = f"{progmem} bytes of PROGMEM tables, pgm_read_word only reaches {b['progmem_limit']}"
+        estimates[export_type] = {"flash": flash, "sram": sram, "fits": problem is None, "problem": problem}
+
+    # arduino: tone, delay and noTone with constant arguments per note, one delay per rest
+    add("arduino", (count - rests) * (b["tone_call"] + b["delay_call"] + b["notone_call"]) + rests * b["delay_call"], 0)
+
+    # arduino-arrays/-millis: two int arrays that aren't const, so they are copied from flash to SRAM at startup
+    array_bytes = count * b["int_size"]
+    add("arduino-arrays", 2 * array_bytes, 2 * array_bytes + b["int_size"], [array_bytes])
+    add("arduino-millis", 2 * array_bytes, 2 * array_bytes + 2 * b["int_size"] + 8, [array_bytes])
+
+    # arduino-phrases: PROGMEM tables, they stay in flash
+    tables = [sizes["unique_notes"] * 2, sizes["unique_notes"] * 2, sizes["phrase_notes"] * sizes["phrase_index_bytes"],
+              sizes["phrase_starts"] * 2, sizes["play_order"] * 2]
+    add("arduino-phrases", sum(tables), b["int_size"], tables, sum(tables))
+
+    # arduino-sd: the notes stay on the card, the SD library and the two record buffers don't
+    add("arduino-sd", b["sd_flash"], b["sd_sram"] + 2 * STREAM_BLOCK_RECORDS * STREAM_RECORD.size)
+    return estimates
+
+
+def pick_arduino_encoding(notes, speed, board=DEFAULT_BOARD, sizes=None):
+    # The fitting sketch with the least flash, returns (export_type, estimate)
+    estimates = arduino_footprints(notes, speed, board, sizes)
+    fitting = [t for t in AUTO_ENCODINGS if estimates[t]["fits"]]
+    if not fitting:
+        smallest = min(AUTO_ENCODINGS, key=lambda t: estimates[t]["flash"])
+        raise ValueError(f"the song doesn't fit on the {ARDUINO_BOARDS[board]['name']} ({smallest} {estimates[smallest]['problem']}), "
+                         f"export arduino-sd to play it from an SD card")
+    best = min(fitting, key=lambda t: (estimates[t]["flash"], estimates[t]["sram"]))
+    return best, estimates[best]
+
+
+def format_arduino_auto(notes, speed, board=DEFAULT_BOARD):
+    sizes = footprint_sizes(notes, speed)
+    export_type, estimate = pick_arduino_encoding(notes, speed, board, sizes)
+    b = ARDUINO_BOARDS[board]
+    code = [f"// arduino-auto: {export_type} is the smallest sketch that fits the {b['name']} "
+            f"(about {estimate['flash']} of {b['flash']} bytes flash, {estimate['sram']} of {b['sram']} bytes SRAM)"]
+    if export_type == "arduino-phrases":
+        code.append(format_arduino_phrases(notes, speed, sizes["tables"]))
+    else:
+        code.append(format_output(notes, speed, export_type))
+    return "\n".join(code)
+
+
+def format_footprints(name, notes, speed):
+    # One row per Arduino export, one column per board: estimated flash/SRAM bytes
+    boards = list(ARDUINO_BOARDS)
+    sizes = footprint_sizes(notes, speed)
+    estimates = {board: arduino_footprints(notes, speed, board, sizes) for board in boards}
+    lines = [f"{name}: {len(notes)} notes/events, estimated flash/SRAM bytes"]
+    lines.append(f"  {'export':<16}" + "".join(f"{board:<22}" for board in boards))
+    for export_type in estimates[boards[0]]:
+        cells = []
+        for board in boards:
+            e = estimates[board][export_type]
+            cells.append(f"{e['flash']}/{e['sram']} {'✓' if e['fits'] else '✗'}".ljust(22))
+        lines.append(f"  {export_type:<16}" + "".join(cells))
+    picks = []
+    for board in boards:
+        fitting = [t for t in AUTO_ENCODINGS if estimates[board][t]["fits"]]
+        picks.append(f"{board} {min(fitting, key=lambda t: (estimates[board][t]['flash'], estimates[board][t]['sram'])) if fitting else '-'}")
+    lines.append(f"  arduino-auto picks: {', '.join(picks)}")
+    return "\n".join(lines)
+
+
+def format_arduino_playlist(songs, speed, board=DEFAULT_BOARD):
+    """One sketch for several songs, e.g. a whole soundtrack.
+
+    songs is a list of (name, notes). The frequency/duration pairs and the
+    phrases are found across all songs together, so everything the songs
+    have in common is stored once. A button or a number sent over Serial
+    selects the song. The size report at the top is estimated for board.
+    """
+    note_ids = {}
+    seq = []
+    song_lengths = []
+    for i, (name, notes) in enumerate(songs):
+        frequencies, durations = arduino_note_arrays(notes, speed)
+        for pair in zip(frequencies, durations):
+            nid = note_ids.get(pair)
+            if nid is None:
+                nid = note_ids[pair] = len(note_ids)
+            seq.append(nid)
+        song_lengths.append(len(frequencies))
+    unique_notes = list(note_ids)
+
+    # A unique separator after each song keeps repeats from running into the next song
+    separator = len(unique_notes)
+    joined = []
+    start = 0
+    for i, length in enumerate(song_lengths):
+        joined.extend(seq[start:start + length])
+        joined.append(separator + i)
+        start += length
+    phrases, play_order = find_phrases(joined)
+
+    # Only one-off phrases can contain a separator, split them there
+    phrase_ids = {}
+    song_phrases = []
+    song_orders = [[]]
+
+    def add(phrase):
+        pid = phrase_ids.get(phrase)
+        if pid is None:
+            pid = phrase_ids[phrase] = len(song_phrases)
+            song_phrases.append(phrase)
+        song_orders[-1].append(pid)
+
+    for pid in play_order:
+        piece = []
+        for nid in phrases[pid]:
+            if nid >= separator:
+                if piece:
+                    add(tuple(piece))
+                    piece = []
+                song_orders.append([])
+            else:
+                piece.append(nid)
+        if piece:
+            add(tuple(piece))
+    song_orders.pop()  # the one opened by the last separator
+
+    phrase_notes = [nid for phrase in song_phrases for nid in phrase]
+    phrase_start = [0]
+    for phrase in song_phrases:
+        phrase_start.append(phrase_start[-1] + len(phrase))
+    all_play_order = [pid for order in song_orders for pid in order]
+    song_start = [0]
+    for order in song_orders:
+        song_start.append(song_start[-1] + len(order))
+
+    # Flash on the board compared with one arduino-arrays sketch per song, core and player code on both sides
+    b = ARDUINO_BOARDS[board]
+    index_type = "uint8_t" if len(unique_notes) <= 256 else "uint16_t"
+    index_size = 1 if index_type == "uint8_t" else 2
+    data_bytes = (len(unique_notes) * 4 + len(phrase_notes) * index_size + len(phrase_start) * 2
+                  + len(all_play_order) * 2 + len(song_start) * 2)
+    playlist_flash = b["core_flash"] + ARDUINO_PLAYER_CODE["arduino-playlist"] + data_bytes
+    separate_flash = sum(arduino_footprints(notes, speed, board)["arduino-arrays"]["flash"] for name, notes in songs)
+    ratio = playlist_flash / separate_flash if separate_flash else 1.0
+
+    code = []
+    code.append(f"// Generated Arduino playlist with {len(songs)} songs sharing one note dictionary")
+    code.append("// Connect buzzer to pin 8 (or change BUZZER_PIN), a button from pin 2 to GND skips to the next song")
+    code.append(f"// Playlist: about {playlist_flash} bytes flash on the {b['name']} ({data_bytes} of song data), against "
+                f"{separate_flash} bytes for {len(songs)} separate arduino-arrays sketches ({ratio:.1%}), "
+                f"which also copy their arrays into SRAM")
+    code.append("// Send a song number over Serial (9600 baud) to jump to it")
+    code.append("//")
+    for i, (name, notes) in enumerate(songs):
+        code.append(f"// {i}: {name}")
+    code.append("")
+    code.append("#define BUZZER_PIN 8")
+    code.append("#define SELECT_PIN 2")
+    code.append(f"#define SONG_COUNT {len(songs)}")
+    code.append("")
+
+    format_int_array(code, "noteFrequencies", [f for f, d in unique_notes], "const uint16_t", True)
+    format_int_array(code, "noteDurations", [d for f, d in unique_notes], "const uint16_t", True)
+    format_int_array(code, "phraseNotes", phrase_notes, f"const {index_type}", True)
+    format_int_array(code, "phraseStart", phrase_start, "const uint16_t", True)
+    format_int_array(code, "playOrder", all_play_order, "const uint16_t", True)
+    format_int_array(code, "songStart", song_start, "const uint16_t", True)
+
+    code.append("int currentSong = 0;")
+    code.append("int nextSong = 0;")
+    code.append("")
+    code.append("void setup() {")
+    code.append("  pinMode(BUZZER_PIN, OUTPUT);")
+    code.append("  pinMode(SELECT_PIN, INPUT_PULLUP);")
+    code.append("  Serial.begin(9600);")
+    code.append("  Serial.setTimeout(50);")
+    code.append("}")
+    code.append("")
+    code.append("void loop() {")
+    code.append("  Serial.print(\"Playing song \");")
+    code.append("  Serial.println(currentSong);")
+    code.append("  nextSong = (currentSong + 1) % SONG_COUNT;")
+    code.append("  if (playSong(currentSong)) {")
+    code.append("    delay(2000); // Wait 2 seconds before the next song")
+    code.append("  }")
+    code.append("  currentSong = nextSong;")
+    code.append("}")
+    code.append("")
+    code.append("bool songSelected() {")
+    code.append("  // Checked between notes, sets nextSong when the listener picked one")
+    code.append("  if (Serial.available()) {")
+    code.append("    long song = Serial.parseInt();")
+    code.append("    if (song >= 0 && song < SONG_COUNT) {")
+    code.append("      nextSong = song;")
+    code.append("      return true;")
+    code.append("    }")
+    code.append("  }")
+    code.append("  if (digitalRead(SELECT_PIN) == LOW) {")
+    code.append("    while (digitalRead(SELECT_PIN) == LOW) {")
+    code.append("      delay(10); // Wait for the button to be released")
+    code.append("    }")
+    code.append("    return true;")
+    code.append("  }")
+    code.append("  return false;")
+    code.append("}")
+    code.append("")
+    code.append("bool playPhrase(uint16_t phrase) {")
+    code.append("  uint16_t end = pgm_read_word(&phraseStart[phrase + 1]);")
+    code.append("  for (uint16_t i = pgm_read_word(&phraseStart[phrase]); i < end; i++) {")
+    read_index = "pgm_read_byte" if index_type == "uint8_t" else "pgm_read_word"
+    code.append(f"    uint16_t note = {read_index}(&phraseNotes[i]);")
+    code.append("    uint16_t frequency = pgm_read_word(&noteFrequencies[note]);")
+    code.append("    uint16_t duration = pgm_read_word(&noteDurations[note]);")
+    code.append("    if (frequency == 0) {")
+    code.append("      delay(duration);")
+    code.append("    } else {")
+    code.append("      tone(BUZZER_PIN, frequency, duration);")
+    code.append("      delay(duration);")
+    code.append("      noTone(BUZZER_PIN);")
+    code.append("    }")
+    code.append("    if (songSelected()) {")
+    code.append("      return false;")
+    code.append("    }")
+    code.append("  }")
+    code.append("  return true;")
+    code.append("}")
+    code.append("")
+    code.append("bool playSong(int song) {")
+    code.append("  // Returns false when another song was selected")
+    code.append("  uint16_t end = pgm_read_word(&songStart[song + 1]);")
+    code.append("  for (uint16_t i = pgm_read_word(&songStart[song]); i < end; i++) {")
+    code.append("    if (!playPhrase(pgm_read_word(&playOrder[i]))) {")
+    code.append("      return false;")
+    code.append("    }")
+    code.append("  }")
+    code.append("  return true;")
+    code.append("}")
+
+    return "\n".join(code)
+
+
+EXPORT_TYPES = ["single", "linux", "windows", "arduino", "arduino-arrays", "arduino-millis", "arduino-phrases", "arduino-sd", "arduino-auto"]
+ARDUINO_EXPORT_TYPES = ["arduino", "arduino-arrays", "arduino-millis", "arduino-phrases", "arduino-sd", "arduino-auto"]
+
+# Same extensions the GUI suggests when saving
+EXPORT_EXTENSIONS = {
+    "single": ".txt",
+    "linux": ".sh",
+    "windows": ".bat",
+    "arduino": ".ino",
+    "arduino-arrays": ".ino",
+    "arduino-millis": ".ino",
+    "arduino-phrases": ".ino",
+    "arduino-sd": ".ino",
+    "arduino-auto": ".ino",
+}
+
+
+# User-defined exports: a template file per export type, see templates/*.tpl
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+TEMPLATE_SECTIONS = ("info", "header", "note", "rest", "footer")
+TEMPLATE_NOTE_FIELDS = ("index", "note", "freq", "hz", "ms", "length", "seconds")
+TEMPLATE_REST_FIELDS = ("index", "ms", "length", "seconds")
+TEMPLATE_PAGE_FIELDS = ("name", "count")
+TEMPLATE_FIELD_RE = re.compile(r"\$\$|\$\{(\w+)(?::([^}]*))?\}")
+
+EXPORT_TEMPLATES = {}
+
+
+def template_parts(text, allowed, path):
+    # Split "tone(${hz}, ${ms});" into literal strings and (field, spec) pairs
+    parts = []
+    used = set()
+    pos = 0
+    for match in TEMPLATE_FIELD_RE.finditer(text):
+        literal = text[pos:match.start()] + ("$" if match.group(0) == "$$" else "")
+        if literal:
+            parts.append(literal)
+        pos = match.end()
+        field, spec = match.group(1), match.group(2)
+        if field is None:
+            continue
+        if field not in allowed:
+            raise ValueError(f"{path}: unknown field '${{{field}}}' (allowed here: {', '.join(allowed)})")
+        used.add(field)
+        parts.append((field, spec))
+    if text[pos:]:
+        parts.append(text[pos:])
+    return parts, used
+
+
+def fill_template(parts, values):
+    # Join the literals with the formatted field values
+    out = []
+    for part in parts:
+        if isinstance(part, str):
+            out.append(part)
+        elif part[1]:
+            out.append(format(values[part[0]], part[1]))
+        else:
+            out.append(str(values[part[0]]))
+    return "".join(out)
+
+
+class ExportTemplate:
+    """An export type defined by a template file, parsed once into literals and fields."""
+
+    def __init__(self, name, sections, path=""):
+        info = {}
+        for line in sections.get("info", "").splitlines():
+            if line.strip() and not line.lstrip().startswith("#"):
+                key, _, value = line.partition("=")
+                info[key.strip()] = value.strip()
+        self.name = name
+        self.path = path
+        self.description = info.get("description", name)
+        self.extension = info.get("extension", ".txt")
+        self.separator = info.get("separator", "\\n").encode().decode("unicode_escape")
+
+        self.header, _ = template_parts(sections.get("header", ""), TEMPLATE_PAGE_FIELDS, path)
+        self.footer, _ = template_parts(sections.get("footer", ""), TEMPLATE_PAGE_FIELDS, path)
+        self.note, used = template_parts(sections.get("note", ""), TEMPLATE_NOTE_FIELDS, path)
+        # No rest section: rests are left out
+        self.rest = None
+        if "rest" in sections:
+            self.rest, rest_used = template_parts(sections["rest"], TEMPLATE_REST_FIELDS, path)
+            used |= rest_used
+        self.fields = used
+
+    def emit(self, notes, speed):
+        # One entry per note or rest, in order
+        entries = []
+        index = 0
+        for note, freq, seconds in notes:
+            if seconds == 0:
+                continue
+            if freq == 1:
+                if self.rest is None:
+                    continue
+                parts = self.rest
+                values = {"index": index}
+            else:
+                parts = self.note
+                values = {"index": index, "note": note, "freq": freq, "hz": int(freq)}
+            values["ms"] = int(seconds * speed)
+            values["length"] = seconds * speed
+            values["seconds"] = seconds
+            entries.append(fill_template(parts, values))
+            index += 1
+        return entries
+
+    def render(self, notes, speed):
+        entries = self.emit(notes, speed)
+        page = {"name": self.name, "count": len(entries)}
+        return "\n".join([fill_template(self.header, page), self.separator.join(entries), fill_template(self.footer, page)])
+
+
+def parse_template(text):
+    # Split a template file into its [section] bodies
+    sections = {}
+    current = None
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("[") and stripped.endswith("]") and stripped[1:-1] in TEMPLATE_SECTIONS:
+            if current is not None:
+                sections[current] = "\n".join(lines).strip("\n")
+            current = stripped[1:-1]
+            lines = []
+        elif current is not None:
+            lines.append(line)
+    if current is not None:
+        sections[current] = "\n".join(lines).strip("\n")
+    return sections
+
+
+def load_templates(directory=TEMPLATE_DIR, quiet=False):
+    # Register every <name>.tpl in directory as an export type
+    if not os.path.isdir(directory):
+        return EXPORT_TEMPLATES
+    for filename in sorted(os.listdir(directory)):
+        name, ext = os.path.splitext(filename)
+        if ext != ".tpl":
+            continue
+        path = os.path.join(directory, filename)
+        if name in EXPORT_TYPES:
+            if not quiet:
+                print(f"⚠ Warning: template '{path}' has the name of a built-in export, skipped")
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                template = ExportTemplate(name, parse_template(f.read()), path)
+        except (OSError, ValueError) as e:
+            if not quiet:
+                print(f"⚠ Warning: could not load template: {e}")
+            continue
+        EXPORT_TEMPLATES[name] = template
+        EXPORT_EXTENSIONS[name] = template.extension
+    return EXPORT_TEMPLATES
+
+
+def format_output(notes, speed, export_type, board=DEFAULT_BOARD):
+    if export_type == "single":
+        return format_single_line(notes, speed)
+    elif export_type == "linux":
+        return format_multi_line(notes, speed, "\\")
+    elif export_type == "windows":
+        return format_multi_line(notes, speed, "^")
+    elif export_type == "arduino":
+        return format_arduino_sequential(notes, speed)
+    elif export_type == "arduino-arrays":
+        return format_arduino_arrays(notes, speed)
+    elif export_type == "arduino-millis":
+        return format_arduino_nonblocking(notes, speed)
+    elif export_type == "arduino-phrases":
+        return format_arduino_phrases(notes, speed)
+    elif export_type == "arduino-sd":
+        return format_arduino_sd(notes, speed)
+    elif export_type == "arduino-auto":
+        return format_arduino_auto(notes, speed, board)
+    elif export_type in EXPORT_TEMPLATES:
+        return EXPORT_TEMPLATES[export_type].render(notes, speed)
+    else:
+        return format_single_line(notes, speed)
+
+
+def extract_variants(midi_path, reverses, target_channel=0, merge=0, extract_fn=extract_monophonic_notes, voices=None, prefer="high", stats=None, start=None, end=None):
+    # Parse once, then run each priority variant once. Returns {reverse: [timeline per voice]}
+    mid = open_midi(midi_path)
+    variants = {}
+    for reverse in reverses:
+        if voices:
+            variants[reverse] = extract_polyphonic_notes(mid, voices, target_channel, merge, reverse, prefer, stats)
+        else:
+            variants[reverse] = [extract_fn(mid, target_channel, merge, reverse, stats, start, end)]
+    return variants
+
+
+def matrix_filename(base, export_type, reverse, speed):
+    # song, arduino, 1, 1.5 -> song_arduino_reverse_1.5x.ino
+    priority = "reverse" if reverse else "normal"
+    return f"{base}_{export_type}_{priority}_{speed:g}x{EXPORT_EXTENSIONS.get(export_type, '.txt')}"
+
+
+def voice_path(path, voice):
+    # song.ino -> song_voice1.ino
+    base, ext = os.path.splitext(path)
+    return f"{base}_voice{voice + 1}{ext}"
+
+
+def timeline_output_path(path, midi_path, multiple_files, reverse, multiple_variants, voice, multiple_voices):
+    # With several input files, path is a folder that gets one <song>.m2bt per file
+    if multiple_files:
+        base = os.path.splitext(os.path.basename(midi_path))[0]
+        path = os.path.join(path, base + ".m2bt")
+    if multiple_variants:
+        base, ext = os.path.splitext(path)
+        path = f"{base}_{'reverse' if reverse else 'normal'}{ext}"
+    if multiple_voices:
+        path = voice_path(path, voice)
+    return path
+
+
+# Archives: MIDI members are read straight out of zip/tar inputs, and batch outputs
+# can go into a zip/tar instead of a folder, laid out like examples/undertale
+MIDI_EXTENSIONS = (".mid", ".midi")
+TAR_SUFFIXES = {".tar": "", ".tar.gz": "gz", ".tgz": "gz", ".tar.bz2": "bz2", ".tar.xz": "xz", ".tar.zst": "zst", ".tzst": "zst"}
+
+
+def archive_kind(path):
+    # ("zip", None), ("tar", compression) or (None, None) for anything that isn't an archive
+    lower = path.lower()
+    if lower.endswith(".zip"):
+        return "zip", None
+    for suffix, compression in TAR_SUFFIXES.items():
+        if lower.endswith(suffix):
+            return "tar", compression
+    return None, None
+
+
+def zstd_module():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd archives need the zstandard package (pip install zstandard)")
+    return zstandard
+
+
+def iter_archive_midis(path):
+    """Yield (member name, bytes) for every MIDI file in a zip or tar archive,
+    in archive order, without extracting anything to disk. Tar archives are
+    read as a stream, one member at a time."""
+    kind, compression = archive_kind(path)
+    if kind == "zip":
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(MIDI_EXTENSIONS):
+                    yield info.filename, archive.read(info)
+        return
+
+    with open(path, "rb") as f:
+        if compression == "zst":
+            source, mode = zstd_module().ZstdDecompressor().stream_reader(f), "r|"
+        else:
+            source, mode = f, "r|*"
+        with tarfile.open(fileobj=source, mode=mode) as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(MIDI_EXTENSIONS):
+                    yield member.name, archive.extractfile(member).read()
+
+
+def iter_inputs(paths):
+    # (name, source, member) per input: plain files are their own source, archive
+    # members come as bytes. member is the name inside the archive (the file name for plain files).
+    for path in paths:
+        if archive_kind(path)[0]:
+            for member, data in iter_archive_midis(path):
+                yield f"{path}:{member}", data, member
+        else:
+            yield path, path, os.path.basename(path)
+
+
+def archive_output_name(member, export_type, reverse, speed, multiple):
+    """Where an output goes in an output archive, mirroring examples/undertale:
+    album/Original-MIDIs/song.mid -> album/Converted-high/song.txt (Converted-low
+    for normal priority). With several exports or speeds the name says which."""
+    folder, name = posixpath.split(member)
+    if posixpath.basename(folder) == "Original-MIDIs":
+        folder = posixpath.dirname(folder)
+    base = os.path.splitext(name)[0]
+    ext = EXPORT_EXTENSIONS.get(export_type, ".txt")
+    name = f"{base}_{export_type}_{speed:g}x{ext}" if multiple else f"{base}{ext}"
+    return posixpath.join(folder, "Converted-high" if reverse else "Converted-low", name)
+
+
+class ArchiveWriter:
+    """Write outputs as members of a zip (deflated) or tar archive (plain, gz,
+    bz2, xz or zst). Tar members are streamed out as they are added."""
+
+    def __init__(self, path):
+        kind, compression = archive_kind(path)
+        self.path = path
+        self.count = 0
+        self.zip = self.tar = self.stream = None
+        if kind == "zip":
+            self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+            return
+        zstandard = zstd_module() if compression == "zst" else None
+        self.file = open(path, "wb")
+        try:
+            if zstandard:
+                self.stream = zstandard.ZstdCompressor().stream_writer(self.file)
+                self.tar = tarfile.open(fileobj=self.stream, mode="w|")
+            else:
+                self.tar = tarfile.open(fileobj=self.file, mode=f"w|{compression}")
+        except Exception:
+            self.file.close()
+            raise
+
+    def write(self, name, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if self.zip is not None:
+            self.zip.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self.tar.addfile(info, io.BytesIO(data))
+        self.count += 1
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+            return
+        self.tar.close()
+        if self.stream is not None:
+            self.stream.close()
+        self.file.close()
+
+
+# Sharded batch runs: every host is given the same inputs and -shard i/N, converts
+# the inputs whose content hash falls into its shard and writes a manifest. No
+# coordinator is needed, -mergeshards checks the manifests fit together afterwards.
+MANIFEST_FORMAT = "midi2beep-manifest"
+MANIFEST_VERSION = 1
+
+
+def parse_shard(text):
+    # "2/4" -> (2, 4), shards are numbered from 1
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid shard '{text}' (use i/N, e.g. 2/4)")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"invalid shard '{text}' (i goes from 1 to N)")
+    return index, count
+
+
+def content_sha256(source):
+    # source is a path or the bytes of an archive member
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+    else:
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def shard_of(digest, count):
+    # The hash is uniform, so its first 64 bits spread inputs evenly. It only depends
+    # on the content: paths, file order and the host don't change where a file goes.
+    return int(digest[:16], 16) % count + 1
+
+
+def input_set_digest(digests):
+    # Identifies the whole input set without listing it
+    return hashlib.sha256("\n".join(sorted(set(digests))).encode()).hexdigest()
+
+
+class ShardManifest:
+    """What one shard converted: its inputs with their content hashes, the
+    parameters, every output's hash and how long each input took."""
+
+    def __init__(self, shard, parameters, path, out_dir, archive=None):
+        self.index, self.count = shard
+        self.parameters = parameters
+        self.path = path
+        self.out_dir = out_dir
+        self.archive = archive
+        self.digests = []
+        self.inputs = []
+        self.started = time.time()
+
+    def claim(self, name, source):
+        # Every shard hashes every input, the ones in other shards are only counted
+        digest = content_sha256(source)
+        self.digests.append(digest)
+        if shard_of(digest, self.count) != self.index:
+            return None
+        record = {"name": name, "sha256": digest, "outputs": {}, "seconds": 0.0}
+        self.inputs.append(record)
+        return record
+
+    @staticmethod
+    def add_output(record, name, source):
+        # source is the written file, or the bytes of an archive member
+        record["outputs"][name] = content_sha256(source)
+
+    def write(self):
+        folder = os.path.dirname(os.path.abspath(self.path))
+        manifest = {
+            "format": MANIFEST_FORMAT,
+            "version": MANIFEST_VERSION,
+            "shard": {"index": self.index, "count": self.count},
+            "host": socket.gethostname(),
+            "converter": content_sha256(os.path.abspath(__file__)),
+            "parameters": self.parameters,
+            "input_count": len(set(self.digests)),
+            "input_set": input_set_digest(self.digests),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started)),
+            "seconds": round(time.time() - self.started, 3),
+            "inputs": self.inputs,
+        }
+        # Output paths are kept relative to the manifest, so a folder can be moved as a whole
+        if self.archive:
+            manifest["archive"] = {"path": os.path.relpath(os.path.abspath(self.archive), folder),
+                                   "sha256": content_sha256(self.archive)}
+        else:
+            manifest["output_dir"] = os.path.relpath(os.path.abspath(self.out_dir), folder)
+        with open(self.path, "w") as f:
+            json.dump(manifest, f, indent=1)
+            f.write("\n")
+
+
+def merge_manifests(paths):
+    """Combine shard manifests into one, returns (merged, problems). Problems are
+    missing or duplicate shards, shards run with other parameters, code or inputs,
+    inputs in the wrong shard or not converted, and outputs that are missing,
+    changed or written by two inputs."""
+    problems = []
+    manifests = []
+    for path in paths:
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            problems.append(f"{path}: can't read manifest ({e})")
+            continue
+        if manifest.get("format") != MANIFEST_FORMAT or manifest.get("version") != MANIFEST_VERSION:
+            problems.append(f"{path}: not a version {MANIFEST_VERSION} shard manifest")
+            continue
+        manifests.append((path, manifest))
+    if not manifests:
+        return None, problems or ["no manifests given"]
+
+    first_path, first = manifests[0]
+    count = first["shard"]["count"]
+    for path, manifest in manifests[1:]:
+        for key, what in (("parameters", "parameters"), ("converter", "converter version"),
+                          ("input_set", "input files")):
+            if manifest[key] != first[key]:
+                problems.append(f"{path}: different {what} than {first_path}")
+        if manifest["shard"]["count"] != count:
+            problems.append(f"{path}: shard of {manifest['shard']['count']}, {first_path} is a shard of {count}")
+
+    seen = {}
+    for path, manifest in manifests:
+        index = manifest["shard"]["index"]
+        if index in seen:
+            problems.append(f"shard {index}/{count} appears twice ({seen[index]}, {path})")
+        seen[index] = path
+    for index in range(1, count + 1):
+        if index not in seen:
+            problems.append(f"shard {index}/{count} is missing")
+
+    inputs = []
+    outputs = {}
+    for path, manifest in manifests:
+        index = manifest["shard"]["index"]
+        folder = os.path.dirname(os.path.abspath(path))
+        if "archive" in manifest:
+            archive = os.path.join(folder, manifest["archive"]["path"])
+            if not os.path.isfile(archive):
+                problems.append(f"{path}: archive {archive} is missing")
+            elif content_sha256(archive) != manifest["archive"]["sha256"]:
+                problems.append(f"{path}: archive {archive} was changed")
+        for record in manifest["inputs"]:
+            if shard_of(record["sha256"], count) != index:
+                problems.append(f"{record['name']}: converted by shard {index}, belongs to shard {shard_of(record['sha256'], count)}")
+            if "error" in record:
+                problems.append(f"{record['name']}: failed in shard {index}/{count} ({record['error']})")
+            for name, digest in record["outputs"].items():
+                if name in outputs and outputs[name] != (digest, record["sha256"]):
+                    problems.append(f"{name}: written by two different inputs")
+                outputs[name] = (digest, record["sha256"])
+                if "archive" in manifest:
+                    continue  # Members are covered by the archive hash
+                output = os.path.normpath(os.path.join(folder, manifest["output_dir"], name))
+                if not os.path.isfile(output):
+                    problems.append(f"{output}: missing")
+                elif content_sha256(output) != digest:
+                    problems.append(f"{output}: changed since shard {index}/{count} wrote it")
+            inputs.append(dict(record, shard=index))
+
+    digests = [record["sha256"] for record in inputs]
+    if len(set(digests)) != first["input_count"] or input_set_digest(digests) != first["input_set"]:
+        problems.append(f"{len(set(digests))} of {first['input_count']} inputs were converted")
+
+    merged = {
+        "format": MANIFEST_FORMAT,
+        "version": MANIFEST_VERSION,
+        "shard_count": count,
+        "shards": [{"index": m["shard"]["index"], "host": m["host"], "started": m["started"],
+                    "seconds": m["seconds"], "inputs": len(m["inputs"]), "manifest": path}
+                   for path, m in sorted(manifests, key=lambda pm: pm[1]["shard"]["index"])],
+        "converter": first["converter"],
+        "parameters": first["parameters"],
+        "input_count": first["input_count"],
+        "input_set": first["input_set"],
+        "complete": not problems,
+        "inputs": sorted(inputs, key=lambda record: (record["name"], record["sha256"])),
+    }
+    return merged, problems
+
+
+def format_shard_summary(merged):
+    lines = []
+    for shard in merged["shards"]:
+        lines.append(f"Shard {shard['index']}/{merged['shard_count']} on {shard['host']}: "
+                     f"{shard['inputs']} inputs in {shard['seconds']:.1f} s")
+    seconds = [shard["seconds"] for shard in merged["shards"]]
+    if seconds and sum(seconds):
+        # How much longer the slowest host ran than an even split would have taken
+        lines.append(f"Slowest shard took {max(seconds) / (sum(seconds) / len(seconds)):.2f}x the average")
+    return "\n".join(lines)
+
+
+# Streaming pipeline: decode -> extract -> format -> write, each stage in its
+# own thread, connected by bounded queues so no stage runs far ahead
+PIPELINE_QUEUE_SIZE = 16  # chunks waiting between two stages
+PIPELINE_CHUNK = 256      # items per chunk
+
+
+def read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+def read_midi_chunks(data):
+    # Only reads the chunk headers: (ticks_per_beat, [(start, end) of each track])
+    if len(data) < 14 or data[:4] != b"MThd":
+        raise OSError("MThd not found. Probably not a MIDI file")
+    size = struct.unpack_from(">L", data, 4)[0]
+    _, num_tracks, ticks_per_beat = struct.unpack_from(">hhh", data, 8)
+    pos = 8 + size
+    tracks = []
+    for _ in range(num_tracks):
+        if pos + 8 > len(data):
+            raise EOFError
+        name, size = struct.unpack_from(">4sL", data, pos)
+        if name != b"MTrk":
+            raise OSError("no MTrk header at start of track")
+        if pos + 8 + size > len(data):
+            raise EOFError("track runs past the end of the file")
+        tracks.append((pos + 8, pos + 8 + size))
+        pos += 8 + size
+    return ticks_per_beat, tracks
+
+
+def iter_track_events(data, pos, end):
+    # Decodes one track lazily into (abs_tick, msg), the same messages mido.MidiFile would give
+    abs_tick = 0
+    last_status = None
+    while pos < end:
+        delta, pos = read_varlen(data, pos)
+        abs_tick += delta
+        status = data[pos]
+        if status < 0x80:
+            # Running status, the byte we peeked at is the first data byte
+            if last_status is None:
+                raise OSError("running status without last_status")
+            status = last_status
+        else:
+            pos += 1
+            if status != 0xFF:
+                # Meta messages don't set running status
+                last_status = status
+
+        if status == 0xFF:
+            meta_type = data[pos]
+            length, pos = read_varlen(data, pos + 1)
+            msg = build_meta_message(meta_type, list(data[pos:pos + length]), delta)
+        elif status in (0xF0, 0xF7):
+            length, pos = read_varlen(data, pos)
+            payload = list(data[pos:pos + length])
+            if payload and payload[0] == 0xF0:
+                payload = payload[1:]
+            if payload and payload[-1] == 0xF7:
+                payload = payload[:-1]
+            msg = mido.Message("sysex", data=payload, time=delta)
+        else:
+            if status not in SPEC_BY_STATUS:
+                raise OSError(f"undefined status byte 0x{status:02x}")
+            length = SPEC_BY_STATUS[status]["length"] - 1
+            payload = list(data[pos:pos + length])
+            if any(byte > 127 for byte in payload):
+                raise OSError("data byte must be in range 0..127")
+            msg = mido.Message.from_bytes([status] + payload, time=delta)
+        pos += length
+        yield abs_tick, msg
+
+
+def stream_monophonic_schedule(events, ticks_per_beat, target_channel=0, merge=0, stats=None):
+    """The extract_monophonic_notes loop as a generator over sorted events.
+
+    Yields (entry, start, end, tick) as soon as each timeline entry is known:
+    the entry exactly as the float loop builds it, its exact start and end as
+    integer sums of ticks × tempo (µs × ticks_per_beat, so nothing is rounded)
+    and the tick it starts on.
+    """
+    current_tick = 0
+    current_time = 0.0
+    current_exact = 0
+    current_tempo = 500_000  # µs per beat = 120 BPM
+    last_event_time = 0.0
+    last_event_exact = 0
+    last_event_tick = 0
+    active_note = None
+    active_note_start_time = 0.0
+    active_note_start_exact = 0
+    active_note_start_tick = 0
+
+    for abs_tick, msg in events:
+        current_time += mido.tick2second(abs_tick - current_tick, ticks_per_beat, current_tempo)
+        current_exact += (abs_tick - current_tick) * current_tempo
+        current_tick = abs_tick
+
+        if not merge and hasattr(msg, "channel") and target_channel is not None and msg.channel != target_channel:
+            continue
+
+        if msg.type == "set_tempo":
+            current_tempo = msg.tempo
+            continue
+
+        note_on = msg.type == "note_on" and msg.velocity > 0
+        note_off = msg.type == "note_off" or (msg.type == "note_on" and msg.velocity == 0)
+        if (note_on and active_note is not None) or (note_off and active_note == msg.note):
+            if note_on and stats is not None:
+                stats["cut_notes"] = stats.get("cut_notes", 0) + 1
+            if active_note_start_time > last_event_time:
+                yield ((0, 1, round(active_note_start_time - last_event_time, 6)),
+                       last_event_exact, active_note_start_exact, last_event_tick)
+            yield ((active_note, round(note_to_freq(active_note), 2), round(current_time - active_note_start_time, 6)),
+                   active_note_start_exact, current_exact, active_note_start_tick)
+            last_event_time = current_time
+            last_event_exact = current_exact
+            last_event_tick = current_tick
+            active_note = None
+        if note_on:
+            active_note = msg.note
+            active_note_start_time = current_time
+            active_note_start_exact = current_exact
+            active_note_start_tick = current_tick
+
+    # If any note was left hanging, close it at end of track
+    if active_note is not None:
+        if active_note_start_time > last_event_time:
+            yield ((0, 1, round(active_note_start_time - last_event_time, 6)),
+                   last_event_exact, active_note_start_exact, last_event_tick)
+        yield ((active_note, round(note_to_freq(active_note), 2), round(current_time - active_note_start_time, 6)),
+               active_note_start_exact, current_exact, active_note_start_tick)
+
+
+def stream_monophonic_notes(events, ticks_per_beat, target_channel=0, merge=0, stats=None):
+    # Timeline entries come out as soon as each note ends
+    for entry, _, _, _ in stream_monophonic_schedule(events, ticks_per_beat, target_channel, merge, stats):
+        yield entry
+
+
+def stream_output(notes, speed, export_type, board=DEFAULT_BOARD):
+    """Yield the text of format_output piece by piece.
+
+    The beep commands and the sequential Arduino sketch can be written note
+    by note. The other exports need the whole timeline first (array sizes,
+    phrase search, note count in templates), so they come out in one piece.
+    """
+    if export_type == "single":
+        yield "beep"
+        for n, f, d in notes:
+            if d == 0:
+                continue
+            yield f" -D {d * speed}" if f == 1 else f" -n -f {f} -l {d * speed}"
+    elif export_type in ("linux", "windows"):
+        # Hold back one line, the last one loses its continuation character
+        continuation_char = "\\" if export_type == "linux" else "^"
+        line = f"beep {continuation_char}"
+        for n, f, d in notes:
+            if d == 0:
+                continue
+            yield line + "\n"
+            if f == 1:
+                line = f"  -D {d * speed} {continuation_char}"
+            else:
+                line = f"  -n -f {f} -l {d * speed} {continuation_char}"
+        yield line.rstrip(f" {continuation_char}")
+    elif export_type == "arduino":
+        # The header is everything up to "void playMelody() {"
+        yield format_arduino_sequential([], speed)[:-2]
+        for n, f, d in notes:
+            if d == 0:
+                continue
+            duration_ms = int(d * speed)
+            if f == 1:
+                yield f"\n  delay({duration_ms});"
+            else:
+                yield f"\n  tone(BUZZER_PIN, {int(f)}, {duration_ms});\n  delay({duration_ms});\n  noTone(BUZZER_PIN);"
+        yield "\n}"
+    else:
+        yield format_output(list(notes), speed, export_type, board)
+
+
+def pipeline_stage(items, out_queue, stop, chunk_size=PIPELINE_CHUNK):
+    # Run an iterator in its own thread and pass its items on in chunks.
+    # None marks the end, an exception is passed on for the next stage to raise.
+    def put(chunk):
+        while not stop.is_set():
+            try:
+                out_queue.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run():
+        chunk = []
+        try:
+            for item in items:
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    if not put(chunk):
+                        return
+                    chunk = []
+            if chunk and not put(chunk):
+                return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def drain_queue(in_queue, stop, on_chunk=None):
+    # The receiving end of pipeline_stage
+    while not stop.is_set():
+        try:
+            chunk = in_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if chunk is None:
+            return
+        if isinstance(chunk, Exception):
+            raise chunk
+        if on_chunk:
+            on_chunk(chunk)
+        yield from chunk
+
+
+def convert_pipelined(midi_path, output_path, export_type="single", speed=1000, target_channel=0, merge=0, reverse=0, old_logic=False, metrics=None, board=DEFAULT_BOARD):
+    """Convert one MIDI file straight to output_path with every stage running
+    at once. The output is the same as format_output(extract_...(...)).
+
+    Returns a summary dict: events, notes, bytes, first_byte and seconds
+    (time until the first and the last byte were written). arduino-sd also
+    writes its stream file next to output_path, named in summary["stream"].
+    """
+    start = time.perf_counter()
+    summary = {"events": 0, "notes": 0, "bytes": 0, "first_byte": None, "stream": None}
+    stats = metrics.stats if metrics else None
+    stop = threading.Event()
+    # The sketch only holds the frequency table, the notes go into the .bin afterwards
+    sd_notes = [] if export_type == "arduino-sd" else None
+
+    def on_events(chunk):
+        summary["events"] += len(chunk)
+
+    def on_notes(chunk):
+        summary["notes"] += len(chunk)
+        if metrics:
+            metrics.count_timeline(chunk)
+        if sd_notes is not None:
+            sd_notes.extend(chunk)
+
+    events_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+    notes_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+    text_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+
+    stages = []
+    with open(midi_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        try:
+            ticks_per_beat, tracks = read_midi_chunks(data)
+            events = merge_track_events([iter_track_events(data, lo, hi) for lo, hi in tracks], reverse, old_logic)
+            stages.append(pipeline_stage(events, events_queue, stop))
+            notes = stream_monophonic_notes(drain_queue(events_queue, stop, on_events), ticks_per_beat, target_channel, merge, stats)
+            stages.append(pipeline_stage(notes, notes_queue, stop))
+            text = stream_output(drain_queue(notes_queue, stop, on_notes), speed, export_type, board)
+            stages.append(pipeline_stage(text, text_queue, stop))
+
+            # Writer: flush every chunk, so the file grows while the rest is still converting
+            with open(output_path, "w") as out:
+                for chunk in iter(text_queue.get, None):
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    text = "".join(chunk)
+                    out.write(text)
+                    out.flush()
+                    if summary["first_byte"] is None:
+                        summary["first_byte"] = time.perf_counter() - start
+                    summary["bytes"] += len(text.encode("utf-8"))
+                    if metrics:
+                        metrics.count_output(export_type, text)
+        finally:
+            # Unblock the stages if the writer stopped early, they must be done before the file is unmapped
+            stop.set()
+            for thread in stages:
+                thread.join()
+
+    if sd_notes is not None:
+        summary["stream"] = stream_path(output_path)
+        write_stream(sd_notes, speed, summary["stream"])
+    if metrics:
+        metrics.file_events.append(summary["events"])
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+DRIFT_BUCKETS = (1, 5, 20, 50)  # ms, bars are counted by the largest drift of any entry starting in them
+
+
+def track_events(mid):
+    # [(abs_tick, msg)] per track, for merge_track_events
+    tracks = []
+    for track in mid.tracks:
+        tick = 0
+        events = []
+        for msg in track:
+            tick += msg.time
+            events.append((tick, msg))
+        tracks.append(events)
+    return tracks
+
+
+def bar_starts(signatures, ticks_per_beat, end_tick):
+    # Tick of every bar line up to end_tick, 4/4 until the first time signature.
+    # A time signature change starts a new bar.
+    changes = [(0, 4, 4)] + signatures
+    starts = []
+    for i, (tick, numerator, denominator) in enumerate(changes):
+        bar_ticks = max(ticks_per_beat * 4 * numerator / denominator, 1)
+        next_tick = changes[i + 1][0] if i + 1 < len(changes) else end_tick + 1
+        while tick < next_tick:
+            starts.append(tick)
+            tick += bar_ticks
+    return starts
+
+
+def export_durations(notes, speed, export_type):
+    """The milliseconds each timeline entry lasts in an export's output.
+
+    Arduino sketches (and templates using ${ms}) truncate to whole
+    milliseconds, the beep commands print the float. Entries an export leaves
+    out count as 0 ms, so the list lines up with the timeline.
+    """
+    template = EXPORT_TEMPLATES.get(export_type)
+    if export_type in ARDUINO_EXPORT_TYPES or (template and "ms" in template.fields and not template.fields & {"length", "seconds"}):
+        return [int(d * speed) for _, _, d in notes]
+    return [d * speed for _, _, d in notes]
+
+
+def timing_drift(midi_path, speed=1000, export_types=("single",), target_channel=0, merge=0, reverse=0, old_logic=False):
+    """Compare the schedule each export implies with the exact one from the ticks.
+
+    The timeline is extracted once; next to every entry the exact start and
+    end come from integer tick × tempo sums. An export's schedule is the
+    running sum of the durations it writes (export_durations), so drift is
+    how far a note starts from where the MIDI file puts it. Returns a dict
+    with the song totals and, per export type, the length, max and final
+    drift, the final drift split by cause and a histogram of bars by drift.
+    """
+    mid = open_midi(midi_path)
+    tracks = track_events(mid)
+    schedule = list(stream_monophonic_schedule(merge_track_events(tracks, reverse, old_logic), mid.ticks_per_beat, target_channel, merge))
+    notes = [entry for entry, _, _, _ in schedule]
+
+    # Exact times are µs × ticks_per_beat, one division turns them into ms at this speed
+    scale = speed / (mid.ticks_per_beat * 1e6)
+    exact_starts = [start * scale for _, start, _, _ in schedule]
+    exact_length = schedule[-1][2] * scale if schedule else 0.0
+    exact_durations = [(end - start) * scale for _, start, end, _ in schedule]
+
+    signatures = sorted((tick, msg.numerator, msg.denominator) for events in tracks for tick, msg in events if msg.type == "time_signature")
+    end_tick = max((events[-1][0] for events in tracks if events), default=0)
+    bars = bar_starts(signatures, mid.ticks_per_beat, end_tick)
+    entry_bars = [bisect.bisect_right(bars, tick) - 1 for _, _, _, tick in schedule]
+
+    # Timeline rounding (float sums, 6 decimals) and dropped zero-length entries are the same for every export
+    rounding = sum(d * speed - exact for (_, _, d), exact in zip(notes, exact_durations) if d)
+    dropped = 0.0 - sum(exact for (_, _, d), exact in zip(notes, exact_durations) if not d)
+
+    report = {"entries": len(notes), "bars": len(bars), "length": exact_length,
+              "dropped_entries": sum(1 for (_, _, d), exact in zip(notes, exact_durations) if not d and exact),
+              "exports": {}}
+    for export_type in export_types:
+        durations = export_durations(notes, speed, export_type)
+        bar_drift = {}
+        implied = 0
+        max_drift = 0.0
+        for duration, exact_start, bar in zip(durations, exact_starts, entry_bars):
+            drift = abs(implied - exact_start)
+            max_drift = max(max_drift, drift)
+            bar_drift[bar] = max(bar_drift.get(bar, 0.0), drift)
+            implied += duration
+        drift = implied - exact_length
+        max_drift = max(max_drift, abs(drift))
+
+        histogram = [0] * (len(DRIFT_BUCKETS) + 1)
+        for value in bar_drift.values():
+            histogram[bisect.bisect_right(DRIFT_BUCKETS, value)] += 1
+        report["exports"][export_type] = {
+            "length": implied,
+            "max_drift": max_drift,
+            "final_drift": drift,
+            "rounding": rounding,
+            "dropped": dropped,
+            "truncation": drift - rounding - dropped,
+            "histogram": histogram,
+        }
+    return report
+
+
+def format_drift_report(name, report):
+    labels = [f"<{DRIFT_BUCKETS[0]}"] + [f"{lo}-{hi}" for lo, hi in zip(DRIFT_BUCKETS, DRIFT_BUCKETS[1:])] + [f">={DRIFT_BUCKETS[-1]}"]
+    lines = [f"{name}: {report['entries']} notes/events, {report['bars']} bars, exact length {report['length']:.3f} ms"
+             + (f", {report['dropped_entries']} zero-length entries dropped" if report["dropped_entries"] else "")]
+    lines.append(f"  {'export':<16}{'length ms':>13}{'max drift':>11}{'final':>10}{'rounding':>10}{'dropped':>9}{'truncation':>11}"
+                 f"   bars by max drift (ms) {' '.join(f'{label:>5}' for label in labels)}")
+    for export_type, r in report["exports"].items():
+        lines.append(f"  {export_type:<16}{r['length']:>13.3f}{r['max_drift']:>11.3f}{r['final_drift']:>+10.3f}{r['rounding']:>+10.3f}"
+                     f"{r['dropped']:>+9.3f}{r['truncation']:>+11.3f}   {'':23}{' '.join(f'{count:>5}' for count in r['histogram'])}")
+    return "\n".join(lines)
+
+
+class RawMidiParser:
+    # Turns a raw MIDI byte stream (as sent over a cable or written into a FIFO)
+    # into channel messages. Unlike mido.Parser it understands running status.
+    def __init__(self):
+        self.status = None
+        self.data = []
+
+    def feed(self, data):
+        messages = []
+        for byte in data:
+            if byte >= 0xF8:
+                continue  # Real-time bytes (clock etc.) can come anywhere, even inside a message
+            if byte >= 0x80:
+                # Channel messages start running status, SysEx and system common end it
+                self.status = byte if byte < 0xF0 else None
+                self.data = []
+                continue
+            if self.status is None:
+                continue  # SysEx payload, system common data or a stray byte
+            self.data.append(byte)
+            if len(self.data) == SPEC_BY_STATUS[self.status]["length"] - 1:
+                messages.append(mido.Message.from_bytes([self.status] + self.data))
+                self.data = []
+        return messages
+
+
+class LiveMonophonic:
+    # The extract_monophonic_notes logic run one read at a time on live input.
+    # Messages that arrive in the same read count as simultaneous and are ordered
+    # like events on one tick, so channel priority works the same way.
+    def __init__(self, target_channel=0, merge=0, reverse=0, old_logic=False, stats=None):
+        self.target_channel = target_channel
+        self.merge = merge
+        self.reverse = reverse
+        self.old_logic = old_logic
+        self.stats = stats
+        self.timeline = []
+        self.last_event_time = 0.0
+        self.active_note = None
+        self.active_note_start_time = 0.0
+
+    def order(self, messages):
+        if self.old_logic:
+            return messages[::-1] if self.reverse else messages
+        if self.reverse:
+            return sorted(messages, key=lambda msg: getattr(msg, 'channel', -1))
+        return sorted(messages, key=lambda msg: -getattr(msg, 'channel', 999))
+
+    def end_note(self, now):
+        if self.active_note_start_time > self.last_event_time:
+            self.timeline.append((0, 1, round(self.active_note_start_time - self.last_event_time, 6)))
+        self.timeline.append((self.active_note, round(note_to_freq(self.active_note), 2), round(now - self.active_note_start_time, 6)))
+        self.last_event_time = now
+        self.active_note = None
+
+    def feed(self, messages, now):
+        # Returns the tone changes: ("tone", freq) or ("noTone", None)
+        commands = []
+        for msg in self.order(messages):
+            if not self.merge and hasattr(msg, "channel") and self.target_channel is not None and msg.channel != self.target_channel:
+                continue
+            if msg.type == "note_on" and msg.velocity > 0:
+                if self.active_note is not None:
+                    if self.stats is not None:
+                        self.stats["cut_notes"] = self.stats.get("cut_notes", 0) + 1
+                    self.end_note(now)
+                self.active_note = msg.note
+                self.active_note_start_time = now
+                commands.append(("tone", round(note_to_freq(msg.note), 2)))
+            elif msg.type in ("note_off", "note_on") and self.active_note == msg.note:
+                self.end_note(now)
+                commands.append(("noTone", None))
+        return commands
+
+    def close(self, now):
+        # End of input: stop the note still playing
+        if self.active_note is None:
+            return []
+        self.end_note(now)
+        return [("noTone", None)]
+
+
+def run_live(source, target_channel=0, merge=0, reverse=0, old_logic=False, stats=None, out=None):
+    """Read raw MIDI bytes from a FIFO (or stdin for "-") until it is closed and
+    write a line per tone change: "<ms since start> tone <Hz>" or "<ms> noTone".
+
+    Returns (timeline, latencies): the notes played, timed by arrival, and
+    for every channel message the seconds from reading it to its tone change
+    being written.
+    """
+    out = out or sys.stdout
+    fd = sys.stdin.fileno() if source == "-" else os.open(source, os.O_RDONLY)
+    parser = RawMidiParser()
+    live = LiveMonophonic(target_channel, merge, reverse, old_logic, stats)
+    latencies = []
+    start = time.perf_counter()
+
+    def write(commands, now):
+        for command, freq in commands:
+            out.write(f"{now * 1000:.1f} tone {int(freq)}\n" if command == "tone" else f"{now * 1000:.1f} noTone\n")
+        out.flush()
+
+    try:
+        while True:
+            # os.read returns as soon as anything arrives, a buffered read would wait for more
+            data = os.read(fd, 4096)
+            arrived = time.perf_counter()
+            if not data:
+                break
+            messages = parser.feed(data)
+            if not messages:
+                continue
+            write(live.feed(messages, arrived - start), arrived - start)
+            latency = time.perf_counter() - arrived
+            latencies.extend([latency] * len(messages))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if source != "-":
+            os.close(fd)
+
+    now = time.perf_counter() - start
+    write(live.close(now), now)
+    return live.timeline, latencies
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return "no MIDI events received"
+    ordered = sorted(latencies)
+    percentile = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+    return (f"{len(ordered)} events, latency median {percentile(0.5):.3f} ms, "
+            f"99th percentile {percentile(0.99):.3f} ms, max {ordered[-1] * 1000:.3f} ms")
+
+
+# Serial streaming to a generic player firmware (format_serial_firmware).
+# Host frames:   SYNC_HOST, type, seq, record count, records (STREAM_RECORD), crc8
+# Device frames: SYNC_DEVICE, type, next expected seq, value, crc8
+# The value is the number of free buffer slots (READY/ACK/NAK) or underruns (DONE).
+SERIAL_BAUD = 115200
+SERIAL_SYNC_HOST = 0xA5
+SERIAL_SYNC_DEVICE = 0x5A
+SERIAL_DATA, SERIAL_END, SERIAL_HELLO = 0x01, 0x02, 0x03
+SERIAL_ACK, SERIAL_NAK, SERIAL_READY, SERIAL_DONE = 0x81, 0x82, 0x83, 0x84
+SERIAL_FRAME_RECORDS = 16    # records per frame
+SERIAL_WINDOW = 4            # frames sent before waiting for an ACK
+SERIAL_BUFFER_RECORDS = 128  # ring buffer in the firmware (384 bytes of SRAM)
+SERIAL_PREBUFFER = 64        # records buffered before playback starts (and after an underrun)
+SERIAL_CREDIT_EVERY = 8      # the firmware reports free slots after playing this many records
+SERIAL_RESEND_TIMEOUT = 0.1  # resend unacknowledged frames after this long without an answer
+SERIAL_HELLO_INTERVAL = 0.5
+
+
+def crc8(data):
+    # CRC-8, polynomial 0x07 (same loop as in the firmware)
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def serial_frame(frame_type, seq, records=b""):
+    body = bytes([frame_type, seq & 0xFF, len(records) // STREAM_RECORD.size]) + records
+    return bytes([SERIAL_SYNC_HOST]) + body + bytes([crc8(body)])
+
+
+class SerialLink:
+    # A serial port through pyserial if it is installed, otherwise a raw termios tty
+    # (Linux/macOS only, which also covers ptys)
+    def __init__(self, port, baud=SERIAL_BAUD):
+        try:
+            import serial
+        except ImportError:
+            serial = None
+        self.pending = bytearray()
+        if serial is not None:
+            self.serial = serial.Serial(port, baud, timeout=0)
+            self.fd = None
+        elif os.name == "posix":
+            import termios
+            import tty
+            self.serial = None
+            self.fd = os.open(port, os.O_RDWR | os.O_NOCTTY)
+            tty.setraw(self.fd)
+            if not hasattr(termios, f"B{baud}"):
+                os.close(self.fd)
+                raise ValueError(f"unsupported baud rate {baud} (install pyserial for non-standard rates)")
+            attrs = termios.tcgetattr(self.fd)
+            attrs[4] = attrs[5] = getattr(termios, f"B{baud}")
+            termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
+        else:
+            raise RuntimeError("pyserial is needed for serial ports on this system (pip install pyserial)")
+
+    def write(self, data):
+        if self.serial is not None:
+            self.serial.write(data)
+        else:
+            os.write(self.fd, data)
+
+    def read(self, timeout):
+        if self.serial is not None:
+            self.serial.timeout = timeout
+            data = self.serial.read(1)
+            return data + self.serial.read(self.serial.in_waiting) if data else b""
+        if select.select([self.fd], [], [], timeout)[0]:
+            return os.read(self.fd, 256)
+        return b""
+
+    def replies(self, timeout):
+        # Device frames received within timeout: [(type, seq, value)], bad ones are skipped
+        self.pending += self.read(timeout)
+        replies = []
+        while len(self.pending) >= 5:
+            if self.pending[0] != SERIAL_SYNC_DEVICE or crc8(self.pending[1:4]) != self.pending[4]:
+                del self.pending[0]
+                continue
+            replies.append(tuple(self.pending[1:4]))
+            del self.pending[:5]
+        return replies
+
+    def close(self):
+        if self.serial is not None:
+            self.serial.close()
+        else:
+            os.close(self.fd)
+
+
+def stream_serial(notes, speed, port, baud=SERIAL_BAUD, connect_timeout=5.0):
+    """Play notes on a board running the serial player firmware.
+
+    Frames go out in a sliding window (go-back-N on NAK or timeout), and never
+    more records than the firmware reported free, so its buffer can't overflow.
+    Returns a dict: frames, resends, underruns, seconds.
+    """
+    payload = encode_stream(notes, speed)[STREAM_HEADER.size:]
+    size = SERIAL_FRAME_RECORDS * STREAM_RECORD.size
+    frames = [(SERIAL_DATA, payload[i:i + size]) for i in range(0, len(payload), size)]
+    frames.append((SERIAL_END, b""))
+    stats = {"frames": len(frames), "resends": 0, "underruns": 0}
+
+    link = SerialLink(port, baud)
+    try:
+        # Opening the port resets most boards, so keep saying hello until the firmware answers
+        start = time.perf_counter()
+        free = None
+        while free is None:
+            if time.perf_counter() - start > connect_timeout:
+                raise TimeoutError(f"no answer from the player firmware on {port}")
+            link.write(serial_frame(SERIAL_HELLO, 0))
+            for reply_type, seq, value in link.replies(SERIAL_HELLO_INTERVAL):
+                if reply_type == SERIAL_READY:
+                    free = value
+
+        start = time.perf_counter()
+        base = 0        # oldest frame not acknowledged yet
+        next_frame = 0  # next frame to send
+        last_reply = time.perf_counter()
+        rewound = (None, 0.0)
+        while base < len(frames):
+            # Records still in flight were sent after the device counted its free slots
+            credits = free - sum(len(data) for _, data in frames[base:next_frame]) // STREAM_RECORD.size
+            while next_frame < len(frames) and next_frame - base < SERIAL_WINDOW:
+                frame_type, data = frames[next_frame]
+                if len(data) // STREAM_RECORD.size > credits:
+                    break
+                link.write(serial_frame(frame_type, next_frame, data))
+                credits -= len(data) // STREAM_RECORD.size
+                next_frame += 1
+
+            for reply_type, seq, value in link.replies(0.02):
+                # Sequence numbers are 8 bit, find the frame they belong to
+                index = base + ((seq - base) & 0xFF)
+                if index > next_frame:
+                    continue  # left over from before a rewind
+                last_reply = time.perf_counter()
+                if reply_type == SERIAL_ACK:
+                    base = max(base, index)
+                    free = value
+                elif reply_type == SERIAL_NAK:
+                    free = value
+                    base = max(base, index)
+                    # Every frame after a lost one is NAKed, only go back once for them
+                    if next_frame > index and not (rewound[0] == index and last_reply - rewound[1] < SERIAL_RESEND_TIMEOUT):
+                        stats["resends"] += next_frame - index
+                        next_frame = index
+                        rewound = (index, last_reply)
+
+            if base < next_frame and time.perf_counter() - last_reply > SERIAL_RESEND_TIMEOUT:
+                stats["resends"] += next_frame - base
+                next_frame = base
+                last_reply = time.perf_counter()
+
+        # Everything is buffered, wait for the song to finish
+        remaining = sum(d for n, f, d in notes) * speed / 1000
+        deadline = time.perf_counter() + remaining + connect_timeout
+        while time.perf_counter() < deadline:
+            done = [value for reply_type, seq, value in link.replies(0.1) if reply_type == SERIAL_DONE]
+            if done:
+                stats["underruns"] = done[0]
+                break
+        else:
+            raise TimeoutError("the player firmware didn't report the end of the song")
+        stats["seconds"] = time.perf_counter() - start
+        return stats
+    finally:
+        link.close()
+
+
+def format_serial_firmware():
+    # Generic player: the notes come over serial from stream_serial, so one upload plays every song
+    code = []
+    code.append("// Generated Arduino beep player firmware, songs are streamed over serial by midi2beep -serial")
+    code.append("// Connect buzzer to pin 8 (or change BUZZER_PIN)")
+    code.append("// Test it on a PC: g++ -x c++ player.ino -o player-sim && ./player-sim (prints the pty to stream to)")
+    code.append("")
+    code.append("#define BUZZER_PIN 8")
+    code.append(f"#define BAUD {SERIAL_BAUD}")
+    code.append(f"#define BUFFER_RECORDS {SERIAL_BUFFER_RECORDS} // Notes buffered ahead, {STREAM_RECORD.size} bytes each")
+    code.append(f"#define PREBUFFER {SERIAL_PREBUFFER} // Notes buffered before playback starts")
+    code.append(f"#define CREDIT_EVERY {SERIAL_CREDIT_EVERY} // Tell the host about free slots after this many notes")
+    code.append(f"#define MAX_FRAME_RECORDS {SERIAL_FRAME_RECORDS}")
+    code.append(f"#define RECORD_SIZE {STREAM_RECORD.size}")
+    code.append(f"#define REST {STREAM_REST}")
+    code.append(f"#define SYNC_HOST 0x{SERIAL_SYNC_HOST:02X}")
+    code.append(f"#define SYNC_DEVICE 0x{SERIAL_SYNC_DEVICE:02X}")
+    code.append(f"#define FRAME_DATA 0x{SERIAL_DATA:02X}")
+    code.append(f"#define FRAME_END 0x{SERIAL_END:02X}")
+    code.append(f"#define FRAME_HELLO 0x{SERIAL_HELLO:02X}")
+    code.append(f"#define REPLY_ACK 0x{SERIAL_ACK:02X}")
+    code.append(f"#define REPLY_NAK 0x{SERIAL_NAK:02X}")
+    code.append(f"#define REPLY_READY 0x{SERIAL_READY:02X}")
+    code.append(f"#define REPLY_DONE 0x{SERIAL_DONE:02X}")
+    code.append("")
+    code.append("#ifndef ARDUINO")
+    code.append("// Host build: the serial port is a pty, tone() prints and millis() is the real clock")
+    code.append("#include <cstdio>")
+    code.append("#include <cstdint>")
+    code.append("#include <cstdlib>")
+    code.append("#include <fcntl.h>")
+    code.append("#include <poll.h>")
+    code.append("#include <time.h>")
+    code.append("#include <unistd.h>")
+    code.append("#define PROGMEM")
+    code.append("#define pgm_read_word(addr) (*(addr))")
+    code.append("#define OUTPUT 1")
+    code.append("unsigned long millis() {")
+    code.append("  struct timespec now;")
+    code.append("  clock_gettime(CLOCK_MONOTONIC, &now);")
+    code.append("  return now.tv_sec * 1000UL + now.tv_nsec / 1000000;")
+    code.append("}")
+    code.append("void pinMode(int, int) {}")
+    code.append('void tone(int, unsigned int frequency) { printf("%lu tone %u\\n", millis(), frequency); fflush(stdout); }')
+    code.append('void noTone(int) { printf("%lu noTone\\n", millis()); fflush(stdout); }')
+    code.append("struct {")
+    code.append("  int fd = -1;")
+    code.append("  void begin(long) {}")
+    code.append("  int available() { struct pollfd p = {fd, POLLIN, 0}; return poll(&p, 1, 0) > 0 && (p.revents & POLLIN); }")
+    code.append("  int read() { uint8_t byte; return ::read(fd, &byte, 1) == 1 ? byte : -1; }")
+    code.append("  void write(const uint8_t *data, int size) { if (::write(fd, data, size) != size) {} }")
+    code.append("} Serial;")
+    code.append("#endif")
+    code.append("")
+    frequencies = [int(round(note_to_freq(n), 2)) for n in range(128)]
+    format_int_array(code, "noteFrequencies", frequencies, "const uint16_t", True)
+    code.append("uint8_t ring[BUFFER_RECORDS][RECORD_SIZE];")
+    code.append("uint8_t head = 0; // next record to play")
+    code.append("uint8_t count = 0; // records in the buffer")
+    code.append("uint8_t expectedSeq = 0;")
+    code.append("bool endReceived = false;")
+    code.append("bool playing = false;")
+    code.append("bool finished = false;")
+    code.append("uint8_t underruns = 0;")
+    code.append("uint8_t played = 0; // records played since the last credit report")
+    code.append("unsigned long noteStart = 0;")
+    code.append("unsigned long noteLength = 0;")
+    code.append("")
+    code.append("uint8_t frame[5 + MAX_FRAME_RECORDS * RECORD_SIZE];")
+    code.append("uint8_t framePos = 0;")
+    code.append("uint8_t frameSize = 0;")
+    code.append("")
+    code.append("uint8_t crc8(const uint8_t *data, uint8_t size) {")
+    code.append("  uint8_t crc = 0;")
+    code.append("  for (uint8_t i = 0; i < size; i++) {")
+    code.append("    crc ^= data[i];")
+    code.append("    for (uint8_t bit = 0; bit < 8; bit++) {")
+    code.append("      crc = crc & 0x80 ? (crc << 1) ^ 0x07 : crc << 1;")
+    code.append("    }")
+    code.append("  }")
+    code.append("  return crc;")
+    code.append("}")
+    code.append("")
+    code.append("void reply(uint8_t type, uint8_t value) {")
+    code.append("  uint8_t out[5] = {SYNC_DEVICE, type, expectedSeq, value, 0};")
+    code.append("  out[4] = crc8(out + 1, 3);")
+    code.append("  Serial.write(out, 5);")
+    code.append("}")
+    code.append("")
+    code.append("void handleFrame() {")
+    code.append("  uint8_t records = frame[3];")
+    code.append("  uint8_t size = 4 + records * RECORD_SIZE;")
+    code.append("  if (crc8(frame + 1, size - 1) != frame[size]) {")
+    code.append("    reply(REPLY_NAK, BUFFER_RECORDS - count);")
+    code.append("    return;")
+    code.append("  }")
+    code.append("  if (frame[1] == FRAME_HELLO) {")
+    code.append("    // New song: forget the old one")
+    code.append("    noTone(BUZZER_PIN);")
+    code.append("    head = count = expectedSeq = underruns = played = 0;")
+    code.append("    endReceived = playing = finished = false;")
+    code.append("    reply(REPLY_READY, BUFFER_RECORDS);")
+    code.append("    return;")
+    code.append("  }")
+    code.append("  if (frame[2] != expectedSeq) {")
+    code.append("    // Behind: a resend we already have, just acknowledge. Ahead: one got lost, ask again")
+    code.append("    reply((uint8_t)(expectedSeq - frame[2]) <= 128 ? REPLY_ACK : REPLY_NAK, BUFFER_RECORDS - count);")
+    code.append("    return;")
+    code.append("  }")
+    code.append("  if (records > BUFFER_RECORDS - count) {")
+    code.append("    reply(REPLY_NAK, BUFFER_RECORDS - count); // More than the free slots we reported")
+    code.append("    return;")
+    code.append("  }")
+    code.append("  for (uint8_t i = 0; i < records; i++) {")
+    code.append("    uint8_t *slot = ring[(head + count) % BUFFER_RECORDS];")
+    code.append("    for (uint8_t b = 0; b < RECORD_SIZE; b++) {")
+    code.append("      slot[b] = frame[4 + i * RECORD_SIZE + b];")
+    code.append("    }")
+    code.append("    count++;")
+    code.append("  }")
+    code.append("  if (frame[1] == FRAME_END) {")
+    code.append("    endReceived = true;")
+    code.append("  }")
+    code.append("  expectedSeq++;")
+    code.append("  reply(REPLY_ACK, BUFFER_RECORDS - count);")
+    code.append("}")
+    code.append("")
+    code.append("void readSerial() {")
+    code.append("  while (Serial.available()) {")
+    code.append("    uint8_t byte = Serial.read();")
+    code.append("    if (framePos == 0 && byte != SYNC_HOST) {")
+    code.append("      continue; // Not the start of a frame")
+    code.append("    }")
+    code.append("    frame[framePos++] = byte;")
+    code.append("    if (framePos == 4) {")
+    code.append("      if (frame[3] > MAX_FRAME_RECORDS) {")
+    code.append("        framePos = 0; // Garbage, wait for the next sync byte")
+    code.append("        continue;")
+    code.append("      }")
+    code.append("      frameSize = 5 + frame[3] * RECORD_SIZE;")
+    code.append("    }")
+    code.append("    if (framePos >= 4 && framePos == frameSize) {")
+    code.append("      handleFrame();")
+    code.append("      framePos = 0;")
+    code.append("    }")
+    code.append("  }")
+    code.append("}")
+    code.append("")
+    code.append("void updatePlayer() {")
+    code.append("  if (!playing) {")
+    code.append("    if (count >= PREBUFFER || (endReceived && count > 0)) {")
+    code.append("      playing = true;")
+    code.append("      noteStart = millis();")
+    code.append("      noteLength = 0;")
+    code.append("    } else if (endReceived && !finished) {")
+    code.append("      finished = true;")
+    code.append("      reply(REPLY_DONE, underruns);")
+    code.append("    }")
+    code.append("    return;")
+    code.append("  }")
+    code.append("  if (millis() - noteStart < noteLength) {")
+    code.append("    return; // Current note (or rest) is still playing")
+    code.append("  }")
+    code.append("  noteStart += noteLength; // Step from the scheduled time so delays don't add up")
+    code.append("  if (count == 0) {")
+    code.append("    // Out of notes: the end of the song, or the host fell behind")
+    code.append("    noTone(BUZZER_PIN);")
+    code.append("    playing = false;")
+    code.append("    if (!endReceived && underruns < 255) {")
+    code.append("      underruns++;")
+    code.append("    }")
+    code.append("    return;")
+    code.append("  }")
+    code.append("  const uint8_t *record = ring[head];")
+    code.append("  if (record[0] == REST) {")
+    code.append("    noTone(BUZZER_PIN);")
+    code.append("  } else {")
+    code.append("    tone(BUZZER_PIN, pgm_read_word(&noteFrequencies[record[0]]));")
+    code.append("  }")
+    code.append("  noteLength = record[1] | ((unsigned long)record[2] << 8);")
+    code.append("  head = (head + 1) % BUFFER_RECORDS;")
+    code.append("  count--;")
+    code.append("  if (++played >= CREDIT_EVERY) {")
+    code.append("    played = 0;")
+    code.append("    reply(REPLY_ACK, BUFFER_RECORDS - count);")
+    code.append("  }")
+    code.append("}")
+    code.append("")
+    code.append("void setup() {")
+    code.append("  pinMode(BUZZER_PIN, OUTPUT);")
+    code.append("  Serial.begin(BAUD);")
+    code.append("}")
+    code.append("")
+    code.append("void loop() {")
+    code.append("  readSerial();")
+    code.append("  updatePlayer();")
+    code.append("}")
+    code.append("")
+    code.append("#ifndef ARDUINO")
+    code.append("// Open a pty, print its name for midi2beep -serial and play one song")
+    code.append("int main() {")
+    code.append("  Serial.fd = posix_openpt(O_RDWR | O_NOCTTY);")
+    code.append("  if (Serial.fd < 0 || grantpt(Serial.fd) != 0 || unlockpt(Serial.fd) != 0) {")
+    code.append('    perror("pty");')
+    code.append("    return 1;")
+    code.append("  }")
+    code.append('  fprintf(stderr, "%s\\n", ptsname(Serial.fd));')
+    code.append("  setup();")
+    code.append("  while (!finished) {")
+    code.append("    loop();")
+    code.append("    usleep(200);")
+    code.append("  }")
+    code.append('  fprintf(stderr, "underruns: %u\\n", underruns);')
+    code.append("  return 0;")
+    code.append("}")
+    code.append("#endif")
+
+    return "\n".join(code)
+
+
+class ConversionMetrics:
+    # Collects counters and timings during a run and writes them as an
+    # OpenMetrics text file (e.g. for the node_exporter textfile collector)
+    STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    EVENT_BUCKETS = (100, 1000, 5000, 10000, 50000, 100000, 500000)
+
+    def __init__(self):
+        self.files_converted = 0
+        self.files_failed = 0
+        self.file_events = []
+        self.stats = {}  # filled in by the extract functions (cut_notes)
+        self.zero_length_notes = 0
+        self.rests = 0
+        self.bytes_emitted = {}
+        self.stage_seconds = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.setdefault(name, []).append(time.perf_counter() - start)
+
+    def count_midi(self, mid):
+        self.file_events.append(sum(len(track) for track in mid.tracks))
+
+    def count_timeline(self, notes):
+        for n, f, d in notes:
+            if d == 0:
+                self.zero_length_notes += 1
+            elif f == 1:
+                self.rests += 1
+
+    def count_output(self, export_type, output):
+        self.bytes_emitted[export_type] = self.bytes_emitted.get(export_type, 0) + len(output.encode("utf-8"))
+
+    def render(self):
+        lines = []
+
+        def counter(name, help_text, samples):
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"# HELP {name} {help_text}")
+            for labels, value in samples:
+                lines.append(f"{name}_total{labels} {value}")
+
+        def histogram(name, help_text, buckets, series):
+            lines.append(f"# TYPE {name} histogram")
+            lines.append(f"# HELP {name} {help_text}")
+            for labels, values in series:
+                for bound in buckets:
+                    count = sum(1 for v in values if v <= bound)
+                    lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {len(values)}')
+                suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {sum(values)}")
+                lines.append(f"{name}_count{suffix} {len(values)}")
+
+        counter("midi2beep_files_converted", "MIDI files converted.", [("", self.files_converted)])
+        counter("midi2beep_files_failed", "MIDI files that failed to convert.", [("", self.files_failed)])
+        counter("midi2beep_events_read", "MIDI events read from all files.", [("", sum(self.file_events))])
+        histogram("midi2beep_file_events", "MIDI events read per file.", self.EVENT_BUCKETS, [("", self.file_events)])
+        counter("midi2beep_zero_length_notes", "Zero-length notes dropped by the formatters.", [("", self.zero_length_notes)])
+        counter("midi2beep_rests", "Rests inserted between notes.", [("", self.rests)])
+        counter("midi2beep_cut_notes", "Notes cut short by a new note_on.", [("", self.stats.get("cut_notes", 0))])
+        counter("midi2beep_output_bytes", "Bytes emitted per export type.",
+                [(f'{{export="{t}"}}', b) for t, b in sorted(self.bytes_emitted.items())])
+        histogram("midi2beep_stage_seconds", "Time spent per conversion stage.", self.STAGE_BUCKETS,
+                  [(f'stage="{stage}",', values) for stage, values in self.stage_seconds.items()])
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # Write then rename, so a scraper never reads a half-written file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+# Golden outputs shipped in examples/undertale, all made with the v1 (old) logic
+REGRESSION_VARIANTS = [
+    ("Converted-high", 1),  # merged, priority reversed
+    ("Converted-low", 0),   # merged, default priority
+]
+GOLDENS_FILE = "goldens.json"  # output hashes of the current logic, the stored .txt files are v1's
+GOLDENS_FORMAT = "midi2beep-goldens"
+
+def first_divergence(expected, actual):
+    # Compare two beep outputs event by event (beep_tokens), returns (index, expected, actual) or None
+    expected_events = [token.decode() for token in beep_tokens(expected)]
+    actual_events = [token.decode() for token in beep_tokens(actual)]
+    for i, (e, a) in enumerate(zip(expected_events, actual_events)):
+        if e != a:
+            return i, e, a
+    if len(expected_events) != len(actual_events):
+        i = min(len(expected_events), len(actual_events))
+        e = expected_events[i] if i < len(expected_events) else "<end>"
+        a = actual_events[i] if i < len(actual_events) else "<end>"
+        return i, e, a
+    return None
+
+
+def load_goldens(corpus_dir):
+    path = os.path.join(corpus_dir, GOLDENS_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        goldens = json.load(f)
+    if goldens.get("format") != GOLDENS_FORMAT:
+        raise ValueError(f"{path} is not a golden manifest")
+    return goldens
+
+
+def regress_file(corpus_dir, name, old_logic, goldens):
+    """Reconvert one MIDI file of a corpus, returns [(key, divergence, record)].
+    divergence is False for a match; record is the output's golden entry (for -update).
+
+    With old_logic the outputs are compared with the stored v1 .txt files and the
+    first differing event is reported. The current logic is compared with the
+    hashes in goldens (None to only compute the records)."""
+    base = os.path.splitext(name)[0]
+    variants = []
+    for subdir, reverse in REGRESSION_VARIANTS:
+        key = f"{subdir}/{base}.txt"
+        if old_logic:
+            if os.path.isfile(os.path.join(corpus_dir, subdir, base + ".txt")):
+                variants.append((key, subdir, reverse))
+        elif goldens is None or key in goldens:
+            variants.append((key, subdir, reverse))
+    if not variants:
+        return []
+
+    extract_fn = extract_monophonic_notes_old if old_logic else extract_monophonic_notes
+    timelines = extract_variants(os.path.join(corpus_dir, "Original-MIDIs", name), {v[2] for v in variants}, None, 1, extract_fn)
+    results = []
+    for key, subdir, reverse in variants:
+        actual = format_output(timelines[reverse][0], 1000, "single")
+        record = {"sha256": hashlib.sha256(actual.encode("utf-8")).hexdigest(), "events": len(beep_tokens(actual))}
+        if old_logic:
+            with open(os.path.join(corpus_dir, subdir, base + ".txt"), encoding="utf-8") as f:
+                expected = f.read().strip()  # v1 left a trailing space
+            divergence = False if actual == expected else first_divergence(expected, actual)
+        elif goldens is None:
+            divergence = False
+        else:
+            # Only the hash is stored, so say how far the event count moved
+            golden = goldens[key]
+            divergence = False if record["sha256"] == golden["sha256"] else ("hash", golden["events"], record["events"])
+        results.append((key, divergence, record))
+    return results
+
+
+def run_regression(corpus_dir, old_logic=False, quiet=False, update=False, workers=None):
+    """Reconvert a corpus and compare it with its goldens, returns the failures
+    [(key, divergence)]. The files are spread over worker processes.
+
+    update rewrites the golden manifest for the current logic from this run
+    (the v1 .txt files stay the reference for old_logic)."""
+    midi_dir = os.path.join(corpus_dir, "Original-MIDIs")
+    names = sorted(name for name in os.listdir(midi_dir) if os.path.splitext(name)[1].lower() in MIDI_EXTENSIONS)
+
+    goldens = None
+    if not old_logic and not update:
+        manifest = load_goldens(corpus_dir)
+        if manifest is None:
+            raise ValueError(f"{corpus_dir} has no {GOLDENS_FILE} for the current logic, create it with -update "
+                             f"(or check the v1 outputs with -oldlogic)")
+        goldens = manifest["outputs"]
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(regress_file, corpus_dir, name, old_logic, goldens) for name in names]
+        for future in futures:
+            results.extend(future.result())
+
+    if update:
+        manifest = {
+            "format": GOLDENS_FORMAT,
+            "engine": "new",
+            "settings": {"merge": True, "export": "single", "speed": 1.0},
+            "outputs": {key: record for key, _, record in results},
+        }
+        with open(os.path.join(corpus_dir, GOLDENS_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+            f.write("\n")
+        if not quiet:
+            print(f"{len(results)} golden hashes written to {os.path.join(corpus_dir, GOLDENS_FILE)}")
+        return []
+
+    failures = []
+    for key, divergence, _ in results:
+        if divergence is False:
+            continue
+        failures.append((key, divergence))
+        if quiet:
+            continue
+        if divergence is None:
+            print(f"✗ {key}: same events, different whitespace")
+        elif divergence[0] == "hash":
+            print(f"✗ {key}: output changed ({divergence[2]} events, the golden has {divergence[1]})")
+        else:
+            i, e, a = divergence
+            print(f"✗ {key}: event {i} differs (expected '{e}', got '{a}')")
+    missing = set(goldens or ()) - {key for key, _, _ in results}
+    for key in sorted(missing):
+        failures.append((key, "missing"))
+        if not quiet:
+            print(f"✗ {key}: its MIDI file is gone")
+
+    if not quiet:
+        logic = "v1 logic" if old_logic else "current logic"
+        print(f"\n{len(results) - len(failures) + len(missing)}/{len(results) + len(missing)} outputs match the goldens ({logic})")
+
+    return failures
+
+
+if __name__ == "__main__":
+    # Templates add export types, so they have to be loaded before the real parser is built
+    template_parser = argparse.ArgumentParser(add_help=False)
+    template_parser.add_argument("-templates", default=TEMPLATE_DIR)
+    template_parser.add_argument("-quiet", action="store_true")
+    template_args, _ = template_parser.parse_known_args()
+    load_templates(template_args.templates, template_args.quiet)
+
+    template_help = "".join(f"\n  {name:<14} {t.description} (template)" for name, t in EXPORT_TEMPLATES.items())
+
+    parser = argparse.ArgumentParser(
+        description="Convert a MIDI file into various beep formats.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Export Types:
+  single         Single line beep command (default)
+  linux          Multi-line with Linux continuation (\\)
+  windows        Multi-line with Windows continuation (^)
+  arduino        Arduino sequential code
+  arduino-arrays Arduino code using arrays
+  arduino-millis Arduino non-blocking player driven from loop() with millis()
+  arduino-phrases Arduino code storing repeated phrases only once
+  arduino-sd     Arduino player streaming the notes from an SD card (writes a .bin next to the sketch)
+  arduino-auto   The smallest of arduino, arduino-arrays and arduino-phrases that fits -board""" + template_help + """
+
+Examples:
+  python midi2beep.py -file song.mid
+  python midi2beep.py -file song.mid -oldlogic
+  python midi2beep.py -file song.mid -speed 1.5 -merge -reverse
+  python midi2beep.py -file song.mid -export arduino -output song.ino
+  python midi2beep.py -file song.mid -export linux -channel 2 -nocopy
+  python midi2beep.py -file song.mid -merge -savetimeline song.m2bt -nocopy -noprint
+  python midi2beep.py -file song.m2bt -export arduino -output song.ino
+  python midi2beep.py -file examples/undertale/Converted-high/*.txt -export arduino-phrases -output arduino/
+  python midi2beep.py -file song.mid -merge -voices 3 -export arduino-arrays -output song.ino
+  python midi2beep.py -file song.mid -merge -export single arduino -priority normal reverse -speed 1 1.5 -output out/
+  python midi2beep.py -file song.mid -merge -start 8bar -end 16bar
+  python midi2beep.py -file big.mid -merge -export linux -output big.sh -pipeline
+  python midi2beep.py -file album/*.mid -merge -playlist album.ino
+  python midi2beep.py -file undertale.zip -merge -priority normal reverse -output converted.tar.gz
+  python midi2beep-bench.py -play song.mid | python midi2beep.py -live - -merge
+  python midi2beep.py -firmware player.ino
+  python midi2beep.py -file song.mid -merge -serial /dev/ttyACM0
+  python midi2beep.py -regress examples/undertale
+  python midi2beep.py -regress examples/undertale -oldlogic
+  python midi2beep.py -file examples/undertale/Original-MIDIs/*.mid -merge -export single arduino -drift -maxdrift 50
+  python midi2beep.py -file song.mid -merge -footprint
+  python midi2beep.py -file song.mid -merge -export arduino-auto -board nano -output song.ino
+  python midi2beep.py -file library/*.mid -merge -export single arduino -output converted/ -shard 2/4
+  python midi2beep.py -mergeshards converted/shard-*-of-4.json -output converted/manifest.json
+        """
+    )
+
+    parser.add_argument("-file", nargs="+", help="Path to the input MIDI file(s) (or timelines saved with -savetimeline, beep scripts written by the single/linux/windows exports, or zip/tar archives of MIDI files)")
+    parser.add_argument("-output", help="Output file (if not specified, copies to clipboard). A folder (or a .zip/.tar[.gz|.zst] archive) when several files or variants are exported")
+    parser.add_argument("-speed", type=float, nargs="+", default=[1.0], help="Speed multiplier, several values export one output each (default: 1.0)")
+    parser.add_argument("-channel", type=int, default=0, help="Target MIDI channel (default: 0)")
+    parser.add_argument("-merge", action="store_true", help="Merge all channels")
+    parser.add_argument("-reverse", action="store_true", help="Reverse channel priority (use with -merge)")
+    parser.add_argument("-priority", choices=["normal", "reverse"], nargs="+", help="Channel priority variants to export, overrides -reverse")
+    parser.add_argument("-export", choices=EXPORT_TYPES + list(EXPORT_TEMPLATES), nargs="+",
+                       default=["single"], help="Export format, several values export one output each (default: single)")
+    parser.add_argument("-nocopy", action="store_true", help="Don't copy to clipboard")
+    parser.add_argument("-noprint", action="store_true", help="Don't print to stdout")
+    parser.add_argument("-oldlogic", action="store_true", help="Use old conversion logic")
+    parser.add_argument("-quiet", action="store_true", help="Suppress status messages")
+    parser.add_argument("-start", type=parse_position, help="Convert from this position: seconds (12.5), beats (16b) or bars (4bar)")
+    parser.add_argument("-end", type=parse_position, help="Convert up to this position, same format as -start")
+    parser.add_argument("-voices", type=int, help="Split the music into up to N monophonic voices (one output per voice)")
+    parser.add_argument("-prefer", choices=["high", "low"], default="high", help="Which notes keep a voice when there are too many (use with -voices)")
+    parser.add_argument("-pipeline", action="store_true", help="Stream one MIDI file to -output with parsing, extraction, formatting and writing running concurrently")
+    parser.add_argument("-live", metavar="FIFO", help="Convert raw MIDI bytes from a FIFO (or - for stdin) as they arrive, printing tone changes")
+    parser.add_argument("-serial", metavar="PORT", help="Play the song on a board running the -firmware sketch, streaming it over this serial port")
+    parser.add_argument("-baud", type=int, default=SERIAL_BAUD, help=f"Baud rate for -serial (default: {SERIAL_BAUD})")
+    parser.add_argument("-firmware", metavar="PATH", help="Write the generic serial player sketch for -serial")
+    parser.add_argument("-playlist", metavar="PATH", help="Write all files into one Arduino sketch sharing a note dictionary, with a song selector")
+    parser.add_argument("-savetimeline", metavar="PATH", help="Also save the extracted notes as a binary timeline file (a folder with several files)")
+    parser.add_argument("-metrics", metavar="PATH", help="Write conversion counters and timings as an OpenMetrics text file")
+    parser.add_argument("-templates", metavar="DIR", default=TEMPLATE_DIR, help="Folder with export templates (*.tpl, default: templates next to this script)")
+    parser.add_argument("-board", choices=list(ARDUINO_BOARDS), default=DEFAULT_BOARD, help=f"Board arduino-auto has to fit (default: {DEFAULT_BOARD})")
+    parser.add_argument("-footprint", action="store_true", help="Estimate flash and SRAM of every Arduino export on every board instead of converting")
+    parser.add_argument("-drift", action="store_true", help="Report how far each -export's timing drifts from the exact MIDI timing instead of converting")
+    parser.add_argument("-maxdrift", type=float, metavar="MS", help="With -drift, exit with an error if any note is off by more than this")
+    parser.add_argument("-shard", type=parse_shard, metavar="i/N", help="Only convert the inputs whose content hash falls into shard i of N (run the other shards on other machines)")
+    parser.add_argument("-manifest", metavar="PATH", help="Write a manifest of inputs, parameters, output hashes and timings (default with -shard: shard-i-of-N.json next to the outputs)")
+    parser.add_argument("-mergeshards", nargs="+", metavar="MANIFEST", help="Check that shard manifests cover all inputs and outputs, and combine them into -output")
+    parser.add_argument("-regress", metavar="DIR", help="Reconvert a corpus (e.g. examples/undertale) and diff against its goldens (the stored v1 outputs with -oldlogic)")
+    parser.add_argument("-update", action="store_true", help="With -regress, rewrite the corpus' golden hashes for the current logic")
+    parser.add_argument("-jobs", type=int, help="Worker processes for -regress (default: one per CPU)")
+
+    args = parser.parse_args()
+
+    if args.regress:
+        if not os.path.isdir(os.path.join(args.regress, "Original-MIDIs")):
+            print(f"Error: '{args.regress}' has no Original-MIDIs folder.")
+            sys.exit(1)
+        if args.update and args.oldlogic:
+            parser.error("-update writes the goldens of the current logic, the v1 outputs stay as they are")
+        try:
+            failures = run_regression(args.regress, args.oldlogic, args.quiet, args.update, args.jobs)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        sys.exit(1 if failures else 0)
+
+    if args.mergeshards:
+        merged, problems = merge_manifests(args.mergeshards)
+        if merged and not args.quiet:
+            print(format_shard_summary(merged))
+        for problem in problems:
+            print(f"✗ {problem}")
+        if merged and args.output:
+            with open(args.output, "w") as f:
+                json.dump(merged, f, indent=1)
+                f.write("\n")
+            if not args.quiet:
+                print(f"Merged manifest written to: {args.output}")
+        if not problems and not args.quiet:
+            print(f"✓ All {merged['shard_count']} shards complete, {merged['input_count']} inputs converted")
+        sys.exit(1 if problems else 0)
+
+    if args.firmware:
+        with open(args.firmware, 'w') as f:
+            f.write(format_serial_firmware())
+        if not args.quiet:
+            print(f"Player firmware written to: {args.firmware}")
+        if not args.file:
+            sys.exit(0)
+
+    if args.live:
+        # Tone changes go to stdout, so status messages go to stderr
+        if args.live != "-" and not os.path.exists(args.live):
+            print(f"Error: FIFO '{args.live}' not found.", file=sys.stderr)
+            sys.exit(1)
+        if not args.quiet:
+            print(f"Listening for MIDI bytes on {'stdin' if args.live == '-' else args.live}", file=sys.stderr)
+        metrics = ConversionMetrics()
+        notes, latencies = run_live(args.live, None if args.merge else args.channel, 1 if args.merge else 0,
+                                    1 if args.reverse else 0, args.oldlogic, metrics.stats)
+        metrics.count_timeline(notes)
+        metrics.stage_seconds["live_event"] = latencies
+        if not args.quiet:
+            print(f"Recorded {len(notes)} notes/events, {latency_summary(latencies)}", file=sys.stderr)
+        # What was played can be exported like a converted file
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(format_output(notes, 1000 * args.speed[0], args.export[0], args.board))
+            if not args.quiet:
+                print(f"Output written to: {args.output}", file=sys.stderr)
+            if args.export[0] == "arduino-sd":
+                write_stream(notes, 1000 * args.speed[0], stream_path(args.output))
+                if not args.quiet:
+                    print(f"Stream file written to: {stream_path(args.output)}", file=sys.stderr)
+        if args.savetimeline:
+            save_timeline(notes, args.savetimeline)
+        if args.metrics:
+            metrics.write(args.metrics)
+        sys.exit(0)
+
+    if not args.file:
+        parser.error("-file is required")
+    if args.voices is not None and args.voices < 1:
+        parser.error("-voices must be at least 1")
+    if args.voices and (args.start or args.end):
+        parser.error("-start/-end can't be combined with -voices")
+    if args.pipeline:
+        if not args.output:
+            parser.error("-pipeline needs -output")
+        if len(args.file) > 1 or len(args.export) > 1 or len(args.speed) > 1 or (args.priority and len(args.priority) > 1):
+            parser.error("-pipeline converts one file to one output")
+        if args.voices or args.start or args.end or args.savetimeline:
+            parser.error("-pipeline can't be combined with -voices, -start/-end or -savetimeline")
+    if args.serial and (len(args.file) > 1 or args.voices or args.pipeline or args.playlist):
+        parser.error("-serial plays one file and can't be combined with -voices, -pipeline or -playlist")
+    if args.playlist and (args.voices or args.pipeline or len(args.speed) > 1 or (args.priority and len(args.priority) > 1)):
+        parser.error("-playlist takes one speed and priority, and can't be combined with -voices or -pipeline")
+    
+    if args.footprint and (args.voices or args.pipeline or args.serial or args.playlist):
+        parser.error("-footprint can't be combined with -voices, -pipeline, -serial or -playlist")
+    if args.drift and (args.voices or args.start or args.end or args.pipeline or args.serial or args.playlist):
+        parser.error("-drift can't be combined with -voices, -start/-end, -pipeline, -serial or -playlist")
+    if (args.shard or args.manifest) and (args.pipeline or args.serial or args.playlist or args.footprint or args.drift):
+        parser.error("-shard and -manifest work on batch conversions, not -pipeline, -serial, -playlist, -footprint or -drift")
+    
+    # Validate files
+    for path in args.file:
+        if not os.path.isfile(path):
+            print(f"Error: File '{path}' not found or not readable.")
+            sys.exit(1)
+    archive_input = any(archive_kind(path)[0] for path in args.file)
+    if archive_input and (args.pipeline or args.serial):
+        parser.error("-pipeline and -serial need a MIDI file on disk, not an archive")
+
+    if args.footprint:
+        for path, source, _ in iter_inputs(dict.fromkeys(args.file)):
+            if isinstance(source, str) and is_timeline_file(source):
+                notes = load_timeline(source)
+            elif isinstance(source, str) and is_beep_file(source):
+                notes = load_beep(source)
+            else:
+                extract = extract_monophonic_notes_old if args.oldlogic else extract_monophonic_notes
+                notes = extract(open_midi(source), None if args.merge else args.channel, 1 if args.merge else 0,
+                                1 if args.reverse else 0, None, args.start, args.end)
+            for speed in dict.fromkeys(args.speed):
+                print(format_footprints(path if len(args.speed) == 1 else f"{path} ({speed}x)", notes, 1000 * speed))
+        sys.exit(0)
+
+    if args.drift:
+        worst = {}
+        for path, source, _ in iter_inputs(dict.fromkeys(args.file)):
+            if isinstance(source, str) and (is_timeline_file(source) or is_beep_file(source)):
+                print(f"Error: '{path}' is a timeline or beep script, -drift needs the MIDI file for its ticks.")
+                sys.exit(1)
+            mid = open_midi(source)
+            for speed in dict.fromkeys(args.speed):
+                name = path if len(args.speed) == 1 else f"{path} ({speed}x)"
+                report = timing_drift(mid, 1000 * speed, list(dict.fromkeys(args.export)), None if args.merge else args.channel,
+                                      1 if args.merge else 0, 1 if args.reverse else 0, args.oldlogic)
+                print(format_drift_report(name, report))
+                for export_type, r in report["exports"].items():
+                    if r["max_drift"] > worst.get(export_type, (0.0, ""))[0]:
+                        worst[export_type] = (r["max_drift"], name)
+        if len(args.file) > 1 or archive_input or len(args.speed) > 1:
+            print("Worst max drift: " + ", ".join(f"{export_type} {value:.3f} ms ({name})" for export_type, (value, name) in worst.items()))
+        if args.maxdrift is not None and any(value > args.maxdrift for value, _ in worst.values()):
+            print(f"✗ Drift over {args.maxdrift} ms")
+            sys.exit(1)
+        sys.exit(0)
+
+    files = list(dict.fromkeys(args.file))
+    exports = list(dict.fromkeys(args.export))
+    speeds = list(dict.fromkeys(args.speed))
+    if args.priority:
+        reverses = [1 if p == "reverse" else 0 for p in dict.fromkeys(args.priority)]
+    else:
+        reverses = [1 if args.reverse else 0]
+
+    target_channel = None if args.merge else args.channel
+    merge = 1 if args.merge else 0
+    extract_fn = extract_monophonic_notes_old if args.oldlogic else extract_monophonic_notes
+
+    # Several files or variants: every output goes into one folder, or into an archive
+    multiple_files = len(files) > 1 or archive_input
+    archive = None
+    if args.output and archive_kind(args.output)[0] and not (args.pipeline or args.playlist):
+        try:
+            archive = ArchiveWriter(args.output)
+        except (OSError, RuntimeError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    batch = (multiple_files or len(reverses) * len(speeds) * len(exports) > 1 or archive
+             or args.shard or args.manifest) and not args.playlist
+    out_dir = args.output or "."
+    if batch and not archive:
+        os.makedirs(out_dir, exist_ok=True)
+
+    manifest = None
+    if args.shard or args.manifest:
+        shard = args.shard or (1, 1)
+        manifest_path = args.manifest
+        if not manifest_path:
+            name = f"shard-{shard[0]}-of-{shard[1]}.json"
+            manifest_path = f"{args.output}.{name}" if archive else os.path.join(out_dir, name)
+        parameters = {
+            "channel": target_channel, "merge": merge, "priorities": reverses, "exports": exports,
+            "speeds": speeds, "oldlogic": args.oldlogic, "voices": args.voices, "prefer": args.prefer,
+            "start": args.start, "end": args.end, "board": args.board,
+            # A template changes the output as much as the converter does
+            "templates": {name: content_sha256(EXPORT_TEMPLATES[name].path) for name in exports if name in EXPORT_TEMPLATES},
+        }
+        manifest = ShardManifest(shard, parameters, manifest_path, out_dir, args.output if archive else None)
+    if args.savetimeline and multiple_files:
+        os.makedirs(args.savetimeline, exist_ok=True)
+
+    metrics = ConversionMetrics()
+    written = 0
+    failed = 0
+    playlist = []
+
+    for midi_path, source, member in iter_inputs(files):
+        record = None
+        try:
+            if manifest:
+                record = manifest.claim(midi_path, source)
+                if record is None:
+                    continue  # Another shard's input
+                record_start = time.perf_counter()
+
+            if args.pipeline:
+                if is_timeline_file(midi_path) or is_beep_file(midi_path):
+                    raise ValueError("-pipeline needs a MIDI file, not a timeline or beep script")
+                if not args.quiet:
+                    print(f"Processing MIDI file: {midi_path}")
+
+                # Every stage runs at once, the output file grows while the song is still being read
+                with metrics.stage("pipeline"):
+                    summary = convert_pipelined(midi_path, args.output, exports[0], 1000 * speeds[0], target_channel,
+                                                merge, reverses[0], args.oldlogic, metrics, args.board)
+                if not args.quiet:
+                    print(f"Extracted {summary['notes']} notes/events")
+                    first_byte = summary["first_byte"] or summary["seconds"]
+                    print(f"Output written to: {args.output} (first byte after {first_byte * 1000:.1f} ms, "
+                          f"done after {summary['seconds'] * 1000:.1f} ms)")
+                    if summary["stream"]:
+                        print(f"Stream file written to: {summary['stream']}")
+                metrics.files_converted += 1
+                continue
+
+            if isinstance(source, str) and is_timeline_file(source):
+                if args.start or args.end:
+                    raise ValueError("-start/-end need a MIDI file, not a timeline")
+                # Already extracted, skip straight to formatting
+                with metrics.stage("parse"):
+                    variants = {0: [load_timeline(midi_path)]}
+                if not args.quiet:
+                    print(f"Loaded {len(variants[0][0])} notes/events from timeline: {midi_path}")
+            elif isinstance(source, str) and is_beep_file(source):
+                if args.start or args.end:
+                    raise ValueError("-start/-end need a MIDI file, not a beep script")
+                # Rebuilt from an earlier output, e.g. to re-export it as Arduino code
+                with metrics.stage("parse"):
+                    variants = {0: [load_beep(midi_path)]}
+                if not args.quiet:
+                    print(f"Loaded {len(variants[0][0])} notes/events from beep script: {midi_path}")
+            else:
+                # Process MIDI
+                if not args.quiet:
+                    print(f"Processing MIDI file: {midi_path}")
+
+                with metrics.stage("parse"):
+                    mid = open_midi(source)
+                metrics.count_midi(mid)
+
+                with metrics.stage("extract"):
+                    variants = extract_variants(mid, reverses, target_channel, merge, extract_fn, args.voices, args.prefer, metrics.stats, args.start, args.end)
+
+                if not args.quiet:
+                    for reverse, timelines in variants.items():
+                        for voice, notes in enumerate(timelines):
+                            label = []
+                            if len(variants) > 1:
+                                label.append("reverse" if reverse else "normal")
+                            if len(timelines) > 1:
+                                label.append(f"voice {voice + 1}")
+                            label = f" ({', '.join(label)})" if label else ""
+                            print(f"Extracted {len(notes)} notes/events{label}")
+
+            for timelines in variants.values():
+                for notes in timelines:
+                    metrics.count_timeline(notes)
+
+            if args.savetimeline:
+                for reverse, timelines in variants.items():
+                    for voice, notes in enumerate(timelines):
+                        path = timeline_output_path(args.savetimeline, midi_path, multiple_files,
+                                                    reverse, len(variants) > 1, voice, len(timelines) > 1)
+                        save_timeline(notes, path)
+                        if not args.quiet:
+                            print(f"Timeline written to: {path}")
+
+            if args.serial:
+                if not args.quiet:
+                    print(f"Streaming to {args.serial}...")
+                stats = stream_serial(variants[reverses[0]][0], 1000 * speeds[0], args.serial, args.baud)
+                if not args.quiet:
+                    print(f"✓ Played in {stats['seconds']:.1f}s: {stats['frames']} frames, "
+                          f"{stats['resends']} resent, {stats['underruns']} underruns")
+                metrics.files_converted += 1
+                continue
+
+            if args.playlist:
+                # Everything goes into one sketch once all files are extracted
+                playlist.append((os.path.splitext(os.path.basename(midi_path))[0], variants[reverses[0]][0]))
+                metrics.files_converted += 1
+                continue
+
+            if batch:
+                # Every formatter is fed from the shared timelines
+                base = os.path.splitext(os.path.basename(midi_path))[0]
+                for reverse, timelines in variants.items():
+                    for speed in speeds:
+                        for export_type in exports:
+                            if archive:
+                                name = archive_output_name(member, export_type, reverse, speed, len(speeds) * len(exports) > 1)
+                            else:
+                                name = matrix_filename(base, export_type, reverse, speed)
+                            for voice, notes in enumerate(timelines):
+                                path = name if archive else os.path.join(out_dir, name)
+                                if len(timelines) > 1:
+                                    path = voice_path(path, voice)
+                                with metrics.stage("format"):
+                                    output = format_output(notes, 1000 * speed, export_type, args.board)
+                                with metrics.stage("write"):
+                                    if archive:
+                                        archive.write(path, output)
+                                        if export_type == "arduino-sd":
+                                            archive.write(stream_path(path), encode_stream(notes, 1000 * speed))
+                                    else:
+                                        with open(path, 'w') as f:
+                                            f.write(output)
+                                        if export_type == "arduino-sd":
+                                            write_stream(notes, 1000 * speed, stream_path(path))
+                                if record is not None:
+                                    if archive:
+                                        manifest.add_output(record, path, output.encode("utf-8"))
+                                        if export_type == "arduino-sd":
+                                            manifest.add_output(record, stream_path(path), encode_stream(notes, 1000 * speed))
+                                    else:
+                                        manifest.add_output(record, os.path.relpath(path, out_dir), path)
+                                        if export_type == "arduino-sd":
+                                            manifest.add_output(record, os.path.relpath(stream_path(path), out_dir), stream_path(path))
+                                metrics.count_output(export_type, output)
+                                written += 1
+                                if not args.quiet:
+                                    print(f"Output written to: {args.output + ':' + path if archive else path}")
+                if record is not None:
+                    record["seconds"] = round(time.perf_counter() - record_start, 4)
+                metrics.files_converted += 1
+                continue
+
+            export_type = exports[0]
+            timelines = next(iter(variants.values()))
+            
+            # Format output
+            speed = 1000 * speeds[0]
+            with metrics.stage("format"):
+                outputs = [format_output(notes, speed, export_type, args.board) for notes in timelines]
+            final = "\n\n".join(outputs)
+            for output in outputs:
+                metrics.count_output(export_type, output)
+            
+            # Output handling
+            if args.output:
+                # Write to file, one per voice
+                for voice, output in enumerate(outputs):
+                    path = voice_path(args.output, voice) if len(outputs) > 1 else args.output
+                    with metrics.stage("write"):
+                        with open(path, 'w') as f:
+                            f.write(output)
+                    if not args.quiet:
+                        print(f"Output written to: {path}")
+            else:
+                if not args.noprint:
+                    # Print to stdout
+                    print(final)
+            
+            if export_type == "arduino-sd":
+                # The notes go into a stream file for the SD card, next to the sketch
+                base = args.output or os.path.basename(midi_path)
+                for voice, notes in enumerate(timelines):
+                    path = stream_path(voice_path(base, voice) if len(timelines) > 1 else base)
+                    with metrics.stage("write"):
+                        write_stream(notes, speed, path)
+                    if not args.quiet:
+                        print(f"Stream file written to: {path}")
+            
+            # Clipboard handling
+            if not args.nocopy and not args.output:
+                try:
+                    pyperclip.copy(final)
+                    if not args.quiet:
+                        print("\n✓ Output copied to clipboard")
+                except Exception as e:
+                    if not args.quiet:
+                        print(f"\n⚠ Warning: Could not copy to clipboard: {e}")
+            
+            if not args.quiet and export_type in ARDUINO_EXPORT_TYPES:
+                print("\n✓ Arduino code generated successfully!")
+                print("  Remember to connect your buzzer to pin 8 or modify the code")
+                if export_type == "arduino-phrases":
+                    # The compression report is the third comment line of the sketch
+                    for output in outputs:
+                        print("  " + output.split("\n")[2].lstrip("/ "))
+                if export_type == "arduino-sd":
+                    print("  Copy the .bin file to the SD card as SONG.BIN")
+
+            metrics.files_converted += 1
+        
+        except Exception as e:
+            # Keep going in batch mode, one broken file shouldn't stop the rest
+            label = f" ({midi_path})" if multiple_files else ""
+            print(f"Error{label}: {e}")
+            failed += 1
+            metrics.files_failed += 1
+            if record is not None:
+                record["error"] = str(e)
+                record["seconds"] = round(time.perf_counter() - record_start, 4)
+
+    if archive:
+        with metrics.stage("write"):
+            archive.close()
+
+    if manifest:
+        # After the archive is closed, the manifest holds its final hash
+        manifest.write()
+        if not args.quiet:
+            print(f"Shard {manifest.index}/{manifest.count}: converted {len(manifest.inputs)} of {len(set(manifest.digests))} inputs")
+            print(f"Manifest written to: {manifest.path}")
+
+    if playlist:
+        with metrics.stage("format"):
+            output = format_arduino_playlist(playlist, 1000 * speeds[0], args.board)
+        with metrics.stage("write"):
+            with open(args.playlist, 'w') as f:
+                f.write(output)
+        metrics.count_output("arduino-playlist", output)
+        if not args.quiet:
+            print(f"Playlist with {len(playlist)} songs written to: {args.playlist}")
+            # The footprint report is the third comment line of the sketch
+            print("  " + output.split("\n")[2].lstrip("/ "))
+
+    if args.metrics:
+        metrics.write(args.metrics)
+        if not args.quiet:
+            print(f"Metrics written to: {args.metrics}")
+
+    if batch and not args.quiet:
+        print(f"\n✓ {written} outputs written to: {out_dir}")
+
+    sys.exit(1 if failed else 0)
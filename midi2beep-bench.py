@@ -0,0 +1,259 @@
+import mido
+import argparse
+import importlib.util
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+# The converter lives in a script with a dash in its name, so load it by path
+_cli_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mid2beep-cli.py")
+_spec = importlib.util.spec_from_file_location("mid2beep_cli", _cli_path)
+cli = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(cli)
+
+
+GENERATOR_DEFAULTS = {
+    "tracks": 4,
+    "channels": 4,
+    "notes_per_second": 8.0,
+    "seconds": 60.0,
+    "tempo_changes": 2.0,   # per minute
+    "overlap": 1.5,         # average notes sounding at once, per track
+    "sysex": 0.5,           # SysEx messages per second
+}
+
+BENCH_REPEAT = 5  # timed runs per stage, the fastest one counts
+
+
+def generate_midi(path, seed=0, tracks=4, channels=4, notes_per_second=8.0, seconds=60.0,
+                  tempo_changes=2.0, overlap=1.5, sysex=0.5, ticks_per_beat=480):
+    # Same seed and settings always give the same file
+    rng = random.Random(seed)
+    mid = mido.MidiFile(ticks_per_beat=ticks_per_beat)
+
+    # Ticks are generated against a fixed 120 BPM grid, tempo changes only stretch playback
+    ticks_per_second = ticks_per_beat * 2
+    total_ticks = int(seconds * ticks_per_second)
+
+    # Tempo map and SysEx noise go into a conductor track
+    conductor = []
+    conductor.append((0, mido.MetaMessage("set_tempo", tempo=500_000)))
+    for _ in range(int(tempo_changes * seconds / 60)):
+        tick = rng.randrange(total_ticks) if total_ticks else 0
+        conductor.append((tick, mido.MetaMessage("set_tempo", tempo=rng.randint(300_000, 900_000))))
+    for _ in range(int(sysex * seconds)):
+        tick = rng.randrange(total_ticks) if total_ticks else 0
+        data = [rng.randrange(128) for _ in range(rng.randint(4, 32))]
+        conductor.append((tick, mido.Message("sysex", data=data)))
+    tracks_events = [conductor]
+
+    # Note length follows from the wanted overlap: overlap = rate * length
+    per_track_rate = notes_per_second / max(tracks, 1)
+    mean_length = overlap / per_track_rate if per_track_rate else 0
+    for t in range(tracks):
+        events = []
+        channel = t % max(1, min(channels, 16))
+        for _ in range(int(per_track_rate * seconds)):
+            start = rng.randrange(total_ticks) if total_ticks else 0
+            length = max(1, int(rng.expovariate(1 / mean_length) * ticks_per_second)) if mean_length else 1
+            note = rng.randint(36, 96)
+            events.append((start, mido.Message("note_on", channel=channel, note=note, velocity=rng.randint(1, 127))))
+            events.append((start + length, mido.Message("note_off", channel=channel, note=note, velocity=0)))
+        tracks_events.append(events)
+
+    for events in tracks_events:
+        events.sort(key=lambda x: x[0])
+        track = mido.MidiTrack()
+        last = 0
+        for tick, msg in events:
+            track.append(msg.copy(time=tick - last))
+            last = tick
+        track.append(mido.MetaMessage("end_of_track", time=0))
+        mid.tracks.append(track)
+
+    mid.save(path)
+    return sum(len(track) for track in mid.tracks)
+
+
+def play_raw(path, out, speed=1.0):
+    # Write a MIDI file's messages as raw bytes at their real time (speed > 1 is faster),
+    # e.g. into a FIFO read by mid2beep-cli.py -live. Messages at the same time go out
+    # in one write, so the reader sees them together like events on one tick.
+    start = time.perf_counter()
+    elapsed = 0.0
+    pending = bytearray()
+    for msg in mido.MidiFile(path):
+        if msg.time > 0:
+            if pending:
+                out.write(bytes(pending))
+                out.flush()
+                pending.clear()
+            elapsed += msg.time / speed
+            delay = start + elapsed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if not msg.is_meta:
+            pending += bytes(msg.bytes())
+    if pending:
+        out.write(bytes(pending))
+        out.flush()
+
+
+def measure(fn, *args, repeat=BENCH_REPEAT):
+    # Returns (result, seconds, peak bytes allocated). tracemalloc makes every
+    # allocation several times slower, so the time is the best of repeat runs
+    # without it and the peak comes from one more run with it.
+    seconds = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def benchmark_file(path, exports, repeat=BENCH_REPEAT):
+    results = {}
+    mid, results["parse"], results["parse_mem"] = measure(mido.MidiFile, path, repeat=repeat)
+    notes, results["extract"], results["extract_mem"] = measure(cli.extract_monophonic_notes, mid, None, 1, 0, repeat=repeat)
+    _, results["extract_old"], results["extract_old_mem"] = measure(cli.extract_monophonic_notes_old, mid, None, 1, 0, repeat=repeat)
+    for export_type in exports:
+        _, results[export_type], results[export_type + "_mem"] = measure(cli.format_output, notes, 1000, export_type, repeat=repeat)
+    return results
+
+
+def run_sweep(parameter, values, exports, base=None, seed=0, quiet=False, repeat=BENCH_REPEAT):
+    # Vary one generator setting, the rest come from base (or the defaults)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for value in values:
+            settings = dict(base or GENERATOR_DEFAULTS)
+            settings[parameter] = type(GENERATOR_DEFAULTS[parameter])(value)
+            path = os.path.join(tmp, f"{parameter}_{value}.mid")
+            events = generate_midi(path, seed, **settings)
+            row = {"parameter": parameter, "value": value, "events": events}
+            row.update(benchmark_file(path, exports, repeat))
+            rows.append(row)
+            if not quiet:
+                stages = ", ".join(f"{name} {row[name] * 1000:.1f} ms" for name in ["parse", "extract", "extract_old"] + exports)
+                print(f"{parameter}={value}: {events} events, {stages}, extract peak {row['extract_mem'] / 1024:.0f} KiB")
+    return rows
+
+
+def write_csv(rows, path):
+    columns = list(rows[0].keys())
+    with open(path, "w") as f:
+        f.write(",".join(columns) + "\n")
+        for row in rows:
+            f.write(",".join(str(row[c]) for c in columns) + "\n")
+
+
+def plot(rows, exports, path):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("⚠ Warning: matplotlib is not installed, skipping the plot (pip install matplotlib)")
+        return False
+
+    stages = ["parse", "extract", "extract_old"] + exports
+    fig, (ax_time, ax_mem) = plt.subplots(1, 2, figsize=(12, 5))
+    for parameter in dict.fromkeys(r["parameter"] for r in rows):
+        sweep = sorted((r for r in rows if r["parameter"] == parameter), key=lambda r: r["events"])
+        events = [r["events"] for r in sweep]
+        for stage in stages:
+            ax_time.plot(events, [r[stage] * 1000 for r in sweep], marker="o", label=f"{stage} ({parameter})")
+            ax_mem.plot(events, [r[stage + "_mem"] / 1024 for r in sweep], marker="o", label=f"{stage} ({parameter})")
+    ax_time.set_xlabel("MIDI events")
+    ax_time.set_ylabel("time (ms)")
+    ax_mem.set_xlabel("MIDI events")
+    ax_mem.set_ylabel("peak memory (KiB)")
+    ax_time.legend(fontsize="small")
+    fig.tight_layout()
+    fig.savefig(path)
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic MIDI files and benchmark the converter on them.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python midi2beep-bench.py -generate stress.mid -seed 1 -tracks 16 -nps 200 -seconds 600
+  python midi2beep-bench.py -sweep notes_per_second 10 100 1000 -plot bench.png
+  python midi2beep-bench.py -sweep overlap 1 4 16 64 -export single arduino-arrays -csv bench.csv
+  python midi2beep-bench.py -play song.mid | python mid2beep-cli.py -live - -merge
+        """
+    )
+
+    parser.add_argument("-generate", metavar="PATH", help="Only write one synthetic MIDI file")
+    parser.add_argument("-play", metavar="MIDI", help="Write a MIDI file as raw MIDI bytes to stdout in real time (to test -live)")
+    parser.add_argument("-playspeed", type=float, default=1.0, help="Playback speed for -play (default: 1.0)")
+    parser.add_argument("-seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("-tracks", type=int, default=GENERATOR_DEFAULTS["tracks"], help="Note tracks")
+    parser.add_argument("-channels", type=int, default=GENERATOR_DEFAULTS["channels"], help="Channels the tracks are spread over")
+    parser.add_argument("-nps", type=float, default=GENERATOR_DEFAULTS["notes_per_second"], help="Notes per second, all tracks together")
+    parser.add_argument("-seconds", type=float, default=GENERATOR_DEFAULTS["seconds"], help="Song length")
+    parser.add_argument("-tempochanges", type=float, default=GENERATOR_DEFAULTS["tempo_changes"], help="Tempo changes per minute")
+    parser.add_argument("-overlap", type=float, default=GENERATOR_DEFAULTS["overlap"], help="Average notes sounding at once per track")
+    parser.add_argument("-sysex", type=float, default=GENERATOR_DEFAULTS["sysex"], help="SysEx messages per second")
+    parser.add_argument("-sweep", nargs="+", metavar=("PARAM", "VALUE"), help=f"Benchmark one parameter over several values ({', '.join(GENERATOR_DEFAULTS)})")
+    parser.add_argument("-export", choices=cli.EXPORT_TYPES, nargs="+", default=["single", "arduino-arrays"], help="Formatters to time")
+    parser.add_argument("-repeat", type=int, default=BENCH_REPEAT, help=f"Timed runs per stage, the fastest counts (default: {BENCH_REPEAT})")
+    parser.add_argument("-csv", help="Write the sweep results as CSV")
+    parser.add_argument("-plot", help="Plot time and memory against event count (needs matplotlib)")
+    parser.add_argument("-quiet", action="store_true", help="Suppress status messages")
+
+    args = parser.parse_args()
+
+    if args.play:
+        try:
+            play_raw(args.play, sys.stdout.buffer, args.playspeed)
+        except (BrokenPipeError, KeyboardInterrupt):
+            pass
+        sys.exit(0)
+
+    if args.generate:
+        events = generate_midi(args.generate, args.seed, args.tracks, args.channels, args.nps, args.seconds,
+                               args.tempochanges, args.overlap, args.sysex)
+        if not args.quiet:
+            print(f"Generated {events} events: {args.generate}")
+        sys.exit(0)
+
+    if not args.sweep or len(args.sweep) < 2:
+        parser.error("-sweep needs a parameter and at least one value (or use -generate)")
+    parameter, values = args.sweep[0], args.sweep[1:]
+    if parameter not in GENERATOR_DEFAULTS:
+        parser.error(f"unknown sweep parameter '{parameter}' (choose from {', '.join(GENERATOR_DEFAULTS)})")
+
+    base = {
+        "tracks": args.tracks,
+        "channels": args.channels,
+        "notes_per_second": args.nps,
+        "seconds": args.seconds,
+        "tempo_changes": args.tempochanges,
+        "overlap": args.overlap,
+        "sysex": args.sysex,
+    }
+    if args.repeat < 1:
+        parser.error("-repeat must be at least 1")
+    rows = run_sweep(parameter, values, args.export, base, args.seed, args.quiet, args.repeat)
+
+    if args.csv:
+        write_csv(rows, args.csv)
+        if not args.quiet:
+            print(f"Results written to: {args.csv}")
+    if args.plot and plot(rows, args.export, args.plot) and not args.quiet:
+        print(f"Plot written to: {args.plot}")
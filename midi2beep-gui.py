@@ -3,15 +3,49 @@ from tkinter import ttk, filedialog, messagebox
 import mido
 import pyperclip
 import os
-from threading import Thread
+import re
+import sys
+import importlib.util
+import time
+import math
+import bisect
+from queue import Queue, Empty
+from threading import Thread, Event
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+PROGRESS_INTERVAL = 2000  # events/notes between progress reports from the worker
+PROGRESS_POLL_MS = 50  # how often the GUI checks the progress queue
+QUEUE_WORKERS = min(4, os.cpu_count() or 1)  # worker processes converting files from the queue
+
+# Piano roll preview
+ROLL_LOD_BASE = 0.005  # seconds per bucket of the first aggregated level
+ROLL_LOD_FACTOR = 4    # each level's buckets are this much wider than the last
+ROLL_LOD_PIXELS = 2    # a level is used while its buckets are at most this many pixels wide
+ROLL_ZOOM_STEP = 1.25
+ROLL_MIN_SECONDS = 0.05  # narrowest view when zoomed in all the way
+ROLL_CHANNEL_COLORS = [
+    "#9ecae1", "#fdae6b", "#a1d99b", "#fc9272", "#bcbddc", "#c7a08b", "#f4b6d2", "#c7c7c7",
+    "#dbdb8d", "#9edae5", "#6baed6", "#fd8d3c", "#74c476", "#fb6a4a", "#9e9ac8", "#e7969c",
+]
+ROLL_TIMELINE_COLOR = "#202020"
+ROLL_GRID_COLOR = "#eeeeee"
+ROLL_RUN_RE = re.compile(rb"([^\x00])\1*")  # runs of one colour in a pixel row
+
+
+class ConversionCancelled(Exception):
+    pass
 
 
 def note_to_freq(note: int) -> float:
     return 440.0 * 2 ** ((note - 69) / 12)
 
 
-def extract_monophonic_notes(midi_path: str, target_channel: int = 0, merge: int = 0, reverse: int = 0):
-    mid = mido.MidiFile(midi_path)
+def extract_monophonic_notes(midi_path: str, target_channel: int = 0, merge: int = 0, reverse: int = 0, progress=None):
+    if progress is not None:
+        progress("Reading MIDI file", 0, 0)
+    mid = midi_path if isinstance(midi_path, mido.MidiFile) else mido.MidiFile(midi_path)
     ticks_per_beat = mid.ticks_per_beat
     default_tempo = 500_000  # µs per beat = 120 BPM
 
@@ -41,7 +75,11 @@ def extract_monophonic_notes(midi_path: str, target_channel: int = 0, merge: int
     active_note = None
     active_note_start_time = 0.0
 
-    for abs_tick, msg in events:
+    total = len(events)
+    for i, (abs_tick, msg) in enumerate(events):
+        if progress is not None and i % PROGRESS_INTERVAL == 0:
+            progress("Extracting notes", i, total)
+
         delta_ticks = abs_tick - current_tick
         delta_time = mido.tick2second(delta_ticks, ticks_per_beat, current_tempo)
         current_time += delta_time
@@ -93,8 +131,10 @@ def extract_monophonic_notes(midi_path: str, target_channel: int = 0, merge: int
 
     return timeline
 
-def extract_monophonic_notes_old(midi_path: str, target_channel: int = 0, merge: int = 0, reverse: int = 0):
-    mid = mido.MidiFile(midi_path)
+def extract_monophonic_notes_old(midi_path: str, target_channel: int = 0, merge: int = 0, reverse: int = 0, progress=None):
+    if progress is not None:
+        progress("Reading MIDI file", 0, 0)
+    mid = midi_path if isinstance(midi_path, mido.MidiFile) else mido.MidiFile(midi_path)
     ticks_per_beat = mid.ticks_per_beat
     default_tempo = 500_000  # µs per beat = 120 BPM
 
@@ -121,7 +161,11 @@ def extract_monophonic_notes_old(midi_path: str, target_channel: int = 0, merge:
     active_note = None
     active_note_start_time = 0.0
 
-    for abs_tick, msg in events:
+    total = len(events)
+    for i, (abs_tick, msg) in enumerate(events):
+        if progress is not None and i % PROGRESS_INTERVAL == 0:
+            progress("Extracting notes", i, total)
+
         delta_ticks = abs_tick - current_tick
         delta_time = mido.tick2second(delta_ticks, ticks_per_beat, current_tempo)
         current_time += delta_time
@@ -174,12 +218,459 @@ def extract_monophonic_notes_old(midi_path: str, target_channel: int = 0, merge:
     return timeline
 
 
+def format_output(notes, speed, export_type, template=None, progress=None):
+    # export_type and template come from conversion_settings, the workers must not read Tk variables
+    if export_type == "single_line":
+        return format_single_line(notes, speed, progress)
+    elif export_type == "multi_line_linux":
+        return format_multi_line(notes, speed, "\\", progress)
+    elif export_type == "multi_line_windows":
+        return format_multi_line(notes, speed, "^", progress)
+    elif export_type == "arduino_sequential":
+        return format_arduino_sequential(notes, speed, progress)
+    elif export_type == "arduino_arrays":
+        return format_arduino_arrays(notes, speed, progress)
+    elif template is not None:
+        return template.render(notes, speed)
+
+
+def format_single_line(notes, speed, progress=None):
+    final = "beep "
+    for i, (n, f, d) in enumerate(notes):
+        if progress is not None and i % PROGRESS_INTERVAL == 0:
+            progress("Formatting output", i, len(notes))
+        if d == 0:
+            continue
+        if f == 1:
+            final += f"-D {d * speed} "
+        else:
+            final += f"-n -f {f} -l {d * speed} "
+    return final.strip()
+
+
+def format_multi_line(notes, speed, continuation_char, progress=None):
+    lines = ["beep \\"] if continuation_char == "\\" else ["beep ^"]
+
+    for i, (n, f, d) in enumerate(notes):
+        if progress is not None and i % PROGRESS_INTERVAL == 0:
+            progress("Formatting output", i, len(notes))
+        if d == 0:
+            continue
+        if f == 1:
+            lines.append(f"  -D {d * speed} {continuation_char}")
+        else:
+            lines.append(f"  -n -f {f} -l {d * speed} {continuation_char}")
+
+    # Remove continuation character from last line
+    if lines:
+        lines[-1] = lines[-1].rstrip(f" {continuation_char}")
+
+    return "\n".join(lines)
+
+
+def format_arduino_sequential(notes, speed, progress=None):
+    code = []
+    code.append("// Generated Arduino beep code")
+    code.append("// Connect buzzer to pin 8 (or change BUZZER_PIN)")
+    code.append("")
+    code.append("#define BUZZER_PIN 8")
+    code.append("")
+    code.append("void setup() {")
+    code.append("  pinMode(BUZZER_PIN, OUTPUT);")
+    code.append("}")
+    code.append("")
+    code.append("void loop() {")
+    code.append("  playMelody();")
+    code.append("  delay(2000); // Wait 2 seconds before repeating")
+    code.append("}")
+    code.append("")
+    code.append("void playMelody() {")
+
+    for i, (n, f, d) in enumerate(notes):
+        if progress is not None and i % PROGRESS_INTERVAL == 0:
+            progress("Formatting output", i, len(notes))
+        if d == 0:
+            continue
+        duration_ms = int(d * speed)
+        if f == 1:
+            code.append(f"  delay({duration_ms});")
+        else:
+            freq = int(f)
+            code.append(f"  tone(BUZZER_PIN, {freq}, {duration_ms});")
+            code.append(f"  delay({duration_ms});")
+            code.append(f"  noTone(BUZZER_PIN);")
+
+    code.append("}")
+
+    return "\n".join(code)
+
+
+def format_arduino_arrays(notes, speed, progress=None):
+    frequencies = []
+    durations = []
+
+    for i, (n, f, d) in enumerate(notes):
+        if progress is not None and i % PROGRESS_INTERVAL == 0:
+            progress("Formatting output", i, len(notes))
+        if d == 0:
+            continue
+        duration_ms = int(d * speed)
+        if f == 1:
+            frequencies.append(0)  # 0 for rest
+        else:
+            frequencies.append(int(f))
+        durations.append(duration_ms)
+
+    code = []
+    code.append("// Generated Arduino beep code with arrays")
+    code.append("// Connect buzzer to pin 8 (or change BUZZER_PIN)")
+    code.append("")
+    code.append("#define BUZZER_PIN 8")
+    code.append("")
+
+    # Format frequencies array
+    code.append("int frequencies[] = {")
+    for i in range(0, len(frequencies), 10):  # 10 per line
+        line = "  " + ", ".join(map(str, frequencies[i:i+10]))
+        if i + 10 < len(frequencies):
+            line += ","
+        code.append(line)
+    code.append("};")
+    code.append("")
+
+    # Format durations array
+    code.append("int durations[] = {")
+    for i in range(0, len(durations), 10):  # 10 per line
+        line = "  " + ", ".join(map(str, durations[i:i+10]))
+        if i + 10 < len(durations):
+            line += ","
+        code.append(line)
+    code.append("};")
+    code.append("")
+
+    code.append(f"int noteCount = {len(frequencies)};")
+    code.append("")
+    code.append("void setup() {")
+    code.append("  pinMode(BUZZER_PIN, OUTPUT);")
+    code.append("}")
+    code.append("")
+    code.append("void loop() {")
+    code.append("  playMelody();")
+    code.append("  delay(2000); // Wait 2 seconds before repeating")
+    code.append("}")
+    code.append("")
+    code.append("void playMelody() {")
+    code.append("  for (int i = 0; i < noteCount; i++) {")
+    code.append("    if (frequencies[i] == 0) {")
+    code.append("      delay(durations[i]);")
+    code.append("    } else {")
+    code.append("      tone(BUZZER_PIN, frequencies[i], durations[i]);")
+    code.append("      delay(durations[i]);")
+    code.append("      noTone(BUZZER_PIN);")
+    code.append("    }")
+    code.append("  }")
+    code.append("}")
+
+    return "\n".join(code)
+
+
+def midi_note_spans(mid, progress=None):
+    # Every note of the file as (start, end, note, channel) in seconds, overlapping
+    # notes of the same pitch end first in first out
+    spans = []
+    sounding = {}
+    now = 0.0
+    for i, msg in enumerate(mid):
+        if progress is not None and i % PROGRESS_INTERVAL == 0:
+            progress("Reading notes for the piano roll", 0, 0)
+        now += msg.time
+        if msg.type == "note_on" and msg.velocity > 0:
+            sounding.setdefault((msg.channel, msg.note), []).append(now)
+        elif msg.type in ("note_off", "note_on"):
+            starts = sounding.get((msg.channel, msg.note))
+            if starts:
+                spans.append((starts.pop(0), now, msg.note, msg.channel))
+    for (channel, note), starts in sounding.items():
+        spans.extend((start, now, note, channel) for start in starts)
+    return spans
+
+
+def merge_spans(spans):
+    # Union of (start, end) spans sorted by start, spans that touch become one
+    merged = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class RollLayer:
+    """The spans of one piano roll row in one colour, at every level of detail.
+
+    Level 0 holds the notes themselves (overlaps joined), every further level
+    snaps them to buckets ROLL_LOD_FACTOR times wider and joins them again,
+    so a zoomed-out view only has a few spans to draw however many notes
+    there are.
+    """
+
+    def __init__(self, spans, length):
+        level = merge_spans(sorted(spans))
+        self.levels = [level]
+        bucket = ROLL_LOD_BASE
+        while len(level) > 1 and bucket < length:
+            level = merge_spans([(math.floor(s / bucket) * bucket, math.ceil(e / bucket) * bucket) for s, e in level])
+            self.levels.append(level)
+            bucket *= ROLL_LOD_FACTOR
+        # Joined spans don't overlap, so their ends are sorted too and one bisect finds the visible ones
+        self.starts = [[s for s, _ in level] for level in self.levels]
+
+    def visible(self, level, t0, t1):
+        level = min(level, len(self.levels) - 1)
+        starts = self.starts[level]
+        spans = self.levels[level]
+        lo = max(bisect.bisect_right(starts, t0) - 1, 0)
+        if lo < len(spans) and spans[lo][1] < t0:
+            lo += 1  # ends before the view
+        return spans[lo:bisect.bisect_left(starts, t1)]
+
+
+class PianoRollData:
+    """What the piano roll shows: the MIDI file's notes per pitch and channel,
+    with the extracted timeline on top. Built on the worker thread."""
+
+    def __init__(self, spans, timeline):
+        kept = {}
+        now = 0.0
+        for note, freq, duration in timeline:
+            if freq != 1 and duration > 0:
+                kept.setdefault(note, []).append((now, now + duration))
+            now += duration
+        self.length = max([now] + [end for _, end, _, _ in spans]) or 1.0
+
+        by_channel = {}
+        self.channel_seconds = {}
+        for start, end, note, channel in spans:
+            by_channel.setdefault((note, channel), []).append((start, end))
+            self.channel_seconds[channel] = self.channel_seconds.get(channel, 0.0) + end - start
+
+        # One row per pitch: (note, [(channel, layer)], timeline layer or None)
+        self.rows = []
+        for note in sorted({note for note, _ in by_channel} | set(kept)):
+            layers = [(channel, RollLayer(by_channel[note, channel], self.length)) for channel in range(16) if (note, channel) in by_channel]
+            self.rows.append((note, layers, RollLayer(kept[note], self.length) if note in kept else None))
+
+        self.low = self.rows[0][0] if self.rows else 60
+        self.high = self.rows[-1][0] if self.rows else 71
+        self.note_count = len(spans)
+        self.kept_count = sum(len(row) for row in kept.values())
+
+    def summary(self):
+        text = f"{self.kept_count} beep notes from {self.note_count} MIDI notes"
+        if self.channel_seconds:
+            total = sum(self.channel_seconds.values()) or 1.0
+            channel, seconds = max(self.channel_seconds.items(), key=lambda item: item[1])
+            text += f", channel {channel} plays most ({100 * seconds / total:.0f}% of note time)"
+        return text
+
+
+class PianoRoll(ttk.Frame):
+    """Piano roll canvas for a PianoRollData.
+
+    Everything is drawn into one PhotoImage instead of a canvas item per
+    note: only the visible time range, at the level of detail that matches
+    the zoom, with one put() per run of pixels. The wheel scrolls,
+    Ctrl+wheel zooms around the pointer.
+    """
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.data = None
+        self.view_start = 0.0
+        self.view_seconds = 10.0
+        self.redraw_pending = False
+
+        self.canvas = tk.Canvas(self, background="white", highlightthickness=0, height=150)
+        self.image = tk.PhotoImage(width=1, height=1)
+        self.canvas.create_image(0, 0, image=self.image, anchor=tk.NW)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.scroll)
+
+        controls = ttk.Frame(self)
+        self.info_label = ttk.Label(controls, text="Convert a file to see its notes here")
+        self.info_label.grid(row=0, column=0, sticky=tk.W)
+        ttk.Button(controls, text="−", width=3, command=lambda: self.zoom(ROLL_ZOOM_STEP)).grid(row=0, column=1)
+        ttk.Button(controls, text="+", width=3, command=lambda: self.zoom(1 / ROLL_ZOOM_STEP)).grid(row=0, column=2)
+        ttk.Button(controls, text="Fit", width=4, command=self.fit).grid(row=0, column=3, padx=(5, 0))
+        controls.columnconfigure(0, weight=1)
+
+        self.canvas.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        controls.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(5, 0))
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.canvas.bind("<Configure>", self.resize)
+        self.canvas.bind("<MouseWheel>", lambda e: self.wheel(e, -e.delta))
+        self.canvas.bind("<Control-MouseWheel>", lambda e: self.wheel(e, -e.delta, zoom=True))
+        self.canvas.bind("<Button-4>", lambda e: self.wheel(e, -1))
+        self.canvas.bind("<Button-5>", lambda e: self.wheel(e, 1))
+        self.canvas.bind("<Control-Button-4>", lambda e: self.wheel(e, -1, zoom=True))
+        self.canvas.bind("<Control-Button-5>", lambda e: self.wheel(e, 1, zoom=True))
+
+    def set_data(self, data):
+        self.data = data
+        self.info_label.config(text=data.summary())
+        self.fit()
+
+    def clear(self, text):
+        self.data = None
+        self.info_label.config(text=text)
+        self.schedule_redraw()
+
+    def fit(self):
+        if self.data is not None:
+            self.view_start = 0.0
+            self.view_seconds = self.data.length
+        self.schedule_redraw()
+
+    def zoom(self, factor, anchor=0.5):
+        # anchor: where in the view (0..1) the time under it stays put
+        if self.data is None:
+            return
+        seconds = min(max(self.view_seconds * factor, ROLL_MIN_SECONDS), self.data.length)
+        self.view_start += (self.view_seconds - seconds) * anchor
+        self.view_seconds = seconds
+        self.schedule_redraw()
+
+    def wheel(self, event, direction, zoom=False):
+        if zoom:
+            self.zoom(ROLL_ZOOM_STEP if direction > 0 else 1 / ROLL_ZOOM_STEP, event.x / max(self.image.width(), 1))
+        else:
+            self.view_start += self.view_seconds * (0.1 if direction > 0 else -0.1)
+            self.schedule_redraw()
+
+    def scroll(self, action, value, unit=None):
+        # Scrollbar commands: ("moveto", fraction) or ("scroll", n, "units"/"pages")
+        if self.data is None:
+            return
+        if action == "moveto":
+            self.view_start = float(value) * self.data.length
+        else:
+            step = 0.1 if unit == "units" else 0.9
+            self.view_start += int(value) * step * self.view_seconds
+        self.schedule_redraw()
+
+    def resize(self, event):
+        # A new image of the canvas size, PhotoImage can't be resized in place
+        if (event.width, event.height) != (self.image.width(), self.image.height()):
+            self.image.config(width=max(event.width, 1), height=max(event.height, 1))
+            self.schedule_redraw()
+
+    def schedule_redraw(self):
+        # Many scroll/zoom events between two frames still draw only once
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.after_idle(self.redraw)
+
+    def redraw(self):
+        self.redraw_pending = False
+        self.image.blank()
+        data = self.data
+        if data is None:
+            self.scrollbar.set(0, 1)
+            return
+        self.view_start = min(max(self.view_start, 0.0), max(data.length - self.view_seconds, 0.0))
+        self.scrollbar.set(self.view_start / data.length, (self.view_start + self.view_seconds) / data.length)
+
+        width, height = self.image.width(), self.image.height()
+        t0 = self.view_start
+        t1 = t0 + self.view_seconds
+        seconds_per_pixel = self.view_seconds / width
+        # The coarsest level whose buckets are still no wider than ROLL_LOD_PIXELS
+        bucket = seconds_per_pixel * ROLL_LOD_PIXELS
+        level = 0 if bucket < ROLL_LOD_BASE else 1 + int(math.log(bucket / ROLL_LOD_BASE, ROLL_LOD_FACTOR))
+        row_height = height / (data.high - data.low + 1)
+
+        put = self.image.put
+        for note in range(data.low, data.high + 1):
+            if note % 12 == 0:
+                y = max(int((data.high - note + 1) * row_height) - 1, 0)
+                put(ROLL_GRID_COLOR, to=(0, y, width, y + 1))  # a line under every C
+        for note, layers, timeline in data.rows:
+            top = (data.high - note) * row_height
+            y0 = int(top)
+            y1 = max(int(top + row_height), y0 + 1)
+            # Channels are composed into one pixel row first, so overlapping notes cost no extra drawing
+            pixels = bytearray(width)
+            for channel, layer in layers:
+                self.fill_pixels(pixels, layer.visible(level, t0, t1), channel + 1, t0, seconds_per_pixel)
+            for run in ROLL_RUN_RE.finditer(pixels):
+                put(ROLL_CHANNEL_COLORS[pixels[run.start()] - 1], to=(run.start(), y0, run.end(), y1))
+            if timeline is not None:
+                # The extracted timeline goes over the middle of the row, so the original notes still show around it
+                if row_height >= 4:
+                    y0, y1 = int(top + row_height / 4), int(top + row_height * 3 / 4)
+                pixels = bytearray(width)
+                self.fill_pixels(pixels, timeline.visible(level, t0, t1), 1, t0, seconds_per_pixel)
+                for run in ROLL_RUN_RE.finditer(pixels):
+                    put(ROLL_TIMELINE_COLOR, to=(run.start(), y0, run.end(), y1))
+
+    @staticmethod
+    def fill_pixels(pixels, spans, value, t0, seconds_per_pixel):
+        width = len(pixels)
+        fill = bytes([value])
+        for start, end in spans:
+            x0 = max(int((start - t0) / seconds_per_pixel), 0)
+            x1 = min(max(int((end - t0) / seconds_per_pixel) + 1, x0 + 1), width)
+            if x0 < x1:
+                pixels[x0:x1] = fill * (x1 - x0)
+
+
+# User-defined exports: a template file per export type, see templates/*.tpl.
+# The template engine is the CLI's, so a template behaves the same in both.
+# The CLI lives in a script with a dash in its name, so load it by path.
+_cli_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mid2beep-cli.py")
+if "mid2beep_cli" in sys.modules:
+    cli = sys.modules["mid2beep_cli"]
+else:
+    _spec = importlib.util.spec_from_file_location("mid2beep_cli", _cli_path)
+    cli = importlib.util.module_from_spec(_spec)
+    sys.modules["mid2beep_cli"] = cli
+    _spec.loader.exec_module(cli)
+
+EXPORT_TEMPLATES = cli.EXPORT_TEMPLATES
+load_templates = cli.load_templates
+
+
+def convert_queued_file(index, midi_path, out_path, settings, status, cancel):
+    # Runs in a queue worker process. Progress goes to this file's row through
+    # status, cancel is checked at every progress report.
+    def progress(stage, done, total):
+        if cancel.is_set():
+            raise ConversionCancelled()
+        if total:
+            status.put(("file", index, f"{stage}: {100 * done // total}%"))
+        else:
+            status.put(("file", index, f"{stage}..."))
+
+    if cancel.is_set():
+        raise ConversionCancelled()
+    target_channel, merge, reverse, extract_fn, speed, export_type, template = settings
+    notes = extract_fn(midi_path, target_channel, merge, reverse, progress)
+    final = format_output(notes, speed, export_type, template, progress)
+    with open(out_path, 'w') as f:
+        f.write(final)
+    return len(notes)
+
+
 class MidiToBeepGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("MIDI to Beep Converter")
-        self.root.geometry("550x500")
-        self.root.minsize(500, 450)
+        self.root.geometry("550x600")
+        self.root.minsize(500, 550)
         
         # Variables
         self.file_path = tk.StringVar()
@@ -192,6 +683,20 @@ class MidiToBeepGUI:
         self.copy_to_clipboard = tk.BooleanVar(value=True)
         self.save_to_file = tk.BooleanVar(value=False)
         
+        # Background conversion state
+        self.worker = None
+        self.cancel_event = Event()
+        self.progress_queue = Queue()
+        self.stage = None
+        self.stage_started = 0.0
+        
+        # Multi-file queue, used while the file entry still shows its label
+        self.queued_files = []
+        self.queue_label = ""
+        
+        # (mid, notes) of the last conversion, the piano roll is built when its tab is opened
+        self.roll_source = None
+        
         self.setup_ui()
     
     def setup_ui(self):
@@ -208,6 +713,7 @@ class MidiToBeepGUI:
         self.file_entry.grid(row=0, column=0, sticky=(tk.W, tk.E))
         
         ttk.Button(file_frame, text="Browse", command=self.browse_file).grid(row=0, column=1, padx=(5, 0))
+        ttk.Button(file_frame, text="Folder", command=self.browse_folder).grid(row=0, column=2, padx=(5, 0))
         
         # Speed setting
         ttk.Label(main_frame, text="Speed:").grid(row=1, column=0, sticky=tk.W, pady=5)
@@ -251,6 +757,10 @@ class MidiToBeepGUI:
             ("Arduino Arrays", "arduino_arrays", 1, 2)
         ]
         
+        # User-defined templates go below the built-in types, three per row
+        for i, (name, template) in enumerate(EXPORT_TEMPLATES.items()):
+            export_options.append((template.description, name, 2 + i // 3, i % 3))
+        
         for text, value, row, col in export_options:
             ttk.Radiobutton(export_frame, text=text, variable=self.export_type, value=value).grid(row=row, column=col, sticky=tk.W, padx=(0, 15), pady=2)
 
@@ -273,12 +783,29 @@ class MidiToBeepGUI:
         self.export_file_button = ttk.Button(button_frame, text="Convert & Export to File", command=self.convert_and_export)
         self.export_file_button.grid(row=0, column=1)
         
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_conversion, state='disabled')
+        self.cancel_button.grid(row=0, column=2, padx=(10, 0))
+        
+        # Progress
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.grid(row=7, column=0, columnspan=3, sticky=(tk.W, tk.E))
+        
+        self.progress_bar = ttk.Progressbar(progress_frame, orient=tk.HORIZONTAL, mode='determinate', maximum=100)
+        self.progress_bar.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        self.progress_label = ttk.Label(progress_frame, text="", width=32)
+        self.progress_label.grid(row=0, column=1, padx=(10, 0))
+        
         # Status/Output area
-        ttk.Label(main_frame, text="Output Preview:").grid(row=7, column=0, sticky=tk.W, pady=(10, 5))
+        self.preview_label = ttk.Label(main_frame, text="Output Preview:")
+        self.preview_label.grid(row=8, column=0, sticky=tk.W, pady=(10, 5))
+        
+        # Text preview and piano roll as tabs
+        self.preview_tabs = ttk.Notebook(main_frame)
+        self.preview_tabs.grid(row=9, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
         
         # Text area with scrollbar
-        text_frame = ttk.Frame(main_frame)
-        text_frame.grid(row=8, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
+        text_frame = ttk.Frame(self.preview_tabs)
+        self.preview_tabs.add(text_frame, text="Text")
         
         self.output_text = tk.Text(text_frame, height=12, wrap=tk.WORD, font=("Courier", 9))
         scrollbar = ttk.Scrollbar(text_frame, orient=tk.VERTICAL, command=self.output_text.yview)
@@ -287,13 +814,39 @@ class MidiToBeepGUI:
         self.output_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         
+        # Extracted timeline over the original notes
+        self.piano_roll = PianoRoll(self.preview_tabs)
+        self.preview_tabs.add(self.piano_roll, text="Piano roll")
+        self.preview_tabs.bind("<<NotebookTabChanged>>", self.show_roll)
+        
+        # Queue view, takes the place of the preview while several files are selected
+        self.queue_frame = ttk.Frame(main_frame)
+        self.queue_frame.grid(row=9, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
+        
+        self.queue_view = ttk.Treeview(self.queue_frame, columns=("status", "output"), height=10)
+        self.queue_view.heading("#0", text="File")
+        self.queue_view.heading("status", text="Status")
+        self.queue_view.heading("output", text="Output")
+        self.queue_view.column("#0", width=170)
+        self.queue_view.column("status", width=150)
+        self.queue_view.column("output", width=170)
+        queue_scrollbar = ttk.Scrollbar(self.queue_frame, orient=tk.VERTICAL, command=self.queue_view.yview)
+        self.queue_view.configure(yscrollcommand=queue_scrollbar.set)
+        
+        self.queue_view.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        queue_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.queue_frame.grid_remove()
+        
         # Configure grid weights
         main_frame.columnconfigure(1, weight=1)
-        main_frame.rowconfigure(8, weight=1)
+        main_frame.rowconfigure(9, weight=1)
         file_frame.columnconfigure(0, weight=1)
         speed_frame.columnconfigure(0, weight=1)
+        progress_frame.columnconfigure(0, weight=1)
         text_frame.columnconfigure(0, weight=1)
         text_frame.rowconfigure(0, weight=1)
+        self.queue_frame.columnconfigure(0, weight=1)
+        self.queue_frame.rowconfigure(0, weight=1)
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
         
@@ -301,16 +854,64 @@ class MidiToBeepGUI:
         self.toggle_channel_state()
     
     def browse_file(self):
-        filename = filedialog.askopenfilename(
-            title="Select MIDI File",
+        filenames = self.root.tk.splitlist(filedialog.askopenfilenames(
+            title="Select MIDI File(s)",
             filetypes=[("MIDI files", "*.mid *.midi"), ("All files", "*.*")]
-        )
-        if filename:
-            self.file_path.set(filename)
+        ))
+        if len(filenames) == 1:
+            self.file_path.set(filenames[0])
+            self.show_queue(False)
+        elif filenames:
+            self.set_queue(list(filenames))
     
-    def get_save_filename(self):
-        export_type = self.export_type.get()
+    def browse_folder(self):
+        folder = filedialog.askdirectory(title="Select Folder with MIDI Files")
+        if not folder:
+            return
         
+        files = sorted(
+            os.path.join(dirpath, name)
+            for dirpath, _, names in os.walk(folder)
+            for name in names
+            if name.lower().endswith((".mid", ".midi"))
+        )
+        if not files:
+            messagebox.showerror("Error", f"No MIDI files found in '{folder}'.")
+            return
+        self.set_queue(files, folder)
+    
+    def set_queue(self, files, folder=None):
+        self.queued_files = files
+        if folder:
+            self.queue_label = f"{folder} ({len(files)} MIDI files)"
+        else:
+            names = ", ".join(os.path.basename(f) for f in files[:3])
+            self.queue_label = f"{len(files)} files: {names}{', ...' if len(files) > 3 else ''}"
+        self.file_path.set(self.queue_label)
+        self.fill_queue_view([(path, None) for path in files])
+        self.show_queue(True)
+    
+    def queue_mode(self):
+        # Typing a path into the entry goes back to converting a single file
+        return bool(self.queued_files) and self.file_path.get() == self.queue_label
+    
+    def show_queue(self, visible):
+        if visible:
+            self.preview_tabs.grid_remove()
+            self.queue_frame.grid()
+            self.preview_label.config(text="Queue:")
+        else:
+            self.queue_frame.grid_remove()
+            self.preview_tabs.grid()
+            self.preview_label.config(text="Output Preview:")
+    
+    def fill_queue_view(self, jobs, status="Queued"):
+        self.queue_view.delete(*self.queue_view.get_children())
+        for index, (midi_path, out_path) in enumerate(jobs):
+            output = os.path.basename(out_path) if out_path else ""
+            self.queue_view.insert("", tk.END, iid=str(index), text=os.path.basename(midi_path), values=(status, output))
+    
+    def save_filetypes(self, export_type):
         # Suggest appropriate file extensions based on export type
         if export_type in ["arduino_sequential", "arduino_arrays"]:
             filetypes = [("Arduino files", "*.ino"), ("C++ files", "*.cpp"), ("Text files", "*.txt"), ("All files", "*.*")]
@@ -321,16 +922,25 @@ class MidiToBeepGUI:
         elif export_type == "multi_line_linux":
             filetypes = [("Shell scripts", "*.sh"), ("Text files", "*.txt"), ("All files", "*.*")]
             default_ext = ".sh"
+        elif export_type in EXPORT_TEMPLATES:
+            template = EXPORT_TEMPLATES[export_type]
+            filetypes = [(template.description, f"*{template.extension}"), ("All files", "*.*")]
+            default_ext = template.extension
         else:
             filetypes = [("Text files", "*.txt"), ("Shell scripts", "*.sh"), ("All files", "*.*")]
             default_ext = ".txt"
-        
+        return filetypes, default_ext
+    
+    def suggested_filename(self, midi_path, default_ext):
         # Generate suggested filename based on input MIDI file
-        if self.file_path.get():
-            base_name = os.path.splitext(os.path.basename(self.file_path.get()))[0]
-            suggested_name = f"{base_name}_beep{default_ext}"
-        else:
-            suggested_name = f"melody{default_ext}"
+        if midi_path:
+            base_name = os.path.splitext(os.path.basename(midi_path))[0]
+            return f"{base_name}_beep{default_ext}"
+        return f"melody{default_ext}"
+    
+    def get_save_filename(self):
+        filetypes, default_ext = self.save_filetypes(self.export_type.get())
+        suggested_name = self.suggested_filename(self.file_path.get(), default_ext)
         
         filename = filedialog.asksaveasfilename(
             title="Save Output File",
@@ -349,182 +959,231 @@ class MidiToBeepGUI:
         else:
             self.channel_spinbox.config(state='readonly')
     
-    def format_output(self, notes, speed):
-        export_type = self.export_type.get()
-        
-        if export_type == "single_line":
-            return self.format_single_line(notes, speed)
-        elif export_type == "multi_line_linux":
-            return self.format_multi_line(notes, speed, "\\")
-        elif export_type == "multi_line_windows":
-            return self.format_multi_line(notes, speed, "^")
-        elif export_type == "arduino_sequential":
-            return self.format_arduino_sequential(notes, speed)
-        elif export_type == "arduino_arrays":
-            return self.format_arduino_arrays(notes, speed)
-        
-    def format_single_line(self, notes, speed):
-        final = "beep "
-        for n, f, d in notes:
-            if d == 0:
-                continue
-            if f == 1:
-                final += f"-D {d * speed} "
-            else:
-                final += f"-n -f {f} -l {d * speed} "
-        return final.strip()
-    
-    def format_multi_line(self, notes, speed, continuation_char):
-        lines = ["beep \\"] if continuation_char == "\\" else ["beep ^"]
-        
-        for n, f, d in notes:
-            if d == 0:
-                continue
-            if f == 1:
-                lines.append(f"  -D {d * speed} {continuation_char}")
-            else:
-                lines.append(f"  -n -f {f} -l {d * speed} {continuation_char}")
-        
-        # Remove continuation character from last line
-        if lines:
-            lines[-1] = lines[-1].rstrip(f" {continuation_char}")
-        
-        return "\n".join(lines)
-    
-    def format_arduino_sequential(self, notes, speed):
-        code = []
-        code.append("// Generated Arduino beep code")
-        code.append("// Connect buzzer to pin 8 (or change BUZZER_PIN)")
-        code.append("")
-        code.append("#define BUZZER_PIN 8")
-        code.append("")
-        code.append("void setup() {")
-        code.append("  pinMode(BUZZER_PIN, OUTPUT);")
-        code.append("}")
-        code.append("")
-        code.append("void loop() {")
-        code.append("  playMelody();")
-        code.append("  delay(2000); // Wait 2 seconds before repeating")
-        code.append("}")
-        code.append("")
-        code.append("void playMelody() {")
-        
-        for n, f, d in notes:
-            if d == 0:
-                continue
-            duration_ms = int(d * speed)
-            if f == 1:
-                code.append(f"  delay({duration_ms});")
-            else:
-                freq = int(f)
-                code.append(f"  tone(BUZZER_PIN, {freq}, {duration_ms});")
-                code.append(f"  delay({duration_ms});")
-                code.append(f"  noTone(BUZZER_PIN);")
-        
-        code.append("}")
-        
-        return "\n".join(code)
-    
-    def format_arduino_arrays(self, notes, speed):
-        frequencies = []
-        durations = []
-        
-        for n, f, d in notes:
-            if d == 0:
-                continue
-            duration_ms = int(d * speed)
-            if f == 1:
-                frequencies.append(0)  # 0 for rest
-            else:
-                frequencies.append(int(f))
-            durations.append(duration_ms)
-        
-        code = []
-        code.append("// Generated Arduino beep code with arrays")
-        code.append("// Connect buzzer to pin 8 (or change BUZZER_PIN)")
-        code.append("")
-        code.append("#define BUZZER_PIN 8")
-        code.append("")
-        
-        # Format frequencies array
-        code.append("int frequencies[] = {")
-        for i in range(0, len(frequencies), 10):  # 10 per line
-            line = "  " + ", ".join(map(str, frequencies[i:i+10]))
-            if i + 10 < len(frequencies):
-                line += ","
-            code.append(line)
-        code.append("};")
-        code.append("")
-        
-        # Format durations array
-        code.append("int durations[] = {")
-        for i in range(0, len(durations), 10):  # 10 per line
-            line = "  " + ", ".join(map(str, durations[i:i+10]))
-            if i + 10 < len(durations):
-                line += ","
-            code.append(line)
-        code.append("};")
-        code.append("")
-        
-        code.append(f"int noteCount = {len(frequencies)};")
-        code.append("")
-        code.append("void setup() {")
-        code.append("  pinMode(BUZZER_PIN, OUTPUT);")
-        code.append("}")
-        code.append("")
-        code.append("void loop() {")
-        code.append("  playMelody();")
-        code.append("  delay(2000); // Wait 2 seconds before repeating")
-        code.append("}")
-        code.append("")
-        code.append("void playMelody() {")
-        code.append("  for (int i = 0; i < noteCount; i++) {")
-        code.append("    if (frequencies[i] == 0) {")
-        code.append("      delay(durations[i]);")
-        code.append("    } else {")
-        code.append("      tone(BUZZER_PIN, frequencies[i], durations[i]);")
-        code.append("      delay(durations[i]);")
-        code.append("      noTone(BUZZER_PIN);")
-        code.append("    }")
-        code.append("  }")
-        code.append("}")
-        
-        return "\n".join(code)
-    
     def convert_file(self):
         if not self.validate_inputs():
             return
         
-        # Disable buttons during conversion
-        self.convert_button.config(text="Converting...", state='disabled')
-        self.export_file_button.config(text="Converting...", state='disabled')
-        self.output_text.delete(1.0, tk.END)
-        self.output_text.insert(tk.END, "Processing MIDI file...\n")
-        self.root.update()
+        if self.queue_mode():
+            self.start_queue()
+            return
+        
+        # File dialogs can't be opened from the worker thread, so ask now
+        save_path = None
+        if self.save_to_file.get():
+            save_path = self.get_save_filename() or None
         
-        # Run conversion in a separate thread to prevent GUI freezing
-        Thread(target=self.do_conversion, daemon=True).start()
+        self.start_conversion(save_path)
     
     def convert_and_export(self):
         if not self.validate_inputs():
             return
         
+        if self.queue_mode():
+            self.start_queue()
+            return
+        
         # Get save filename first
         save_path = self.get_save_filename()
         if not save_path:
             return  # User cancelled
         
+        self.start_conversion(save_path, export_only=True)
+    
+    def start_conversion(self, save_path=None, export_only=False):
+        # Only one conversion at a time
+        if self.worker is not None and self.worker.is_alive():
+            return
+        
         # Disable buttons during conversion
         self.convert_button.config(text="Converting...", state='disabled')
         self.export_file_button.config(text="Converting...", state='disabled')
+        self.cancel_button.config(state='normal')
+        self.show_queue(False)
         self.output_text.delete(1.0, tk.END)
         self.output_text.insert(tk.END, "Processing MIDI file...\n")
-        self.root.update()
+        self.progress_bar.config(mode='determinate', value=0)
+        self.progress_label.config(text="")
+        self.stage = None
+        self.cancel_event.clear()
+        
+        # Run conversion in a separate thread to prevent GUI freezing, with the options read here
+        settings = self.conversion_settings()
+        self.worker = Thread(target=self.do_conversion, args=(self.file_path.get(), settings, save_path,
+                                                              self.copy_to_clipboard.get() and not export_only), daemon=True)
+        self.worker.start()
+        self.root.after(PROGRESS_POLL_MS, self.poll_progress)
+    
+    def start_queue(self):
+        if self.worker is not None and self.worker.is_alive():
+            return
         
-        # Run conversion in a separate thread to prevent GUI freezing
-        Thread(target=self.do_conversion, args=(save_path,), daemon=True).start()
+        # Every file gets the name the save dialog would suggest for it
+        folder = filedialog.askdirectory(title="Select Output Folder")
+        if not folder:
+            return
+        settings = self.conversion_settings()
+        _, default_ext = self.save_filetypes(settings[5])
+        jobs = []
+        used = set()
+        for midi_path in self.queued_files:
+            out_path = os.path.join(folder, self.suggested_filename(midi_path, default_ext))
+            # Same song name in two subfolders: number the later ones
+            base, ext = os.path.splitext(out_path)
+            n = 2
+            while out_path in used:
+                out_path = f"{base}_{n}{ext}"
+                n += 1
+            used.add(out_path)
+            jobs.append((midi_path, out_path))
+        
+        self.convert_button.config(text="Converting...", state='disabled')
+        self.export_file_button.config(text="Converting...", state='disabled')
+        self.cancel_button.config(state='normal')
+        self.fill_queue_view(jobs)
+        self.show_queue(True)
+        self.progress_bar.config(mode='determinate', value=0)
+        self.progress_label.config(text=f"0/{len(jobs)} files")
+        self.stage = None
+        self.cancel_event.clear()
+        
+        # The dispatcher thread owns the pool, so the GUI thread never waits on it
+        self.worker = Thread(target=self.run_queue, args=(jobs, settings), daemon=True)
+        self.worker.start()
+        self.root.after(PROGRESS_POLL_MS, self.poll_progress)
+    
+    def run_queue(self, jobs, settings):
+        # Threads would share one core because of the GIL, so the files are converted in
+        # worker processes. Their progress and the cancel flag go through a manager's queue
+        # and event, this thread passes the progress on to poll_progress.
+        converted = 0
+        failed = 0
+        finished_count = 0
+        with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=QUEUE_WORKERS) as pool:
+            status = manager.Queue()
+            cancel = manager.Event()
+            futures = {
+                pool.submit(convert_queued_file, index, midi_path, out_path, settings, status, cancel): index
+                for index, (midi_path, out_path) in enumerate(jobs)
+            }
+            pending = set(futures)
+            while pending:
+                if self.cancel_event.is_set() and not cancel.is_set():
+                    # Running files stop at their next progress report, waiting ones never start
+                    cancel.set()
+                    for future in pending:
+                        future.cancel()
+                finished, pending = wait(pending, timeout=PROGRESS_POLL_MS / 1000, return_when=FIRST_COMPLETED)
+                
+                # A file's progress is queued before its result, so pass it on first
+                while True:
+                    try:
+                        self.progress_queue.put(status.get_nowait())
+                    except Empty:
+                        break
+                
+                for future in finished:
+                    index = futures[future]
+                    if future.cancelled():
+                        self.progress_queue.put(("file", index, "Cancelled"))
+                    else:
+                        try:
+                            note_count = future.result()
+                            self.progress_queue.put(("file", index, f"Done ({note_count} notes)"))
+                            converted += 1
+                        except ConversionCancelled:
+                            self.progress_queue.put(("file", index, "Cancelled"))
+                        except Exception as e:
+                            self.progress_queue.put(("file", index, f"Failed: {e}"))
+                            failed += 1
+                    finished_count += 1
+                    self.progress_queue.put(("progress", "Converting files", finished_count, len(jobs)))
+        self.progress_queue.put(("queue_done", converted, failed, len(jobs)))
+    
+    def cancel_conversion(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state='disabled')
+        self.progress_label.config(text="Cancelling...")
+    
+    def report_progress(self, stage, done, total):
+        # Called from the worker thread, doubles as the cancellation checkpoint
+        if self.cancel_event.is_set():
+            raise ConversionCancelled()
+        self.progress_queue.put(("progress", stage, done, total))
+    
+    def poll_progress(self):
+        # Only the newest progress report matters, but every final message must be handled
+        progress = None
+        while True:
+            try:
+                message = self.progress_queue.get_nowait()
+            except Empty:
+                break
+            if message[0] == "progress":
+                progress = message[1:]
+            elif message[0] == "file":
+                # Row updates are cheap and each one matters, apply them all
+                self.queue_view.set(str(message[1]), "status", message[2])
+            elif message[0] == "queue_done":
+                self.queue_complete(*message[1:])
+                return
+            elif message[0] == "done":
+                self.conversion_complete(*message[1:])
+                return
+            elif message[0] == "roll":
+                self.roll_ready(message[1])
+                return
+            elif message[0] == "error":
+                self.conversion_error(message[1])
+                return
+            elif message[0] == "cancelled":
+                self.conversion_cancelled()
+                return
+        
+        if progress is not None:
+            self.show_progress(*progress)
+        self.root.after(PROGRESS_POLL_MS, self.poll_progress)
+    
+    def show_progress(self, stage, done, total):
+        now = time.monotonic()
+        if stage != self.stage:
+            self.stage = stage
+            self.stage_started = now
+        
+        if not total:
+            # Nothing to count (e.g. while mido reads the file)
+            if str(self.progress_bar.cget('mode')) != 'indeterminate':
+                self.progress_bar.config(mode='indeterminate')
+                self.progress_bar.start(15)
+            self.progress_label.config(text=f"{stage}...")
+            return
+        
+        if str(self.progress_bar.cget('mode')) != 'determinate':
+            self.progress_bar.stop()
+            self.progress_bar.config(mode='determinate')
+        self.progress_bar.config(value=100 * done / total)
+        
+        # ETA from the speed of the current stage so far
+        elapsed = now - self.stage_started
+        if done and elapsed > 0.5:
+            remaining = elapsed * (total - done) / done
+            self.progress_label.config(text=f"{stage}: {100 * done // total}% (~{remaining:.0f}s left)")
+        else:
+            self.progress_label.config(text=f"{stage}: {100 * done // total}%")
+    
+    def reset_progress(self, text=""):
+        self.progress_bar.stop()
+        self.progress_bar.config(mode='determinate', value=0)
+        self.progress_label.config(text=text)
+        self.cancel_button.config(state='disabled')
     
     def validate_inputs(self):
+        if self.queue_mode():
+            missing = [path for path in self.queued_files if not os.path.isfile(path)]
+            if missing:
+                messagebox.showerror("Error", f"File '{missing[0]}' not found.")
+                return False
+            return True
+        
         if not self.file_path.get():
             messagebox.showerror("Error", "Please select a MIDI file first.")
             return False
@@ -535,60 +1194,77 @@ class MidiToBeepGUI:
         
         return True
     
-    def do_conversion(self, save_path=None):
+    def conversion_settings(self):
+        # (target_channel, merge, reverse, extract_fn, speed, export_type, template) from the current
+        # options. Taken once on the GUI thread when a conversion starts, so changing an option
+        # while it runs can't mix formats, and the worker threads never touch Tk.
+        target_channel = None if self.merge_channels.get() else self.channel.get()
+        merge = 1 if self.merge_channels.get() else 0
+        reverse = 1 if self.reverse_priority.get() else 0
+        old = 1 if self.old_logic.get() else 0
+        extract_fn = extract_monophonic_notes_old if old else extract_monophonic_notes
+        speed = 1000 * self.speed.get()
+        export_type = self.export_type.get()
+        return target_channel, merge, reverse, extract_fn, speed, export_type, EXPORT_TEMPLATES.get(export_type)
+    
+    def do_conversion(self, midi_path, settings, save_path=None, copy_to_clipboard=False):
         try:
-            # Get parameters
-            target_channel = None if self.merge_channels.get() else self.channel.get()
-            merge = 1 if self.merge_channels.get() else 0
-            reverse = 1 if self.reverse_priority.get() else 0
-            old = 1 if self.old_logic.get() else 0
+            target_channel, merge, reverse, extract_fn, speed, export_type, template = settings
+            
+            # Parse once, the piano roll needs the original notes too
+            self.report_progress("Reading MIDI file", 0, 0)
+            mid = mido.MidiFile(midi_path)
             
             # Extract notes
-            extract_fn = extract_monophonic_notes_old if old else extract_monophonic_notes
             notes = extract_fn(
-                self.file_path.get(),
+                mid,
                 target_channel,
                 merge,
-                reverse
+                reverse,
+                self.report_progress
             )
             
             # Build output based on export type
-            speed = 1000 * self.speed.get()
-            final = self.format_output(notes, speed)
+            final = format_output(notes, speed, export_type, template, self.report_progress)
+            self.report_progress("Formatting output", len(notes), len(notes))
             
             # Handle outputs
             clipboard_success = False
             file_success = False
             
             # Copy to clipboard if requested
-            if self.copy_to_clipboard.get() and not save_path:
+            if copy_to_clipboard:
                 try:
                     pyperclip.copy(final)
                     clipboard_success = True
                 except Exception as e:
                     pass  # Handle in completion message
             
-            # Save to file if requested or if save_path is provided
-            if self.save_to_file.get() or save_path:
+            # Save to file if a path was chosen before starting
+            if save_path:
                 try:
-                    file_path = save_path or self.get_save_filename()
-                    if file_path:
-                        with open(file_path, 'w') as f:
-                            f.write(final)
-                        file_success = True
-                        save_path = file_path
+                    with open(save_path, 'w') as f:
+                        f.write(final)
+                    file_success = True
                 except Exception as e:
                     save_path = None  # Indicate failure
             
             # Update GUI on main thread
-            self.root.after(0, self.conversion_complete, final, len(notes), clipboard_success, file_success, save_path)
+            self.progress_queue.put(("done", final, len(notes), clipboard_success, file_success, save_path, (mid, notes), export_type, template))
             
+        except ConversionCancelled:
+            self.progress_queue.put(("cancelled",))
         except Exception as e:
-            self.root.after(0, self.conversion_error, str(e))
+            self.progress_queue.put(("error", str(e)))
     
-    def conversion_complete(self, command, note_count, clipboard_success, file_success, save_path):
+    def conversion_complete(self, command, note_count, clipboard_success, file_success, save_path, roll_source, export_type, template):
         self.convert_button.config(text="Convert", state='normal')
         self.export_file_button.config(text="Convert & Export to File", state='normal')
+        self.reset_progress("Done")
+        self.worker.join()  # nothing left to do after sending "done"
+        self.roll_source = roll_source
+        self.piano_roll.clear("Open this tab to see the notes of the last conversion")
+        self.show_roll()
         
         # Show preview (truncated if too long)
         preview = command
@@ -603,7 +1279,9 @@ class MidiToBeepGUI:
             "arduino_arrays": "Arduino Arrays"
         }
         
-        export_name = export_type_names.get(self.export_type.get(), "Unknown")
+        export_name = export_type_names.get(export_type)
+        if export_name is None:
+            export_name = template.description if template else "Unknown"
         
         # Build status message
         status_lines = [
@@ -635,15 +1313,63 @@ class MidiToBeepGUI:
         
         messagebox.showinfo("Success", "\n".join(message_parts))
     
+    def show_roll(self, event=None):
+        # Build the piano roll of the last conversion, but only once it's looked at
+        if self.roll_source is None or self.preview_tabs.select() != str(self.piano_roll):
+            return
+        if self.worker is not None and self.worker.is_alive():
+            return
+        self.cancel_event.clear()
+        self.piano_roll.clear("Reading notes...")
+        self.worker = Thread(target=self.build_roll, args=(self.roll_source,), daemon=True)
+        self.roll_source = None
+        self.worker.start()
+        self.root.after(PROGRESS_POLL_MS, self.poll_progress)
+    
+    def build_roll(self, roll_source):
+        # Runs on the worker thread like a conversion
+        try:
+            mid, notes = roll_source
+            self.progress_queue.put(("roll", PianoRollData(midi_note_spans(mid, self.report_progress), notes)))
+        except Exception as e:
+            self.progress_queue.put(("error", str(e)))
+    
+    def roll_ready(self, roll):
+        self.reset_progress("Done")
+        self.piano_roll.set_data(roll)
+    
+    def queue_complete(self, converted, failed, total):
+        self.convert_button.config(text="Convert", state='normal')
+        self.export_file_button.config(text="Convert & Export to File", state='normal')
+        cancelled = self.cancel_event.is_set()
+        self.reset_progress(f"{'Cancelled' if cancelled else 'Done'}: {converted}/{total} files")
+        
+        message = f"{converted} of {total} files converted."
+        if failed:
+            message += f"\n{failed} failed, see the queue for details."
+        if failed or cancelled:
+            messagebox.showwarning("Queue finished", message)
+        else:
+            messagebox.showinfo("Success", message)
+    
+    def conversion_cancelled(self):
+        self.convert_button.config(text="Convert", state='normal')
+        self.export_file_button.config(text="Convert & Export to File", state='normal')
+        self.reset_progress("Cancelled")
+        self.output_text.delete(1.0, tk.END)
+        self.output_text.insert(tk.END, "Conversion cancelled.")
+    
     def conversion_error(self, error_msg):
         self.convert_button.config(text="Convert", state='normal')
         self.export_file_button.config(text="Convert & Export to File", state='normal')
+        self.reset_progress()
         self.output_text.delete(1.0, tk.END)
         self.output_text.insert(tk.END, f"❌ Error: {error_msg}")
         messagebox.showerror("Conversion Error", f"An error occurred:\n{error_msg}")
 
 
 if __name__ == "__main__":
+    load_templates()
     root = tk.Tk()
     app = MidiToBeepGUI(root)
     root.mainloop()
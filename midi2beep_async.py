@@ -0,0 +1,209 @@
+"""asyncio API for embedding the converter in a service.
+
+    import midi2beep_async
+
+    text = await midi2beep_async.convert("song.mid", "arduino", merge=True)
+
+    async for chunk in midi2beep_async.stream(data, "single", merge=True):
+        await writer.write(chunk)
+
+Parsing, extraction and formatting run in an executor, so the event loop never
+waits for them. The default thread pool only keeps the loop free: the GIL runs
+one thread's Python at a time, so conversions in threads don't run in parallel.
+Pass a ProcessPoolExecutor to a Converter for parallel throughput on several
+cores. A Converter limits how many conversions run at once; the module level
+functions share one with the defaults.
+"""
+import asyncio
+import concurrent.futures
+import importlib.util
+import os
+import sys
+
+
+# The converter lives in a script with a dash in its name, so load it by path.
+# Registering it under its module name lets process workers unpickle its results.
+_cli_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mid2beep-cli.py")
+if "mid2beep_cli" in sys.modules:
+    cli = sys.modules["mid2beep_cli"]
+else:
+    _spec = importlib.util.spec_from_file_location("mid2beep_cli", _cli_path)
+    cli = importlib.util.module_from_spec(_spec)
+    sys.modules["mid2beep_cli"] = cli
+    _spec.loader.exec_module(cli)
+    cli.load_templates(quiet=True)
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_CHUNK_SIZE = 64 * 1024  # characters per streamed chunk
+
+
+# Executor jobs are module level functions, so a process pool can pickle them
+def _extract(source, channel, merge, reverse, old_logic, start, end):
+    # source is a path (MIDI, timeline or beep script), MIDI bytes or a mido.MidiFile
+    if isinstance(source, (str, os.PathLike)):
+        source = os.fspath(source)
+        if cli.is_timeline_file(source) or cli.is_beep_file(source):
+            if start or end:
+                raise ValueError("start/end need a MIDI file, not a timeline or beep script")
+            return cli.load_timeline(source) if cli.is_timeline_file(source) else cli.load_beep(source)
+    extract = cli.extract_monophonic_notes_old if old_logic else cli.extract_monophonic_notes
+    return extract(source, None if merge else channel, 1 if merge else 0, 1 if reverse else 0, None, start, end)
+
+
+def _convert(source, export_type, speed, channel, merge, reverse, old_logic, start, end, board):
+    notes = _extract(source, channel, merge, reverse, old_logic, start, end)
+    return cli.format_output(notes, 1000 * speed, export_type, board)
+
+
+def _check_export(export_type):
+    if export_type == "arduino-sd":
+        # The sketch alone can't play anything, the notes go into a separate stream file
+        raise ValueError("arduino-sd also needs its .bin stream: get the notes with extract() and "
+                         "pass them to cli.format_output and cli.encode_stream")
+
+
+def _next_chunk(pieces, size):
+    # Join stream_output's small pieces up to size characters, "" once it is done
+    chunk = []
+    length = 0
+    for piece in pieces:
+        chunk.append(piece)
+        length += len(piece)
+        if length >= size:
+            break
+    return "".join(chunk)
+
+
+class Converter:
+    """Runs conversions in an executor, at most max_concurrent at a time.
+
+    executor is a concurrent.futures executor (default: a thread pool with
+    max_concurrent workers, whose conversions take turns because of the GIL).
+    With a process pool, parsing and extraction run in parallel in the worker
+    processes and only the timeline comes back; streamed formatting always
+    runs in threads because a generator can't cross processes.
+    """
+
+    def __init__(self, executor=None, max_concurrent=DEFAULT_CONCURRENCY, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.own_executor = executor is None
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(max_concurrent, thread_name_prefix="midi2beep")
+        if isinstance(self.executor, concurrent.futures.ThreadPoolExecutor):
+            self.format_executor = self.executor
+        else:
+            self.format_executor = concurrent.futures.ThreadPoolExecutor(max_concurrent, thread_name_prefix="midi2beep-format")
+        self.max_concurrent = max_concurrent
+        self.chunk_size = chunk_size
+        self.slots = asyncio.Semaphore(max_concurrent)
+
+    async def convert(self, source, export_type="single", speed=1.0, channel=0, merge=False, reverse=False,
+                      old_logic=False, start=None, end=None, board=cli.DEFAULT_BOARD):
+        """Convert source and return the whole output, like format_output.
+
+        speed is the multiplier of the CLI and GUI (2 is 2x slower), start/end
+        are positions as returned by cli.parse_position.
+        """
+        _check_export(export_type)
+        async with self.slot() as run:
+            return await run(self.executor, _convert, source, export_type, speed, channel, merge,
+                             reverse, old_logic, start, end, board)
+
+    async def stream(self, source, export_type="single", speed=1.0, channel=0, merge=False, reverse=False,
+                     old_logic=False, start=None, end=None, board=cli.DEFAULT_BOARD):
+        """Yield the output in chunks of about chunk_size characters.
+
+        A chunk is only formatted once the consumer took the one before it, so a
+        slow consumer holds the formatter back instead of the output piling up in
+        memory. The conversion keeps its slot until the iterator is exhausted or
+        closed. Exports that need the whole timeline (arrays, phrases, templates)
+        come out in one piece, as with -pipeline.
+        """
+        _check_export(export_type)
+        async with self.slot() as run:
+            notes = await run(self.executor, _extract, source, channel, merge, reverse, old_logic, start, end)
+            pieces = cli.stream_output(notes, 1000 * speed, export_type, board)
+            # Format the next chunk while the consumer handles this one
+            pending = run.submit(self.format_executor, _next_chunk, pieces, self.chunk_size)
+            while True:
+                chunk = await run.wait(pending)
+                if not chunk:
+                    return
+                pending = run.submit(self.format_executor, _next_chunk, pieces, self.chunk_size)
+                yield chunk
+
+    async def extract(self, source, channel=0, merge=False, reverse=False, old_logic=False, start=None, end=None):
+        """Return the extracted timeline [(note, frequency, seconds)] for your own formatting."""
+        async with self.slot() as run:
+            return await run(self.executor, _extract, source, channel, merge, reverse, old_logic, start, end)
+
+    def slot(self):
+        return _Slot(self.slots)
+
+    def shutdown(self, wait=True):
+        # Only executors the Converter created itself are shut down
+        if self.own_executor:
+            self.executor.shutdown(wait)
+        if self.format_executor is not self.executor:
+            self.format_executor.shutdown(wait)
+
+
+class _Slot:
+    # One conversion's place under the semaphore. A job that already started in
+    # the executor can't be interrupted, so after a cancellation the slot is only
+    # given back when that job has really finished: the limit counts running work,
+    # not the coroutines still waiting for it.
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.pending = None
+
+    async def __aenter__(self):
+        await self.slots.acquire()
+        self.loop = asyncio.get_running_loop()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pending = self.pending
+        if pending is None or pending.done():
+            self.slots.release()
+        else:
+            pending.cancel()  # Only stops it if it hasn't started yet
+            pending.add_done_callback(self.release_later)
+
+    def release_later(self, future):
+        # Called from the executor's thread
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.slots.release)
+
+    def submit(self, executor, fn, *args):
+        self.pending = executor.submit(fn, *args)
+        return self.pending
+
+    async def wait(self, future):
+        return await asyncio.wrap_future(future)
+
+    async def __call__(self, executor, fn, *args):
+        return await self.wait(self.submit(executor, fn, *args))
+
+
+_default = None
+
+
+def default_converter():
+    # Created on first use, shared by the module level functions
+    global _default
+    if _default is None:
+        _default = Converter()
+    return _default
+
+
+async def extract(source, **options):
+    return await default_converter().extract(source, **options)
+
+
+async def convert(source, export_type="single", speed=1.0, **options):
+    return await default_converter().convert(source, export_type, speed, **options)
+
+
+def stream(source, export_type="single", speed=1.0, **options):
+    # Hands out the Converter's own iterator, so closing it frees the slot right away
+    return default_converter().stream(source, export_type, speed, **options)
@@ -0,0 +1,14 @@
+[info]
+description = CSV (note, frequency, length)
+extension = .csv
+
+[header]
+index,note,frequency,length
+
+[note]
+${index},${note},${freq},${length}
+
+[rest]
+${index},,0,${length}
+
+[footer]
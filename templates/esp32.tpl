@@ -0,0 +1,35 @@
+[info]
+# Template for a user-defined export, see the README ("Custom export templates")
+description = ESP32 (ledcWriteTone)
+extension = .ino
+
+[header]
+// Generated ESP32 beep code
+// Connect buzzer to pin 8 (or change BUZZER_PIN)
+
+#define BUZZER_PIN 8
+#define BUZZER_CHANNEL 0
+
+void setup() {
+  ledcSetup(BUZZER_CHANNEL, 2000, 8);
+  ledcAttachPin(BUZZER_PIN, BUZZER_CHANNEL);
+}
+
+void loop() {
+  playMelody();
+  delay(2000); // Wait 2 seconds before repeating
+}
+
+void playMelody() {
+
+[note]
+  ledcWriteTone(BUZZER_CHANNEL, ${hz});
+  delay(${ms});
+
+[rest]
+  ledcWriteTone(BUZZER_CHANNEL, 0);
+  delay(${ms});
+
+[footer]
+  ledcWriteTone(BUZZER_CHANNEL, 0);
+}
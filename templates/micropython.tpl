@@ -0,0 +1,23 @@
+[info]
+description = MicroPython (PWM)
+extension = .py
+
+[header]
+# Generated MicroPython beep code
+# Connect buzzer to pin 8 (or change BUZZER_PIN)
+from machine import Pin, PWM
+import time
+
+BUZZER_PIN = 8
+
+buzzer = PWM(Pin(BUZZER_PIN))
+buzzer.duty_u16(0)
+
+[note]
+buzzer.freq(${hz}); buzzer.duty_u16(32768); time.sleep_ms(${ms})
+
+[rest]
+buzzer.duty_u16(0); time.sleep_ms(${ms})
+
+[footer]
+buzzer.duty_u16(0)
@@ -0,0 +1,178 @@
+import importlib.util
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import threading
+
+import mido
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS = os.path.join(ROOT, "examples", "undertale")
+
+# The converter is a script with a dash in its name, so load it by path. Registering
+# it lets the worker processes of run_regression unpickle its functions.
+if "mid2beep_cli" in sys.modules:
+    cli_module = sys.modules["mid2beep_cli"]
+else:
+    _spec = importlib.util.spec_from_file_location("mid2beep_cli", os.path.join(ROOT, "mid2beep-cli.py"))
+    cli_module = importlib.util.module_from_spec(_spec)
+    sys.modules["mid2beep_cli"] = cli_module
+    _spec.loader.exec_module(cli_module)
+
+
+@pytest.fixture(scope="session")
+def cli():
+    return cli_module
+
+
+@pytest.fixture(scope="session")
+def gui():
+    # The GUI module, loaded without opening a window
+    pytest.importorskip("tkinter")
+    if "midi2beep_gui" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("midi2beep_gui", os.path.join(ROOT, "midi2beep-gui.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["midi2beep_gui"] = module
+        spec.loader.exec_module(module)
+    return sys.modules["midi2beep_gui"]
+
+
+@pytest.fixture
+def app(gui):
+    # A MidiToBeepGUI with its worker side only: no Tk root, no widgets
+    app = object.__new__(gui.MidiToBeepGUI)
+    app.cancel_event = threading.Event()
+    app.progress_queue = queue.Queue()
+    return app
+
+
+@pytest.fixture(scope="session")
+def corpus():
+    return CORPUS
+
+
+@pytest.fixture(scope="session")
+def corpus_midis(cli, corpus):
+    # The corpus MIDI files, sorted by name
+    midi_dir = os.path.join(corpus, "Original-MIDIs")
+    return [os.path.join(midi_dir, name) for name in sorted(os.listdir(midi_dir))
+            if os.path.splitext(name)[1].lower() in cli.MIDI_EXTENSIONS]
+
+
+@pytest.fixture(scope="session")
+def run_cli():
+    # Runs the CLI in its own process, returns what it printed
+    def run(*args):
+        result = subprocess.run([sys.executable, os.path.join(ROOT, "mid2beep-cli.py"), *args],
+                                check=True, capture_output=True, text=True)
+        return result.stdout
+    return run
+
+
+# Just enough of the Arduino API to run a generated sketch on the PC: millis() is a
+# fake clock that delay() moves forward, tone() and noTone() print what they do
+ARDUINO_STUB = r"""
+#include <cstdint>
+#include <cstdio>
+#include <cstdlib>
+#define PROGMEM
+#define OUTPUT 1
+#define INPUT_PULLUP 2
+#define LOW 0
+#define HIGH 1
+static unsigned long now = 0;
+unsigned long millis() { return now; }
+void delay(unsigned long ms) { now += ms; }
+void tone(int, unsigned int frequency, unsigned long duration = 0) { printf("%lu tone %u\n", now, frequency); }
+void noTone(int) { printf("%lu noTone\n", now); }
+void pinMode(int, int) {}
+int digitalRead(int) { return HIGH; }
+uint16_t pgm_read_word(const void *p) { return *(const uint16_t *)p; }
+uint8_t pgm_read_byte(const void *p) { return *(const uint8_t *)p; }
+struct {
+  void begin(long) {}
+  void setTimeout(long) {}
+  int available() { return 0; }
+  long parseInt() { return 0; }
+  template <class T> void print(T) {}
+  template <class T> void println(T) {}
+} Serial;
+"""
+
+ARDUINO_MAIN = r"""
+int main(int argc, char **argv) {
+  unsigned long until = strtoul(argv[1], 0, 10);
+  setup();
+  while (now < until) {
+    unsigned long before = now;
+    loop();
+    if (now == before) {
+      now++;  // loop() returned without waiting, let a millisecond pass
+    }
+  }
+}
+"""
+
+SKETCH_FUNCTION_RE = re.compile(r"^((?:\w+ )+\w+\([^)]*\)) \{", re.M)
+
+
+@pytest.fixture
+def run_sketch(tmp_path):
+    # run_sketch(code, until_ms) -> [(ms, "tone", Hz) or (ms, "noTone", None)] the sketch played
+    if shutil.which("g++") is None:
+        pytest.skip("needs g++ to build the sketch")
+
+    def run(code, until):
+        # The Arduino IDE declares every function up front, so they can be used before their definition
+        prototypes = "".join(f"{match.group(1)};\n" for match in SKETCH_FUNCTION_RE.finditer(code))
+        source = tmp_path / "sketch.cpp"
+        source.write_text(ARDUINO_STUB + prototypes + code + "\n" + ARDUINO_MAIN)
+        binary = tmp_path / "sketch"
+        subprocess.run(["g++", "-x", "c++", str(source), "-o", str(binary)], check=True)
+        output = subprocess.run([str(binary), str(until)], check=True, capture_output=True, text=True).stdout
+        events = []
+        for line in output.splitlines():
+            parts = line.split()
+            events.append((int(parts[0]), parts[1], int(parts[2]) if len(parts) > 2 else None))
+        return events
+    return run
+
+
+def expected_events(frequencies, durations, start=0):
+    # What a player of these arrays should do, one pass through the song
+    events = []
+    for frequency, duration in zip(frequencies, durations):
+        events.append((start, "tone", frequency) if frequency else (start, "noTone", None))
+        start += duration
+    return events, start
+
+
+@pytest.fixture
+def write_midi(tmp_path):
+    # write_midi([(delta_ticks, type, note), ...]) -> path of a one-track file, 480 ticks per beat at 120 BPM
+    def write(events, name="test.mid"):
+        mid = mido.MidiFile(ticks_per_beat=480)
+        track = mido.MidiTrack()
+        mid.tracks.append(track)
+        for delta, kind, note in events:
+            track.append(mido.Message(kind, note=note, velocity=64, time=delta))
+        path = tmp_path / name
+        mid.save(path)
+        return str(path)
+    return write
+
+
+@pytest.fixture(scope="session")
+def async_api():
+    # midi2beep_async, loaded by path like the scripts
+    if "midi2beep_async" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("midi2beep_async", os.path.join(ROOT, "midi2beep_async.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["midi2beep_async"] = module
+        spec.loader.exec_module(module)
+    return sys.modules["midi2beep_async"]
@@ -0,0 +1,71 @@
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+
+def album(corpus_midis, count=3):
+    # (member name, bytes) laid out like examples/undertale
+    songs = []
+    for path in corpus_midis[:count]:
+        with open(path, "rb") as f:
+            songs.append((f"undertale/Original-MIDIs/{os.path.basename(path)}", f.read()))
+    return songs
+
+
+@pytest.mark.parametrize("path, kind", [
+    ("a.zip", ("zip", None)), ("a.TAR", ("tar", "")), ("a.tar.gz", ("tar", "gz")), ("a.tgz", ("tar", "gz")),
+    ("a.tar.xz", ("tar", "xz")), ("a.tar.zst", ("tar", "zst")), ("a.mid", (None, None)), ("a.gz", (None, None))])
+def test_archive_kind(cli, path, kind):
+    assert cli.archive_kind(path) == kind
+
+
+@pytest.mark.parametrize("name", ["album.zip", "album.tar", "album.tar.bz2", "album.tar.xz"])
+def test_written_archive_reads_back(cli, corpus_midis, tmp_path, name):
+    songs = album(corpus_midis)
+    writer = cli.ArchiveWriter(str(tmp_path / name))
+    for member, data in songs:
+        writer.write(member, data)
+    writer.write("undertale/README.md", "not a song")
+    writer.close()
+    assert writer.count == 4
+    assert list(cli.iter_archive_midis(str(tmp_path / name))) == songs
+
+
+def test_zstd_archives_need_zstandard(cli, corpus_midis, tmp_path):
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        with pytest.raises(RuntimeError, match="zstandard"):
+            cli.ArchiveWriter(str(tmp_path / "album.tar.zst"))
+        return
+    writer = cli.ArchiveWriter(str(tmp_path / "album.tar.zst"))
+    for member, data in album(corpus_midis):
+        writer.write(member, data)
+    writer.close()
+    assert list(cli.iter_archive_midis(str(tmp_path / "album.tar.zst"))) == album(corpus_midis)
+
+
+def test_output_names_mirror_the_example_folders(cli):
+    assert cli.archive_output_name("ut/Original-MIDIs/a.mid", "single", 1, 1.0, False) == "ut/Converted-high/a.txt"
+    assert cli.archive_output_name("a.midi", "linux", 0, 1.0, False) == "Converted-low/a.sh"
+    assert cli.archive_output_name("ut/a.mid", "arduino", 0, 1.5, True) == "ut/Converted-low/a_arduino_1.5x.ino"
+
+
+def test_zipped_corpus_converts_into_a_tarball_like_the_examples(run_cli, corpus, corpus_midis, tmp_path):
+    with zipfile.ZipFile(tmp_path / "undertale.zip", "w") as archive:
+        for member, data in album(corpus_midis):
+            archive.writestr(member, data)
+    run_cli("-file", str(tmp_path / "undertale.zip"), "-merge", "-oldlogic", "-priority", "normal", "reverse",
+            "-output", str(tmp_path / "converted.tar.gz"), "-quiet")
+    with tarfile.open(tmp_path / "converted.tar.gz") as archive:
+        outputs = {member.name: archive.extractfile(member).read().decode() for member in archive}
+    # The stored v1 outputs end with a space
+    expected = {}
+    for path in corpus_midis[:3]:
+        name = os.path.splitext(os.path.basename(path))[0] + ".txt"
+        for folder in ("Converted-high", "Converted-low"):
+            with open(os.path.join(corpus, folder, name)) as f:
+                expected[f"undertale/{folder}/{name}"] = f.read().strip()
+    assert outputs == expected
@@ -0,0 +1,26 @@
+from conftest import expected_events
+
+
+NOTES = [(69, 440.0, 0.25), (0, 1, 0.1), (72, 523.25, 0.5), (76, 659.26, 0.0), (71, 493.88, 0.125)]
+
+
+def test_player_keeps_the_schedule(cli, run_sketch):
+    frequencies, durations = cli.arduino_note_arrays(NOTES, 1000)
+    expected, end = expected_events(frequencies, durations)
+    events = run_sketch(cli.format_arduino_nonblocking(NOTES, 1000), end + 2001)
+    # One pass, silence for REPEAT_DELAY, then the song starts over
+    assert events == expected + [(end, "noTone", None), (end + 2000, "tone", 440)]
+
+
+def test_player_keeps_the_schedule_of_a_song(cli, run_sketch, corpus_midis):
+    notes = cli.extract_monophonic_notes(corpus_midis[1], None, 1, 0)
+    frequencies, durations = cli.arduino_note_arrays(notes, 1000)
+    expected, end = expected_events(frequencies, durations)
+    assert run_sketch(cli.format_arduino_nonblocking(notes, 1000), end + 1) == expected + [(end, "noTone", None)]
+
+
+def test_loop_does_not_block(cli):
+    code = cli.format_arduino_nonblocking(NOTES, 1000)
+    loop = code[code.index("void loop()"):]
+    assert "delay(" not in code.replace("REPEAT_DELAY", "")
+    assert "updateMelody();" in loop
@@ -0,0 +1,102 @@
+import asyncio
+import concurrent.futures
+import threading
+
+import pytest
+
+
+def test_convert_and_stream_match_format_output(cli, async_api, corpus_midis):
+    notes = cli.extract_monophonic_notes(corpus_midis[0], None, 1, 1)
+
+    async def run():
+        converter = async_api.Converter(chunk_size=1000)
+        try:
+            converted = await converter.convert(corpus_midis[0], "arduino", 1.5, merge=True, reverse=True)
+            chunks = [chunk async for chunk in converter.stream(corpus_midis[0], "linux", merge=True, reverse=True)]
+            return converted, chunks
+        finally:
+            converter.shutdown()
+
+    converted, chunks = asyncio.run(run())
+    assert converted == cli.format_output(notes, 1500, "arduino")
+    assert len(chunks) > 1
+    assert "".join(chunks) == cli.format_output(notes, 1000, "linux")
+
+
+def test_sd_export_is_refused(async_api, corpus_midis):
+    with pytest.raises(ValueError, match="arduino-sd"):
+        asyncio.run(async_api.convert(corpus_midis[0], "arduino-sd"))
+
+
+def slow_jobs(monkeypatch, async_api):
+    # Replaces the conversion job with one that waits for release, counting the jobs running at once
+    state = {"running": 0, "most": 0, "started": threading.Semaphore(0), "release": threading.Event()}
+    lock = threading.Lock()
+
+    def job(*args):
+        with lock:
+            state["running"] += 1
+            state["most"] = max(state["most"], state["running"])
+        state["started"].release()
+        state["release"].wait(5)
+        with lock:
+            state["running"] -= 1
+        return "done"
+
+    monkeypatch.setattr(async_api, "_convert", job)
+    return state
+
+
+def test_at_most_max_concurrent_jobs_run(monkeypatch, async_api):
+    state = slow_jobs(monkeypatch, async_api)
+
+    async def run():
+        # A pool with room for more, the semaphore is what holds them back
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            converter = async_api.Converter(pool, max_concurrent=2)
+            tasks = [asyncio.create_task(converter.convert("song.mid")) for _ in range(6)]
+            await asyncio.sleep(0.2)
+            state["release"].set()
+            return await asyncio.gather(*tasks)
+
+    assert asyncio.run(run()) == ["done"] * 6
+    assert state["most"] == 2
+
+
+def test_cancelled_job_keeps_its_slot_until_it_ends(monkeypatch, async_api):
+    state = slow_jobs(monkeypatch, async_api)
+
+    async def run():
+        converter = async_api.Converter(max_concurrent=1)
+        try:
+            task = asyncio.create_task(converter.convert("song.mid"))
+            await asyncio.to_thread(state["started"].acquire)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            # The job is still running in its thread, so it still counts
+            assert converter.slots.locked()
+            state["release"].set()
+            return await asyncio.wait_for(converter.convert("song.mid"), 5)
+        finally:
+            converter.shutdown()
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_closing_a_stream_early_frees_its_slot(async_api, corpus_midis):
+    async def run():
+        converter = async_api.Converter(max_concurrent=1, chunk_size=100)
+        try:
+            chunks = converter.stream(corpus_midis[0], "single", merge=True)
+            first = await chunks.__anext__()
+            assert converter.slots.locked()
+            await chunks.aclose()
+            # The chunk formatted ahead finishes in its thread, then the slot is free again
+            await asyncio.wait_for(converter.slots.acquire(), 5)
+            converter.slots.release()
+            return first
+        finally:
+            converter.shutdown()
+
+    assert asyncio.run(run()).startswith("beep ")
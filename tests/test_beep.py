@@ -0,0 +1,45 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def song(cli, corpus_midis):
+    return cli.extract_monophonic_notes(corpus_midis[0], None, 1, 0)
+
+
+@pytest.mark.parametrize("export_type", ["single", "linux", "windows"])
+@pytest.mark.parametrize("speed", [1000, 1500])
+def test_beep_round_trip(cli, song, tmp_path, export_type, speed):
+    output = cli.format_output(song, speed, export_type)
+    path = tmp_path / "song.txt"
+    path.write_text(output)
+    if export_type == "single":
+        assert cli.is_beep_file(str(path))
+    notes = cli.load_beep(str(path), speed)
+    # Zero-length entries are never written, everything else comes back
+    assert notes == [entry for entry in song if entry[2] != 0]
+    assert cli.format_output(notes, speed, export_type) == output
+
+
+def test_beep_of_edited_frequency_takes_nearest_note(cli):
+    assert cli.parse_beep("beep -n -f 441 -l 500 -D 250") == [(69, 441.0, 0.5), (0, 1, 0.25)]
+
+
+def test_empty_beep_file(cli, tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    assert cli.load_beep(str(path)) == []
+
+
+def test_divergence_is_reported_per_event(cli, song):
+    expected = cli.format_output(song, 1000, "single")
+    changed = song[:3] + [(song[3][0], song[3][1], song[3][2] + 0.5)] + song[4:]
+    actual = cli.format_output(changed, 1000, "linux")
+    i, e, a = cli.first_divergence(expected, actual)
+    assert i == len([entry for entry in song[:3] if entry[2]])
+    assert e == cli.beep_tokens(expected)[i].decode() != a
+    # Only the line continuations differ
+    assert cli.first_divergence(expected, cli.format_output(song, 1000, "windows")) is None
+
+
+def test_divergence_at_the_end(cli):
+    assert cli.first_divergence("beep -D 5", "beep -D 5 -n -f 440.0 -l 5") == (1, "<end>", "-n -f 440.0 -l 5")
@@ -0,0 +1,64 @@
+import importlib.util
+import os
+import time
+import tracemalloc
+
+import mido
+import pytest
+
+from conftest import ROOT
+
+
+@pytest.fixture(scope="module")
+def bench():
+    spec = importlib.util.spec_from_file_location("midi2beep_bench", os.path.join(ROOT, "midi2beep-bench.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_generator_is_deterministic(bench, tmp_path):
+    events = bench.generate_midi(tmp_path / "a.mid", seed=3, seconds=10)
+    bench.generate_midi(tmp_path / "b.mid", seed=3, seconds=10)
+    bench.generate_midi(tmp_path / "c.mid", seed=4, seconds=10)
+    assert (tmp_path / "a.mid").read_bytes() == (tmp_path / "b.mid").read_bytes()
+    assert (tmp_path / "a.mid").read_bytes() != (tmp_path / "c.mid").read_bytes()
+    assert events == sum(len(track) for track in mido.MidiFile(tmp_path / "a.mid").tracks)
+
+
+def test_generator_follows_its_settings(bench, tmp_path):
+    bench.generate_midi(tmp_path / "song.mid", tracks=3, channels=2, notes_per_second=30, seconds=20,
+                        tempo_changes=6, sysex=1)
+    mid = mido.MidiFile(tmp_path / "song.mid")
+    messages = [msg for track in mid.tracks for msg in track]
+    assert len(mid.tracks) == 4  # conductor + 3 note tracks
+    assert sum(1 for msg in messages if msg.type == "note_on") == 3 * int(30 / 3 * 20)
+    assert sum(1 for msg in messages if msg.type == "set_tempo") == 1 + 2
+    assert sum(1 for msg in messages if msg.type == "sysex") == 20
+    assert {msg.channel for msg in messages if msg.type == "note_on"} == {0, 1}
+
+
+def test_timing_runs_without_tracemalloc(bench):
+    runs = []
+
+    def stage():
+        # Pretend tracing makes the stage 50x slower, the timing must not see it
+        runs.append(tracemalloc.is_tracing())
+        time.sleep(0.1 if tracemalloc.is_tracing() else 0.002)
+        return bytearray(1 << 20)
+
+    result, seconds, peak = bench.measure(stage, repeat=3)
+    assert runs == [False, False, False, True]
+    assert len(result) == 1 << 20
+    assert seconds < 0.05
+    assert peak >= 1 << 20
+    assert not tracemalloc.is_tracing()
+
+
+def test_sweep_rows(bench):
+    rows = bench.run_sweep("seconds", ["2", "4"], ["single"], seed=1, quiet=True, repeat=1)
+    assert [row["value"] for row in rows] == ["2", "4"]
+    assert rows[0]["events"] < rows[1]["events"]
+    for row in rows:
+        for stage in ("parse", "extract", "extract_old", "single"):
+            assert row[stage] > 0 and row[stage + "_mem"] > 0
@@ -0,0 +1,53 @@
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+
+def test_schedule_is_the_extracted_timeline(cli, corpus_midis):
+    for path in corpus_midis[:4]:
+        mid = cli.open_midi(path)
+        events = cli.merge_track_events(cli.track_events(mid), 1)
+        schedule = list(cli.stream_monophonic_schedule(events, mid.ticks_per_beat, None, 1))
+        assert [entry for entry, _, _, _ in schedule] == cli.extract_monophonic_notes(path, None, 1, 1)
+
+
+def test_truncation_adds_up_in_the_arduino_exports(cli, write_midi):
+    # 30 notes of 100 ticks, 104.1666... ms each, back to back
+    events = []
+    for i in range(30):
+        events += [(0, "note_on", 60 + i % 12), (100, "note_off", 60 + i % 12)]
+    report = cli.timing_drift(write_midi(events), 1000, ("single", "arduino"), None, 1)
+    assert report["entries"] == 30
+    assert report["length"] == pytest.approx(3125.0)
+    single, arduino = report["exports"]["single"], report["exports"]["arduino"]
+    # The beep exports only carry the timeline's rounding to the microsecond
+    assert single["final_drift"] == pytest.approx(single["rounding"]) and abs(single["final_drift"]) < 0.05
+    assert arduino["length"] == 30 * 104
+    assert arduino["final_drift"] == pytest.approx(-5.0)
+    # Truncation counts from the rounded timeline: 0.167 ms lost per note
+    assert arduino["rounding"] == single["rounding"]
+    assert arduino["truncation"] == pytest.approx(-5.0 - arduino["rounding"])
+    assert arduino["max_drift"] == pytest.approx(5.0)
+    # 4/4 bars of 1920 ticks: the notes of both bars start up to 3.2 and 4.8 ms early
+    assert report["bars"] == 2
+    assert arduino["histogram"] == [0, 2, 0, 0, 0]
+
+
+def test_bar_starts_follow_time_signatures(cli):
+    # Two 4/4 bars, then 3/4 from tick 3840
+    assert cli.bar_starts([(3840, 3, 4)], 480, 6000) == [0, 1920, 3840, 5280]
+
+
+def test_maxdrift_fails_the_run(write_midi):
+    events = []
+    for i in range(30):
+        events += [(0, "note_on", 60), (100, "note_off", 60)]
+    path = write_midi(events)
+    command = [sys.executable, f"{ROOT}/mid2beep-cli.py", "-file", path, "-merge", "-export", "arduino", "-drift"]
+    assert subprocess.run(command + ["-maxdrift", "10"], capture_output=True).returncode == 0
+    failed = subprocess.run(command + ["-maxdrift", "1"], capture_output=True, text=True)
+    assert failed.returncode != 0
+    assert "Drift over 1.0 ms" in failed.stdout
@@ -0,0 +1,51 @@
+import pytest
+
+
+def motif_song(cli, repeats):
+    # A 16 note motif played over and over, what the phrase encoding is for
+    return [(n, round(cli.note_to_freq(n), 2), 0.125) for _ in range(repeats) for n in range(60, 76)]
+
+
+def test_array_estimate_counts_two_ints_per_note(cli):
+    notes = motif_song(cli, 10)
+    b = cli.ARDUINO_BOARDS["uno"]
+    estimate = cli.arduino_footprints(notes, 1000, "uno")["arduino-arrays"]
+    assert estimate["flash"] == b["core_flash"] + cli.ARDUINO_PLAYER_CODE["arduino-arrays"] + 160 * 4
+    assert estimate["sram"] == b["core_sram"] + 160 * 4 + 2
+    assert estimate["fits"]
+
+
+def test_long_song_only_fits_as_phrases_or_on_a_card(cli):
+    notes = motif_song(cli, 200)
+    estimates = cli.arduino_footprints(notes, 1000, "uno")
+    assert not estimates["arduino"]["fits"] and not estimates["arduino-arrays"]["fits"]
+    assert estimates["arduino-phrases"]["fits"] and estimates["arduino-sd"]["fits"]
+    assert cli.pick_arduino_encoding(notes, 1000, "uno")[0] == "arduino-phrases"
+
+
+def test_auto_picks_the_smallest_fitting_sketch(cli, corpus_midis):
+    for path in corpus_midis[:5]:
+        notes = cli.extract_monophonic_notes(path, None, 1, 0)
+        for board in cli.ARDUINO_BOARDS:
+            estimates = cli.arduino_footprints(notes, 1000, board)
+            fitting = [t for t in cli.AUTO_ENCODINGS if estimates[t]["fits"]]
+            picked, estimate = cli.pick_arduino_encoding(notes, 1000, board)
+            assert estimate["flash"] == min(estimates[t]["flash"] for t in fitting)
+
+
+def test_auto_runs_the_phrase_search_once(cli, monkeypatch):
+    notes = motif_song(cli, 200)
+    expected = cli.format_arduino_phrases(notes, 1000)
+    calls = []
+    search = cli.phrase_tables
+    monkeypatch.setattr(cli, "phrase_tables", lambda *args: calls.append(args) or search(*args))
+    header, code = cli.format_output(notes, 1000, "arduino-auto").split("\n", 1)
+    assert header.startswith("// arduino-auto: arduino-phrases is the smallest sketch")
+    assert code == expected
+    assert len(calls) == 1
+
+
+def test_song_that_fits_nowhere_points_to_the_sd_export(cli):
+    notes = [(60 + i % 48, round(cli.note_to_freq(60 + i % 48), 2), 0.001 * (1 + i % 997)) for i in range(40000)]
+    with pytest.raises(ValueError, match="export arduino-sd"):
+        cli.format_output(notes, 1000, "arduino-auto")
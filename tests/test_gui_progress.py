@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+
+def drain(app):
+    messages = []
+    while not app.progress_queue.empty():
+        messages.append(app.progress_queue.get_nowait())
+    return messages
+
+
+@pytest.mark.parametrize("old_logic", [False, True])
+def test_extraction_reports_progress_and_matches_the_cli(cli, gui, corpus_midis, old_logic):
+    reports = []
+    extract = gui.extract_monophonic_notes_old if old_logic else gui.extract_monophonic_notes
+    notes = extract(corpus_midis[0], None, 1, 0, lambda *report: reports.append(report))
+    expected = (cli.extract_monophonic_notes_old if old_logic else cli.extract_monophonic_notes)(corpus_midis[0], None, 1, 0)
+    assert notes == expected
+    assert reports[0] == ("Reading MIDI file", 0, 0)
+    counts = [done for stage, done, total in reports if stage == "Extracting notes"]
+    assert counts == sorted(counts) and len(counts) > 1
+    assert all(done < total for stage, done, total in reports[1:])
+
+
+def test_progress_callback_cancels_extraction(gui, corpus_midis):
+    def progress(stage, done, total):
+        if done:
+            raise gui.ConversionCancelled()
+    with pytest.raises(gui.ConversionCancelled):
+        gui.extract_monophonic_notes(corpus_midis[0], None, 1, 0, progress)
+
+
+def test_conversion_reports_done(cli, app, gui, corpus_midis, tmp_path):
+    settings = (None, 1, 0, gui.extract_monophonic_notes, 1000, "single_line", None)
+    app.do_conversion(corpus_midis[0], settings, str(tmp_path / "out.txt"))
+    messages = drain(app)
+    assert {message[0] for message in messages[:-1]} == {"progress"}
+    kind, output, note_count, clipboard, saved, path = messages[-1][:6]
+    assert (kind, saved, path) == ("done", True, str(tmp_path / "out.txt"))
+    notes = cli.extract_monophonic_notes(corpus_midis[0], None, 1, 0)
+    assert note_count == len(notes)
+    assert output == (tmp_path / "out.txt").read_text() == cli.format_output(notes, 1000, "single")
+
+
+def test_cancelled_conversion_stops_at_the_next_checkpoint(app, gui, corpus_midis, tmp_path):
+    app.cancel_event.set()
+    settings = (None, 1, 0, gui.extract_monophonic_notes, 1000, "single_line", None)
+    app.do_conversion(corpus_midis[0], settings, str(tmp_path / "out.txt"))
+    assert drain(app) == [("cancelled",)]
+    assert not (tmp_path / "out.txt").exists()
+
+
+def test_failed_conversion_reports_the_error(app, gui, tmp_path):
+    settings = (None, 1, 0, gui.extract_monophonic_notes, 1000, "single_line", None)
+    app.do_conversion(str(tmp_path / "missing.mid"), settings)
+    assert drain(app)[-1][0] == "error"
+
+
+def test_poll_shows_only_the_newest_progress(app):
+    shown = []
+    scheduled = []
+    app.show_progress = lambda *progress: shown.append(progress)
+    app.root = type("Root", (), {"after": lambda self, ms, fn: scheduled.append(fn)})()
+    for done in range(5):
+        app.progress_queue.put(("progress", "Extracting notes", done, 10))
+    app.poll_progress()
+    assert shown == [("Extracting notes", 4, 10)]
+    assert scheduled == [app.poll_progress]
+
+
+def queue_jobs(corpus_midis, tmp_path, count=3):
+    return [(path, str(tmp_path / f"{index}.txt")) for index, path in enumerate(corpus_midis[:count])]
+
+
+def test_queue_converts_every_file_in_worker_processes(cli, app, gui, corpus_midis, tmp_path):
+    jobs = queue_jobs(corpus_midis, tmp_path)
+    app.run_queue(jobs, (None, 1, 0, gui.extract_monophonic_notes, 1000, "multi_line_linux", None))
+    messages = drain(app)
+    assert messages[-1] == ("queue_done", 3, 0, 3)
+    for index, (midi_path, out_path) in enumerate(jobs):
+        notes = cli.extract_monophonic_notes(midi_path, None, 1, 0)
+        with open(out_path) as f:
+            assert f.read() == cli.format_output(notes, 1000, "linux")
+        rows = [message[2] for message in messages if message[:2] == ("file", index)]
+        # The file's own progress comes before its result
+        assert rows[0] == "Reading MIDI file..."
+        assert rows[-1] == f"Done ({len(notes)} notes)"
+    assert [message[2] for message in messages if message[0] == "progress"] == [1, 2, 3]
+
+
+def test_cancelled_queue_converts_nothing(app, gui, corpus_midis, tmp_path):
+    jobs = queue_jobs(corpus_midis, tmp_path)
+    app.cancel_event.set()
+    app.run_queue(jobs, (None, 1, 0, gui.extract_monophonic_notes, 1000, "single_line", None))
+    messages = drain(app)
+    assert messages[-1] == ("queue_done", 0, 0, 3)
+    for index in range(3):
+        # A file that already started stops at its next progress report
+        assert [message[2] for message in messages if message[:2] == ("file", index)][-1] == "Cancelled"
+    assert not any(os.path.exists(out_path) for _, out_path in jobs)
+
+
+def test_failed_file_doesnt_stop_the_queue(app, gui, corpus_midis, tmp_path):
+    jobs = [(str(tmp_path / "missing.mid"), str(tmp_path / "0.txt"))] + queue_jobs(corpus_midis, tmp_path, 1)
+    app.run_queue(jobs, (None, 1, 0, gui.extract_monophonic_notes, 1000, "single_line", None))
+    messages = drain(app)
+    assert messages[-1] == ("queue_done", 1, 1, 2)
+    assert [message[2] for message in messages if message[:2] == ("file", 0)][-1].startswith("Failed: ")
+
+
+def test_piano_roll_is_built_from_the_conversion(app, gui, corpus_midis):
+    settings = (None, 1, 0, gui.extract_monophonic_notes, 1000, "single_line", None)
+    app.do_conversion(corpus_midis[0], settings)
+    roll_source = drain(app)[-1][6]
+    app.build_roll(roll_source)
+    kind, roll = drain(app)[-1]
+    assert kind == "roll"
+    assert roll.kept_count == sum(1 for n, f, d in roll_source[1] if f != 1 and d > 0)
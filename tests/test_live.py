@@ -0,0 +1,74 @@
+import io
+import os
+import threading
+import time
+
+import mido
+import pytest
+
+
+def test_parser_handles_running_status_and_real_time_bytes(cli):
+    parser = cli.RawMidiParser()
+    # note_on, then two more with running status, a clock byte inside the last one
+    messages = parser.feed(bytes([0x90, 60, 64, 62, 64, 64, 0xF8, 0]))
+    assert [(m.type, m.note, m.velocity) for m in messages] == [("note_on", 60, 64), ("note_on", 62, 64), ("note_on", 64, 0)]
+
+
+def test_parser_skips_sysex_and_joins_split_reads(cli):
+    parser = cli.RawMidiParser()
+    assert parser.feed(bytes([0xF0, 1, 2, 3, 0xF7, 0x81])) == []
+    assert parser.feed(bytes([60])) == []
+    [message] = parser.feed(bytes([0]))
+    assert (message.type, message.channel, message.note) == ("note_off", 1, 60)
+
+
+@pytest.mark.parametrize("reverse", [0, 1])
+def test_live_logic_matches_the_extractor(cli, corpus_midis, reverse):
+    # The file's messages fed as they would arrive, everything on one tick in one read
+    for path in corpus_midis[:4]:
+        live = cli.LiveMonophonic(None, 1, reverse)
+        now = 0.0
+        group = []
+        for msg in mido.MidiFile(path):
+            if msg.time and group:
+                live.feed(group, now)
+                group = []
+            now += msg.time
+            if not msg.is_meta:
+                group.append(msg)
+        live.feed(group, now)
+        live.close(now)
+        expected = cli.extract_monophonic_notes(path, None, 1, reverse)
+        assert [(n, f) for n, f, d in live.timeline] == [(n, f) for n, f, d in expected]
+        assert [d for n, f, d in live.timeline] == pytest.approx([d for n, f, d in expected], abs=1e-5)
+
+
+def test_channel_filter(cli):
+    live = cli.LiveMonophonic(target_channel=1)
+    assert live.feed([mido.Message("note_on", channel=0, note=60)], 0.0) == []
+    assert live.feed([mido.Message("note_on", channel=1, note=69)], 0.0) == [("tone", 440.0)]
+    assert live.close(0.5) == [("noTone", None)]
+    assert live.timeline == [(69, 440.0, 0.5)]
+
+
+def test_run_live_reads_a_fifo_until_it_closes(cli, tmp_path):
+    fifo = str(tmp_path / "midi")
+    os.mkfifo(fifo)
+
+    def play():
+        with open(fifo, "wb", buffering=0) as f:
+            for message in [b"\x90\x45\x40", b"\x80\x45\x00", b"\x90\x48\x40"]:
+                f.write(message)
+                time.sleep(0.05)
+
+    writer = threading.Thread(target=play)
+    writer.start()
+    out = io.StringIO()
+    timeline, latencies = cli.run_live(fifo, None, 1, out=out)
+    writer.join()
+    assert [line.split()[1:] for line in out.getvalue().splitlines()] == [
+        ["tone", "440"], ["noTone"], ["tone", "523"], ["noTone"]]
+    played = [(n, d) for n, f, d in timeline if f != 1]
+    assert [n for n, d in played] == [69, 72]
+    assert played[0][1] == pytest.approx(0.05, abs=0.04)
+    assert len(latencies) == 3
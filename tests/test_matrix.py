@@ -0,0 +1,27 @@
+import os
+
+
+def test_every_variant_matches_a_single_run(cli, run_cli, corpus_midis, tmp_path):
+    midi = corpus_midis[2]
+    run_cli("-file", midi, "-merge", "-export", "single", "arduino", "-priority", "normal", "reverse",
+            "-speed", "1", "1.5", "-output", f"{tmp_path}{os.sep}", "-quiet")
+    base = os.path.splitext(os.path.basename(midi))[0]
+    written = sorted(os.listdir(tmp_path))
+    assert len(written) == 8
+    for reverse in (0, 1):
+        notes = cli.extract_monophonic_notes(midi, None, 1, reverse)
+        for export_type in ("single", "arduino"):
+            for speed in (1, 1.5):
+                name = cli.matrix_filename(base, export_type, reverse, speed)
+                assert (tmp_path / name).read_text() == cli.format_output(notes, 1000 * speed, export_type)
+
+
+def test_variants_share_one_parse(cli, corpus_midis, monkeypatch):
+    opened = []
+    open_midi = cli.open_midi
+    monkeypatch.setattr(cli, "open_midi", lambda path: opened.append(path) or open_midi(path))
+    variants = cli.extract_variants(corpus_midis[2], [0, 1], None, 1)
+    # The extractors are handed the parsed file, only the first call reads the path
+    assert [source for source in opened if isinstance(source, str)] == [corpus_midis[2]]
+    for reverse in (0, 1):
+        assert variants[reverse] == [cli.extract_monophonic_notes(corpus_midis[2], None, 1, reverse)]
@@ -0,0 +1,54 @@
+import os
+import re
+
+import mido
+
+
+SAMPLE_RE = re.compile(r"(\w+)(?:\{(.*)\})? (\S+)")
+
+
+def read_metrics(path):
+    # {(name, labels): value}, and the file has to end with # EOF
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert lines[-1] == "# EOF"
+    samples = {}
+    for line in lines:
+        if not line.startswith("#"):
+            name, labels, value = SAMPLE_RE.fullmatch(line).groups()
+            samples[name, labels or ""] = float(value)
+    return samples
+
+
+def test_counters_match_the_conversion(cli, run_cli, corpus_midis, tmp_path):
+    files = corpus_midis[1:3]
+    out_dir = tmp_path / "out"
+    run_cli("-file", *files, "-merge", "-export", "single", "arduino", "-output", f"{out_dir}{os.sep}",
+            "-metrics", str(tmp_path / "batch.prom"), "-quiet")
+    samples = read_metrics(tmp_path / "batch.prom")
+
+    stats = {}
+    timelines = [cli.extract_monophonic_notes(path, None, 1, 0, stats) for path in files]
+    notes = [entry for timeline in timelines for entry in timeline]
+    assert samples["midi2beep_files_converted_total", ""] == 2
+    assert samples["midi2beep_files_failed_total", ""] == 0
+    assert samples["midi2beep_events_read_total", ""] == sum(len(track) for path in files
+                                                             for track in mido.MidiFile(path).tracks)
+    assert samples["midi2beep_zero_length_notes_total", ""] == sum(1 for n, f, d in notes if d == 0)
+    assert samples["midi2beep_rests_total", ""] == sum(1 for n, f, d in notes if d and f == 1)
+    assert samples["midi2beep_cut_notes_total", ""] == stats["cut_notes"]
+    for export_type, ext in (("single", ".txt"), ("arduino", ".ino")):
+        written = sum(os.path.getsize(out_dir / name) for name in os.listdir(out_dir) if name.endswith(ext))
+        assert samples["midi2beep_output_bytes_total", f'export="{export_type}"'] == written
+
+
+def test_histograms_are_cumulative(run_cli, corpus_midis, tmp_path):
+    run_cli("-file", *corpus_midis[:3], "-merge", "-output", f"{tmp_path / 'out'}{os.sep}",
+            "-metrics", str(tmp_path / "batch.prom"), "-quiet")
+    samples = read_metrics(tmp_path / "batch.prom")
+    for stage in ("parse", "extract", "format", "write"):
+        buckets = [value for (name, labels), value in samples.items()
+                   if name == "midi2beep_stage_seconds_bucket" and labels.startswith(f'stage="{stage}"')]
+        assert buckets == sorted(buckets)
+        assert buckets[-1] == samples["midi2beep_stage_seconds_count", f'stage="{stage}"'] == 3
+    assert samples["midi2beep_file_events_count", ""] == 3
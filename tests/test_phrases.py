@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+
+def random_sequences():
+    rng = random.Random(2024)
+    for _ in range(200):
+        alphabet = rng.choice([1, 2, 3, 8])
+        yield [rng.randrange(alphabet) for _ in range(rng.randrange(1, 120))]
+
+
+def common_prefix(seq, p, q):
+    length = 0
+    while p + length < len(seq) and q + length < len(seq) and seq[p + length] == seq[q + length]:
+        length += 1
+    return length
+
+
+def test_suffix_array_and_lcp_match_naive(cli):
+    for seq in random_sequences():
+        sa = cli.suffix_array(seq)
+        assert sa == sorted(range(len(seq)), key=lambda p: seq[p:])
+        lcp = cli.lcp_array(seq, sa)
+        assert lcp == [0] + [common_prefix(seq, sa[i - 1], sa[i]) for i in range(1, len(seq))]
+
+
+def test_repeated_substrings_report_their_occurrences(cli):
+    for seq in random_sequences():
+        for length, count, first, last, sa, lb, rb in cli.repeated_substrings(seq, 1):
+            positions = sa[lb:rb]
+            assert count == len(positions) >= 2
+            assert (first, last) == (min(positions), max(positions))
+            assert len({tuple(seq[p:p + length]) for p in positions}) == 1
+
+
+def test_phrases_rebuild_the_sequence(cli):
+    for seq in random_sequences():
+        phrases, play_order = cli.find_phrases(seq)
+        assert [nid for pid in play_order for nid in phrases[pid]] == seq
+        assert len(set(phrases)) == len(phrases)
+
+
+@pytest.mark.parametrize("repeats", [2, 3, 2000])
+def test_periodic_input_picks_the_motif(cli, repeats):
+    # Overlapping occurrences used to rank one huge phrase played twice above the motif
+    motif = list(range(16))
+    phrases, play_order = cli.find_phrases(motif * repeats)
+    assert phrases == [tuple(motif)]
+    assert play_order == [0] * repeats
+
+
+def test_phrase_sketch_plays_like_the_arrays_sketch(cli, run_sketch, corpus_midis):
+    notes = cli.extract_monophonic_notes(corpus_midis[1], None, 1, 0)
+    frequencies, durations = cli.arduino_note_arrays(notes, 1000)
+    until = sum(durations) + 1
+    played = run_sketch(cli.format_output(notes, 1000, "arduino-phrases"), until)
+    assert played == run_sketch(cli.format_output(notes, 1000, "arduino-arrays"), until)
+    assert len(played) == 2 * sum(1 for f in frequencies if f)
@@ -0,0 +1,53 @@
+import random
+
+import mido
+
+
+def test_merge_spans_joins_overlapping_and_touching_spans(gui):
+    assert gui.merge_spans([(0, 1), (0.5, 2), (2, 3), (4, 5), (4.5, 4.8)]) == [[0, 3], [4, 5]]
+    assert gui.merge_spans([]) == []
+
+
+def test_note_spans_pair_overlapping_notes_first_in_first_out(gui, write_midi):
+    path = write_midi([(0, "note_on", 60), (480, "note_on", 60), (480, "note_off", 60), (480, "note_off", 60),
+                       (0, "note_on", 62)])
+    assert gui.midi_note_spans(mido.MidiFile(path)) == [(0.0, 1.0, 60, 0), (0.5, 1.5, 60, 0), (1.5, 1.5, 62, 0)]
+
+
+def test_visible_spans_at_every_level(gui):
+    rng = random.Random(7)
+    spans = []
+    for _ in range(500):
+        start = rng.uniform(0, 100)
+        spans.append((start, start + rng.uniform(0.001, 0.5)))
+    layer = gui.RollLayer(spans, 100)
+    # Each level covers every note with fewer, wider spans
+    assert [len(level) for level in layer.levels] == sorted((len(level) for level in layer.levels), reverse=True)
+    for level, joined in enumerate(layer.levels):
+        for start, end in spans:
+            assert any(s <= start and end <= e for s, e in joined)
+        for t0, t1 in [(0, 100), (10, 10.5), (50, 60), (99.9, 150)]:
+            expected = [span for span in joined if span[1] >= t0 and span[0] < t1]
+            assert layer.visible(level, t0, t1) == expected
+    assert layer.visible(len(layer.levels) + 5, 0, 100) == layer.levels[-1]
+
+
+def test_roll_data_counts_kept_notes(gui, write_midi):
+    # C and E together, then G alone: the timeline keeps E (the later note_on wins) and G
+    path = write_midi([(0, "note_on", 60), (0, "note_on", 64), (480, "note_off", 60), (0, "note_off", 64),
+                       (0, "note_on", 67), (480, "note_off", 67)])
+    mid = mido.MidiFile(path)
+    timeline = gui.extract_monophonic_notes(mid, None, 1, 0)
+    data = gui.PianoRollData(gui.midi_note_spans(mid), timeline)
+    assert (data.note_count, data.kept_count, data.low, data.high) == (3, 2, 60, 67)
+    assert data.length == 1.0
+    assert [(note, [channel for channel, _ in layers], kept is not None) for note, layers, kept in data.rows] == [
+        (60, [0], False), (64, [0], True), (67, [0], True)]
+    assert data.summary() == "2 beep notes from 3 MIDI notes, channel 0 plays most (100% of note time)"
+
+
+def test_fill_pixels_clips_to_the_view(gui):
+    pixels = bytearray(10)
+    gui.PianoRoll.fill_pixels(pixels, [(-5, 0.25), (0.42, 0.43), (0.8, 5)], 3, 0.0, 0.1)
+    # Every span covers at least one pixel, partial pixels count
+    assert list(pixels) == [3, 3, 3, 0, 3, 0, 0, 0, 3, 3]
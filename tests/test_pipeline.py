@@ -0,0 +1,43 @@
+import mido
+import pytest
+
+
+@pytest.mark.parametrize("export_type", ["single", "linux", "windows", "arduino", "arduino-arrays"])
+@pytest.mark.parametrize("old_logic", [False, True])
+def test_pipeline_writes_the_normal_output(cli, corpus_midis, tmp_path, export_type, old_logic):
+    extract = cli.extract_monophonic_notes_old if old_logic else cli.extract_monophonic_notes
+    for path in corpus_midis[:3]:
+        notes = extract(path, None, 1, 1)
+        output = tmp_path / "out.txt"
+        summary = cli.convert_pipelined(path, str(output), export_type, 1500, None, 1, 1, old_logic)
+        assert output.read_text() == cli.format_output(notes, 1500, export_type)
+        assert summary["notes"] == len(notes)
+        assert summary["bytes"] == len(output.read_bytes())
+
+
+def test_tracks_decode_like_mido(cli, corpus_midis):
+    for path in corpus_midis[:5]:
+        with open(path, "rb") as f:
+            data = f.read()
+        ticks_per_beat, tracks = cli.read_midi_chunks(data)
+        mid = mido.MidiFile(path)
+        assert ticks_per_beat == mid.ticks_per_beat
+        for (lo, hi), track in zip(tracks, mid.tracks):
+            decoded = [msg for tick, msg in cli.iter_track_events(data, lo, hi)]
+            assert [msg.bytes() for msg in decoded if not msg.is_meta] == [msg.bytes() for msg in track if not msg.is_meta]
+
+
+def test_truncated_file_raises_and_stops(cli, corpus_midis, tmp_path):
+    with open(corpus_midis[0], "rb") as f:
+        data = f.read()
+    path = tmp_path / "cut.mid"
+    path.write_bytes(data[:len(data) // 2])
+    with pytest.raises(EOFError):
+        cli.convert_pipelined(str(path), str(tmp_path / "out.txt"))
+
+
+def test_cli_pipeline_matches_a_normal_run(run_cli, corpus_midis, tmp_path):
+    normal, piped = tmp_path / "normal.sh", tmp_path / "piped.sh"
+    run_cli("-file", corpus_midis[2], "-merge", "-export", "linux", "-output", str(normal))
+    run_cli("-file", corpus_midis[2], "-merge", "-export", "linux", "-output", str(piped), "-pipeline")
+    assert piped.read_text() == normal.read_text()
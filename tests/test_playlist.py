@@ -0,0 +1,41 @@
+import os
+import re
+
+
+def songs(cli, paths):
+    return [(os.path.splitext(os.path.basename(path))[0], cli.extract_monophonic_notes(path, None, 1, 0)) for path in paths]
+
+
+def test_playlist_plays_every_song_like_its_own_sketch(cli, run_sketch, corpus_midis):
+    playlist = songs(cli, corpus_midis[1:4])
+    expected = []
+    start = 0
+    for name, notes in playlist:
+        frequencies, durations = cli.arduino_note_arrays(notes, 1000)
+        length = sum(durations)
+        played = run_sketch(cli.format_output(notes, 1000, "arduino-arrays"), length)
+        expected += [(start + ms, kind, hz) for ms, kind, hz in played]
+        start += length + 2000
+    assert run_sketch(cli.format_arduino_playlist(playlist, 1000), start - 2000) == expected
+
+
+def test_report_compares_with_separate_sketches(cli, corpus_midis):
+    playlist = songs(cli, corpus_midis[1:4])
+    code = cli.format_arduino_playlist(playlist, 1000, "mega")
+    separate = sum(cli.arduino_footprints(notes, 1000, "mega")["arduino-arrays"]["flash"] for name, notes in playlist)
+    match = re.search(r"// Playlist: about (\d+) bytes flash on the Arduino Mega.*against (\d+) bytes for 3 separate", code)
+    assert int(match.group(2)) == separate
+    assert int(match.group(1)) < separate
+
+
+def test_repeated_song_is_stored_once(cli, corpus_midis):
+    name, notes = songs(cli, corpus_midis[1:2])[0]
+    data = [int(re.search(r"\((\d+) of song data\)", cli.format_arduino_playlist(playlist, 1000)).group(1))
+            for playlist in ([(name, notes)], [(name, notes), ("again", notes)])]
+    # The second copy only adds its play order
+    assert data[1] - data[0] < data[0] / 4
+
+
+def test_cli_writes_the_playlist(cli, run_cli, corpus_midis, tmp_path):
+    run_cli("-file", *corpus_midis[1:4], "-merge", "-playlist", str(tmp_path / "album.ino"), "-quiet")
+    assert (tmp_path / "album.ino").read_text() == cli.format_arduino_playlist(songs(cli, corpus_midis[1:4]), 1000)
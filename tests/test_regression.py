@@ -0,0 +1,41 @@
+import json
+import os
+
+
+def test_current_logic_matches_goldens(cli, corpus):
+    assert cli.run_regression(corpus, quiet=True) == []
+
+
+def test_old_logic_matches_v1_outputs(cli, corpus):
+    assert cli.run_regression(corpus, old_logic=True, quiet=True) == []
+
+
+def test_goldens_cover_every_stored_output(cli, corpus):
+    goldens = cli.load_goldens(corpus)
+    assert goldens["engine"] == "new"
+    expected = {f"{subdir}/{name}" for subdir, _ in cli.REGRESSION_VARIANTS
+                for name in os.listdir(os.path.join(corpus, subdir)) if name.endswith(".txt")}
+    assert set(goldens["outputs"]) == expected
+
+
+def test_changed_output_is_reported(cli, corpus, tmp_path):
+    goldens = cli.load_goldens(corpus)
+    key = sorted(goldens["outputs"])[0]
+    goldens["outputs"][key] = dict(goldens["outputs"][key], sha256="0" * 64)
+    name = os.path.splitext(os.path.basename(key))[0]
+    results = cli.regress_file(corpus, name + ".mid", False, goldens["outputs"])
+    divergences = {k: divergence for k, divergence, _ in results}
+    assert divergences[key][0] == "hash"
+    assert all(divergence is False for k, divergence in divergences.items() if k != key)
+
+
+def test_update_writes_a_manifest(cli, corpus_midis, tmp_path):
+    # A corpus of one song, with only the MIDI file
+    os.mkdir(tmp_path / "Original-MIDIs")
+    with open(corpus_midis[0], "rb") as f:
+        (tmp_path / "Original-MIDIs" / os.path.basename(corpus_midis[0])).write_bytes(f.read())
+    assert cli.run_regression(str(tmp_path), quiet=True, update=True, workers=1) == []
+    with open(tmp_path / cli.GOLDENS_FILE) as f:
+        written = json.load(f)
+    assert len(written["outputs"]) == len(cli.REGRESSION_VARIANTS)
+    assert cli.run_regression(str(tmp_path), quiet=True, workers=1) == []
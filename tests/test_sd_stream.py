@@ -0,0 +1,79 @@
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import ROOT
+
+
+def decode_stream(cli, data):
+    magic, version, count = cli.STREAM_HEADER.unpack_from(data, 0)
+    assert (magic, version) == (cli.STREAM_MAGIC, cli.STREAM_VERSION)
+    body = data[cli.STREAM_HEADER.size:]
+    assert len(body) == count * cli.STREAM_RECORD.size
+    return list(cli.STREAM_RECORD.iter_unpack(body))
+
+
+def test_stream_is_a_header_and_a_record_per_entry(cli, corpus_midis):
+    notes = cli.extract_monophonic_notes(corpus_midis[0], None, 1, 0)
+    records = decode_stream(cli, cli.encode_stream(notes, 1500))
+    expected = [(cli.STREAM_REST if f == 1 else n, int(d * 1500)) for n, f, d in notes if int(d * 1500)]
+    assert records == expected
+
+
+def test_long_notes_are_split(cli):
+    notes = [(60, 261.63, 150.0), (0, 1, 0.0004), (0, 1, 0.5)]
+    assert decode_stream(cli, cli.encode_stream(notes, 1000)) == [
+        (60, 0xFFFF), (60, 0xFFFF), (60, 150000 - 2 * 0xFFFF), (cli.STREAM_REST, 500)]
+
+
+def test_sketch_counts_the_records(cli, corpus_midis):
+    for path in corpus_midis[:5]:
+        notes = cli.extract_monophonic_notes(path, None, 1, 0)
+        count = re.search(r"SONG\.BIN \((\d+) notes/rests\)", cli.format_arduino_sd(notes, 1000)).group(1)
+        assert int(count) == len(decode_stream(cli, cli.encode_stream(notes, 1000)))
+
+
+def test_pipeline_writes_the_same_stream(cli, run_cli, corpus_midis, tmp_path):
+    run_cli("-file", corpus_midis[1], "-merge", "-export", "arduino-sd", "-output", str(tmp_path / "normal.ino"))
+    run_cli("-file", corpus_midis[1], "-merge", "-export", "arduino-sd", "-output", str(tmp_path / "piped.ino"), "-pipeline")
+    assert (tmp_path / "piped.bin").read_bytes() == (tmp_path / "normal.bin").read_bytes()
+    assert (tmp_path / "piped.ino").read_text() == (tmp_path / "normal.ino").read_text()
+
+
+def test_live_writes_the_stream_of_what_was_played(cli, tmp_path):
+    output, timeline = tmp_path / "live.ino", tmp_path / "live.m2bt"
+    player = subprocess.Popen([sys.executable, f"{ROOT}/mid2beep-cli.py", "-live", "-", "-merge", "-export", "arduino-sd",
+                               "-output", str(output), "-savetimeline", str(timeline), "-quiet"],
+                              stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    for message in [b"\x90\x3c\x40", b"\x80\x3c\x40", b"\x90\x40\x40", b"\x80\x40\x40"]:
+        player.stdin.write(message)
+        player.stdin.flush()
+        time.sleep(0.05)
+    player.stdin.close()
+    assert player.wait() == 0
+    notes = cli.load_timeline(str(timeline))
+    assert [n for n, f, d in notes if f != 1] == [60, 64]
+    assert (tmp_path / "live.bin").read_bytes() == cli.encode_stream(notes, 1000)
+
+
+def test_host_build_plays_the_stream(cli, corpus_midis, tmp_path):
+    # The sketch builds on the PC too, reading the .bin with stdio
+    if shutil.which("g++") is None:
+        pytest.skip("needs g++ to build the sketch")
+    notes = cli.extract_monophonic_notes(corpus_midis[1], None, 1, 0)
+    (tmp_path / "song.ino").write_text(cli.format_arduino_sd(notes, 1000))
+    cli.write_stream(notes, 1000, str(tmp_path / "song.bin"))
+    subprocess.run(["g++", "-x", "c++", str(tmp_path / "song.ino"), "-o", str(tmp_path / "song-sim")], check=True)
+    played = subprocess.run([str(tmp_path / "song-sim"), str(tmp_path / "song.bin")],
+                            check=True, capture_output=True, text=True).stdout.splitlines()
+    records = decode_stream(cli, cli.encode_stream(notes, 1000))
+    assert len(played) == len(records) + 1  # and a noTone at the end
+    start = 0
+    for line, (note, duration) in zip(played, records):
+        expected = f"{start} noTone" if note == cli.STREAM_REST else f"{start} tone {int(round(cli.note_to_freq(note), 2))}"
+        assert line == expected
+        start += duration
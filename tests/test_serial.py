@@ -0,0 +1,55 @@
+import shutil
+import subprocess
+
+import pytest
+
+
+def test_crc8_is_the_standard_one(cli):
+    # CRC-8 with polynomial 0x07, the check value of "123456789"
+    assert cli.crc8(b"123456789") == 0xF4
+
+
+def test_frame_layout(cli):
+    records = cli.STREAM_RECORD.pack(60, 500) + cli.STREAM_RECORD.pack(cli.STREAM_REST, 250)
+    frame = cli.serial_frame(cli.SERIAL_DATA, 258, records)
+    assert frame[:4] == bytes([cli.SERIAL_SYNC_HOST, cli.SERIAL_DATA, 2, 2])
+    assert frame[4:-1] == records
+    assert frame[-1] == cli.crc8(frame[1:-1])
+
+
+def test_replies_skip_noise_and_bad_frames(cli):
+    def reply(kind, seq, value, crc=None):
+        body = bytes([kind, seq, value])
+        return bytes([cli.SERIAL_SYNC_DEVICE]) + body + bytes([cli.crc8(body) if crc is None else crc])
+
+    link = object.__new__(cli.SerialLink)
+    link.pending = bytearray()
+    data = [b"\x00\x13" + reply(cli.SERIAL_ACK, 1, 100) + reply(cli.SERIAL_NAK, 2, 90, crc=0) + reply(cli.SERIAL_READY, 0, 128)[:3],
+            reply(cli.SERIAL_READY, 0, 128)[3:]]
+    link.read = lambda timeout: data.pop(0)
+    assert link.replies(0) == [(cli.SERIAL_ACK, 1, 100)]
+    assert link.replies(0) == [(cli.SERIAL_READY, 0, 128)]
+
+
+def test_song_streams_to_the_host_build_of_the_firmware(cli, tmp_path):
+    if shutil.which("g++") is None:
+        pytest.skip("needs g++ to build the firmware")
+    (tmp_path / "player.ino").write_text(cli.format_serial_firmware())
+    subprocess.run(["g++", "-x", "c++", str(tmp_path / "player.ino"), "-o", str(tmp_path / "player-sim")], check=True)
+    # More records than the firmware's buffer holds, so the flow control has to hold the host back
+    notes = [(60 + i % 12, round(cli.note_to_freq(60 + i % 12), 2), 0.005) if i % 5 != 4 else (0, 1, 0.005) for i in range(300)]
+    player = subprocess.Popen([str(tmp_path / "player-sim")], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        port = player.stderr.readline().strip()
+        stats = cli.stream_serial(notes, 1000, port)
+        output, errors = player.communicate(timeout=10)
+    finally:
+        player.kill()
+    assert stats["resends"] == 0 and stats["underruns"] == 0
+    assert errors.strip() == "underruns: 0"
+    played = [line.split()[1:] for line in output.splitlines()]
+    # Every HELLO stops whatever was playing before the song starts
+    while played[0] == ["noTone"]:
+        played.pop(0)
+    expected = [["noTone"] if f == 1 else ["tone", str(int(f))] for n, f, d in notes]
+    assert played == expected + [["noTone"]]
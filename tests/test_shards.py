@@ -0,0 +1,80 @@
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def shards(run_cli, corpus_midis, tmp_path_factory):
+    # Four songs converted in two shards, returns the manifest paths
+    folder = tmp_path_factory.mktemp("shards")
+    files = corpus_midis[:4]
+    manifests = []
+    for index in (1, 2):
+        out_dir = folder / f"host{index}"
+        run_cli("-file", *files, "-merge", "-export", "single", "-output", f"{out_dir}{os.sep}", "-shard", f"{index}/2", "-quiet")
+        manifests.append(str(out_dir / f"shard-{index}-of-2.json"))
+    return manifests
+
+
+def test_shard_of_is_stable_and_in_range(cli):
+    digest = cli.content_sha256(b"song")
+    assert cli.shard_of(digest, 4) == cli.shard_of(digest, 4)
+    assert {cli.shard_of(cli.content_sha256(bytes([i])), 4) for i in range(64)} == {1, 2, 3, 4}
+
+
+def test_parse_shard(cli):
+    assert cli.parse_shard(" 2 / 4 ") == (2, 4)
+    for text in ("0/4", "5/4", "2", "a/b"):
+        with pytest.raises(Exception, match="invalid shard"):
+            cli.parse_shard(text)
+
+
+def test_every_input_lands_in_one_shard(cli, shards):
+    merged, problems = cli.merge_manifests(shards)
+    assert problems == []
+    assert merged["complete"]
+    assert merged["shard_count"] == 2
+    assert merged["input_count"] == 4
+    assert len(merged["inputs"]) == 4
+    for record in merged["inputs"]:
+        assert cli.shard_of(record["sha256"], 2) == record["shard"]
+        assert len(record["outputs"]) == 1
+
+
+def test_missing_shard_is_reported(cli, shards):
+    merged, problems = cli.merge_manifests(shards[:1])
+    assert "shard 2/2 is missing" in problems
+    assert not merged["complete"]
+
+
+def test_duplicate_shard_is_reported(cli, shards):
+    merged, problems = cli.merge_manifests([shards[0], shards[0], shards[1]])
+    assert any("appears twice" in problem for problem in problems)
+
+
+def test_changed_output_is_reported(cli, shards, tmp_path):
+    # A copy of the first host with one output edited after the run
+    with open(shards[0]) as f:
+        manifest = json.load(f)
+    host = os.path.dirname(shards[0])
+    copy = tmp_path / "host1"
+    copy.mkdir()
+    for name in os.listdir(host):
+        with open(os.path.join(host, name), "rb") as f:
+            (copy / name).write_bytes(f.read())
+    name = next(iter(manifest["inputs"][0]["outputs"]))
+    (copy / name).write_text("beep -n -f 440 -l 100")
+    merged, problems = cli.merge_manifests([str(copy / os.path.basename(shards[0])), shards[1]])
+    assert problems == [f"{copy / name}: changed since shard 1/2 wrote it"]
+
+
+def test_other_parameters_are_reported(cli, shards, tmp_path):
+    with open(shards[1]) as f:
+        manifest = json.load(f)
+    manifest["parameters"] = dict(manifest["parameters"], speed=[2.0])
+    manifest["output_dir"] = os.path.relpath(os.path.dirname(shards[1]), tmp_path)
+    path = tmp_path / "shard-2-of-2.json"
+    path.write_text(json.dumps(manifest))
+    merged, problems = cli.merge_manifests([shards[0], str(path)])
+    assert problems == [f"{path}: different parameters than {shards[0]}"]
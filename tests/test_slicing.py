@@ -0,0 +1,59 @@
+import pytest
+
+
+def song(write_midi):
+    # 120 BPM, 480 ticks per beat: C for a beat, an quarter beat rest, D, then E
+    return write_midi([(0, "note_on", 60), (480, "note_off", 60), (120, "note_on", 62),
+                       (600, "note_off", 62), (0, "note_on", 64), (480, "note_off", 64)])
+
+
+def extract(cli, path, start, end, old_logic=False):
+    fn = cli.extract_monophonic_notes_old if old_logic else cli.extract_monophonic_notes
+    return fn(path, None, 1, 0, None, start and cli.parse_position(start), end and cli.parse_position(end))
+
+
+@pytest.mark.parametrize("old_logic", [False, True])
+def test_slice_starts_and_ends_at_its_positions(cli, write_midi, old_logic):
+    path = song(write_midi)
+    # C is released on the start tick itself, so it is still there with no length
+    assert extract(cli, path, "1b", "3b", old_logic) == [(60, 261.63, 0.0), (0, 1, 0.125), (62, 293.66, 0.625), (64, 329.63, 0.25)]
+    assert extract(cli, path, "1.1b", "3b", old_logic) == [(0, 1, 0.075), (62, 293.66, 0.625), (64, 329.63, 0.25)]
+
+
+@pytest.mark.parametrize("old_logic", [False, True])
+def test_note_playing_at_the_start_is_kept(cli, write_midi, old_logic):
+    assert extract(cli, song(write_midi), "0.5b", "1b", old_logic) == [(60, 261.63, 0.25)]
+
+
+def test_positions_in_seconds_beats_and_bars_agree(cli, write_midi):
+    path = song(write_midi)
+    assert extract(cli, path, "0.5", "1.5") == extract(cli, path, "1b", "3b") == extract(cli, path, ".25bar", ".75bar")
+
+
+def test_open_ended_slices(cli, write_midi, corpus_midis):
+    assert extract(cli, song(write_midi), "3b", None) == [(64, 329.63, 0.25)]
+    assert extract(cli, song(write_midi), None, "1b") == [(60, 261.63, 0.5)]
+    full = cli.extract_monophonic_notes(corpus_midis[0], None, 1, 0)
+    assert extract(cli, corpus_midis[0], "0", None) == full
+
+
+def test_end_before_start_is_refused(cli, write_midi):
+    with pytest.raises(ValueError, match="-end is before -start"):
+        extract(cli, song(write_midi), "3b", "1b")
+
+
+def test_merging_stops_after_the_end(cli, corpus_midis):
+    # Count what the slice pulls out of the tracks
+    pulled = []
+
+    class CountingTrack(list):
+        def __iter__(self):
+            for msg in list.__iter__(self):
+                pulled.append(msg)
+                yield msg
+
+    mid = cli.open_midi(corpus_midis[0])
+    total = sum(len(track) for track in mid.tracks)
+    mid.tracks = [CountingTrack(track) for track in mid.tracks]
+    assert cli.extract_monophonic_notes(mid, None, 1, 0, None, None, cli.parse_position("2"))
+    assert len(pulled) < total / 10
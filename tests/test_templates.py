@@ -0,0 +1,56 @@
+import pytest
+
+
+TEMPLATE = """[info]
+description = Test
+extension = .txt
+separator = ;
+
+[header]
+${name}: ${count}
+
+[note]
+${index}=${note}/${hz}/${ms}/${length:.1f}
+
+[rest]
+${index}=-/${ms}
+
+[footer]
+$$end
+"""
+
+NOTES = [(69, 440.0, 0.5), (0, 1, 0.25), (72, 523.25, 0.0), (72, 523.25, 0.125)]
+
+
+def test_fields_and_format_specs(cli):
+    template = cli.ExportTemplate("test", cli.parse_template(TEMPLATE))
+    assert template.render(NOTES, 1500) == "test: 3\n0=69/440/750/750.0;1=-/375;2=72/523/187/187.5\n$end"
+    assert template.fields == {"index", "note", "hz", "ms", "length"}
+
+
+def test_rests_are_left_out_without_a_rest_section(cli):
+    sections = cli.parse_template(TEMPLATE)
+    del sections["rest"]
+    template = cli.ExportTemplate("test", sections)
+    assert template.render(NOTES, 1000) == "test: 2\n0=69/440/500/500.0;1=72/523/125/125.0\n$end"
+
+
+def test_unknown_field_is_rejected(cli):
+    with pytest.raises(ValueError, match="unknown field"):
+        cli.ExportTemplate("test", {"rest": "${hz}"})
+
+
+def test_format_spec_is_not_evaluated(cli):
+    # A spec is handed to format() as text, it can't reach attributes or run code
+    template = cli.ExportTemplate("test", {"note": "${hz:{0.__class__}}"})
+    with pytest.raises(ValueError):
+        template.render(NOTES, 1000)
+
+
+def test_shipped_templates_load(cli, corpus_midis):
+    templates = cli.load_templates(quiet=True)
+    assert {"csv", "esp32", "micropython"} <= set(templates)
+    notes = cli.extract_monophonic_notes(corpus_midis[0], None, 1, 0)
+    csv = cli.format_output(notes, 1000, "csv").splitlines()
+    assert csv[0] == "index,note,frequency,length"
+    assert len(csv) - 1 == sum(1 for n, f, d in notes if d)
@@ -0,0 +1,46 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def song(cli, corpus_midis):
+    return cli.extract_monophonic_notes(corpus_midis[0], None, 1, 0)
+
+
+def test_timeline_round_trip(cli, song, tmp_path):
+    path = str(tmp_path / "song.m2bt")
+    cli.save_timeline(song, path)
+    assert cli.is_timeline_file(path)
+    assert cli.load_timeline(path) == song
+
+
+def test_timeline_keeps_rests_and_empty_timelines(cli, tmp_path):
+    path = str(tmp_path / "rests.m2bt")
+    notes = [(0, 1, 0.25), (69, 440.0, 0.5), (0, 1, 1.0)]
+    cli.save_timeline(notes, path)
+    assert cli.load_timeline(path) == notes
+    cli.save_timeline([], path)
+    assert cli.load_timeline(path) == []
+
+
+def test_truncated_timeline_is_refused(cli, song, tmp_path):
+    path = tmp_path / "song.m2bt"
+    cli.save_timeline(song, str(path))
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError, match="truncated"):
+        cli.load_timeline(str(path))
+
+
+def test_other_file_is_not_a_timeline(cli, tmp_path):
+    path = tmp_path / "song.m2bt"
+    path.write_bytes(b"MThd" + bytes(20))
+    assert not cli.is_timeline_file(str(path))
+    with pytest.raises(ValueError, match="not a timeline"):
+        cli.load_timeline(str(path))
+
+
+def test_cli_exports_a_saved_timeline_like_the_midi(run_cli, corpus_midis, tmp_path):
+    timeline = str(tmp_path / "song.m2bt")
+    run_cli("-file", corpus_midis[0], "-merge", "-savetimeline", timeline, "-export", "arduino",
+            "-output", str(tmp_path / "midi.ino"), "-quiet")
+    run_cli("-file", timeline, "-export", "arduino", "-output", str(tmp_path / "timeline.ino"), "-quiet")
+    assert (tmp_path / "timeline.ino").read_text() == (tmp_path / "midi.ino").read_text()
@@ -0,0 +1,52 @@
+import mido
+
+
+def chord(write_midi):
+    # C, E and G together, G stops after a beat, C and E after two
+    return write_midi([(0, "note_on", 60), (0, "note_on", 64), (0, "note_on", 67),
+                       (480, "note_off", 67), (480, "note_off", 64), (0, "note_off", 60)])
+
+
+def test_enough_voices_keep_every_note(cli, write_midi):
+    assert cli.extract_polyphonic_notes(chord(write_midi), 3, merge=1) == [
+        [(60, 261.63, 1.0)], [(64, 329.63, 1.0)], [(67, 392.0, 0.5)]]
+
+
+def test_higher_note_steals_a_voice_and_gives_it_back(cli, write_midi):
+    stats = {}
+    voices = cli.extract_polyphonic_notes(chord(write_midi), 2, merge=1, prefer="high", stats=stats)
+    # G takes C's voice, C gets it back while still held once G ends
+    assert voices == [[(60, 261.63, 0.0), (67, 392.0, 0.5), (60, 261.63, 0.5)], [(64, 329.63, 1.0)]]
+    assert stats == {"cut_notes": 1}
+
+
+def test_prefer_low_keeps_the_lowest_notes(cli, write_midi):
+    stats = {}
+    voices = cli.extract_polyphonic_notes(chord(write_midi), 2, merge=1, prefer="low", stats=stats)
+    assert voices == [[(60, 261.63, 1.0)], [(64, 329.63, 1.0)]]
+    assert stats == {}
+
+
+def test_freed_voice_is_reused_after_a_rest(cli, write_midi):
+    path = write_midi([(0, "note_on", 60), (480, "note_off", 60), (480, "note_on", 62), (480, "note_off", 62)])
+    assert cli.extract_polyphonic_notes(path, 2, merge=1) == [
+        [(60, 261.63, 0.5), (0, 1, 0.5), (62, 293.66, 0.5)], []]
+
+
+def test_voices_of_a_song_are_monophonic(cli, corpus_midis):
+    length = mido.MidiFile(corpus_midis[0]).length
+    voices = cli.extract_polyphonic_notes(corpus_midis[0], 3, merge=1)
+    assert voices[0]
+    for timeline in voices:
+        # Every voice plays one entry after the other, so it can't outlast the song
+        assert sum(d for n, f, d in timeline) <= length + 1e-3
+
+
+def test_dense_chord_keeps_the_highest_notes(cli, write_midi):
+    # 100 notes piling up 10 ticks apart, all held to the end
+    events = [(0 if i == 0 else 10, "note_on", 20 + i) for i in range(100)]
+    events += [(480 if i == 0 else 0, "note_off", 20 + i) for i in range(100)]
+    stats = {}
+    voices = cli.extract_polyphonic_notes(write_midi(events), 4, merge=1, stats=stats)
+    assert sorted(timeline[-1][0] for timeline in voices) == [116, 117, 118, 119]
+    assert stats["cut_notes"] == 96